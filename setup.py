@@ -22,6 +22,11 @@ setup(
         'google-generativeai>=0.7.2',
         'python-dotenv>=1.0.1'
     ],
+    extras_require={
+        'images': ['Pillow>=10.0.0'],
+        'semantic': ['numpy>=1.22'],
+        'test': ['pytest>=7.0', 'pytest-benchmark>=4.0'],
+    },
     entry_points={
         'console_scripts': [
             'lcli=llm_cli.cli:cli',
@@ -0,0 +1,5 @@
+from llm_cli.cli import cli
+
+
+if __name__ == "__main__":
+    cli(prog_name="lcli")
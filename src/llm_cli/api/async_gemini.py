@@ -0,0 +1,299 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, TypeVar
+
+from google.generativeai.types import File, GenerateContentResponse
+
+from llm_cli.api.gemini import Gemini, _close_stream, _Request, _usage_args
+from llm_cli.utils import tracing
+from llm_cli.utils.helpers import preprocess_input
+from llm_cli.utils.processor import aiter_gemini_response
+
+T = TypeVar("T")
+
+
+@dataclass
+class AsyncGemini:
+    """
+        An asyncio counterpart of `Gemini`.
+
+        Requests are sent with the SDK's `generate_content_async` and
+        `send_message_async` through a wrapped `Gemini`, whose steps before and after a
+        request they share: the response and semantic caches, input budget, retries and
+        hedging, key pool, rate limits, routing and usage tracking. Pass a configured
+        `Gemini` as `sync`, or one is built from the fields below. Every call waits on
+        one semaphore, so any number of requests can be started on an event loop while
+        at most `max_concurrency` are in flight.
+
+        File operations, and the steps before a request that call the API (finding a
+        context cache, embedding a prompt for the semantic cache, counting tokens for
+        the input budget), run in worker threads; `aclose`, or leaving `async with`,
+        shuts them down.
+    """
+    chat_history: list = field(default_factory=list)
+    system_instruction: str = field(default="")
+    generation_config: dict = field(default_factory=dict)
+    max_concurrency: int = field(default=64)
+    model_name: Optional[str] = field(default=None)
+    sync: Optional[Gemini] = field(default=None)
+
+    def __post_init__(self):
+        if self.sync is None:
+            self.sync = Gemini(
+                chat_history=self.chat_history, system_instruction=self.system_instruction,
+                generation_config=self.generation_config, model_name=self.model_name)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._chat_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncGemini":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Shut down the worker threads, waiting for the calls running in them."""
+
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    @property
+    def model(self):
+        """The model of the wrapped client, which switches to a context cache on its first request."""
+        return self.sync.model
+
+    def _limit(self) -> asyncio.Semaphore:
+        """Get the concurrency semaphore, created on first use inside the running loop."""
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _chat_turn(self) -> asyncio.Lock:
+        """Chat messages build on each other, so only one may be in flight at a time."""
+
+        if self._chat_lock is None:
+            self._chat_lock = asyncio.Lock()
+        return self._chat_lock
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            # one worker per request in flight; the default executor has far fewer
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="lcli-async")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _in_thread(self, function: Callable, *args: Any, **kwargs: Any) -> Any:
+        async with self._limit():
+            return await self._run(lambda: function(*args, **kwargs))
+
+    async def _before(self, prepare: Callable[[], T]) -> T:
+        """Run the steps before a request, in a worker thread only when they call the API."""
+
+        sync = self.sync
+        if sync._resolved and sync.semantic_cache is None and sync.max_input_tokens is None:
+            return prepare()
+        return await self._run(prepare)
+
+    async def _generate(self, contents: Any, stream: bool, semantic: bool = True) -> tuple[GenerateContentResponse, Optional[_Request]]:
+        """Send a request down the cascade of models, as `Gemini._generate_content` does."""
+
+        sync = self.sync
+        request, cached = await self._before(lambda: sync._before_generate(contents, stream, semantic))
+        if cached is not None:
+            return cached, None
+
+        for model in sync.cascade:
+            with tracing.span("generate", request_id=request.request_id, model=model.model_name, stream=stream) as span:
+                started = time.monotonic()
+                try:
+                    response, request.key = await sync.resilience.call_async(
+                        sync._scheduled_async(
+                            lambda bound, timeout: bound.generate_content_async(
+                                request.contents, stream=stream, request_options=sync.resilience.request_options(timeout)),
+                            request.estimated, pinned=request.pinned, model=model),
+                        cancel=(lambda result: asyncio.ensure_future(_close_stream(result[0]))) if stream else None)
+                except Exception:
+                    sync._log_request(model, started, "error", stream)
+                    raise
+
+                if not sync._after_attempt(request, model, started, response, span, last=model is sync.cascade[-1]):
+                    break
+
+        return response, request
+
+    async def _send(self, message: str, stream: bool) -> tuple[GenerateContentResponse, Optional[_Request]]:
+        """Send a chat message, as `Gemini.send_chat_message` does."""
+
+        sync = self.sync
+        request, cached = await self._before(lambda: sync._before_chat(message, stream))
+        if cached is not None:
+            return cached, None
+
+        async def send(model, timeout: Optional[float]) -> GenerateContentResponse:
+            # turns are sequential, so the session can switch keys between them
+            sync.chat.model = model
+            return await sync.chat.send_message_async(
+                request.contents[0], stream=stream, request_options=sync.resilience.request_options(timeout))
+
+        with tracing.span("chat", request_id=request.request_id, model=sync.model.model_name, stream=stream) as span:
+            started = time.monotonic()
+            try:
+                # one chat session can only have one message in flight, so replies are never hedged
+                response, request.key = await sync.resilience.call_async(
+                    sync._scheduled_async(send, request.estimated, pinned=request.pinned), hedge=False)
+            except Exception:
+                sync._log_request(sync.model, started, "error", stream)
+                raise
+
+            sync._after_attempt(request, sync.model, started, response, span)
+
+        return response, request
+
+    async def _stream(self, start: Callable[[], Awaitable[tuple[GenerateContentResponse, Optional[_Request]]]]) -> AsyncIterator[str]:
+        # the semaphore is held until the stream is exhausted or closed
+        async with self._limit():
+            response, request = await start()
+            done = False
+
+            try:
+                with tracing.span("stream", request_id=request.request_id if request else None) as span:
+                    async for chunk in aiter_gemini_response(response):
+                        yield chunk
+
+                    if request is not None:
+                        self.sync._complete(request, response)
+                    if tracing.enabled():
+                        span.set(**_usage_args(response))
+                done = True
+            finally:
+                if not done:
+                    # abandoned early: stop the request instead of leaving it to run
+                    await _close_stream(response)
+
+    async def generate_content_from_text_prompt(self, prompt: str, semantic: bool = True) -> GenerateContentResponse:
+        """Generate content from a text prompt."""
+
+        async with self._limit():
+            return (await self._generate(preprocess_input(prompt), False, semantic))[0]
+
+    async def generate_content_from_text_image_prompt(self, prompt: str, image_args: list[dict]) -> GenerateContentResponse:
+        """Generate content from a text prompt and supplied images."""
+
+        async with self._limit():
+            return (await self._generate([preprocess_input(prompt), *image_args], False))[0]
+
+    async def generate_content_from_text_and_file_prompt(self, prompt: str, file_args: Iterable[Any]) -> GenerateContentResponse:
+        """Generate content from a text prompt and uploaded files."""
+
+        async with self._limit():
+            return (await self._generate(self._file_contents(prompt, file_args), False))[0]
+
+    def stream_content_from_text_prompt(self, prompt: str) -> AsyncIterator[str]:
+        """Stream the text of a response to a text prompt, chunk by chunk."""
+
+        return self._stream(lambda: self._generate(preprocess_input(prompt), True))
+
+    def stream_content_from_text_and_parts_prompt(self, prompt: str, parts: Iterable[Any]) -> AsyncIterator[str]:
+        """Stream the text of a response to a text prompt with images or uploaded files, chunk by chunk."""
+
+        contents = self._file_contents(prompt, parts)
+        return self._stream(lambda: self._generate(contents, True))
+
+    @staticmethod
+    def _file_contents(prompt: str, parts: Iterable[Any]) -> list:
+        prompt = preprocess_input(prompt)
+        return [prompt, *parts] if prompt else list(parts)
+
+    def set_chat_history(self, history: list):
+        """Replace the history sent with the next chat message."""
+
+        self.chat_history = history
+        self.sync.set_chat_history(history)
+
+    def initialize_new_chat(self):
+        """Initialize a new chat session."""
+
+        self.set_chat_history([])
+
+    async def send_chat_message(self, message: str) -> GenerateContentResponse:
+        """Send a message to the chat session."""
+
+        async with self._chat_turn(), self._limit():
+            return (await self._send(message, False))[0]
+
+    async def stream_chat_message(self, message: str) -> AsyncIterator[str]:
+        """Send a message to the chat session and stream the reply, chunk by chunk."""
+
+        async with self._chat_turn():
+            async for chunk in self._stream(lambda: self._send(message, True)):
+                yield chunk
+
+    async def upload_file(self, file: str, **kwargs) -> File:
+        """Upload a file to the API, reusing a live remote copy of identical content."""
+
+        # open the shared indexes on the loop thread, before worker threads use them
+        self.sync._uploads()
+        self.sync._files()
+
+        return await self._in_thread(self.sync.upload_file, file, **kwargs)
+
+    async def upload_files(self, files: Iterable[str], **kwargs) -> list[File]:
+        """Upload files concurrently, returning them in input order."""
+
+        return list(await asyncio.gather(*(self.upload_file(file, **kwargs) for file in files)))
+
+    async def wait_for_active(self, files: Iterable[File], timeout: float = 600, initial_delay: float = 1, max_delay: float = 15) -> list[File]:
+        """Wait until uploaded files have been processed by the server and can be used in prompts."""
+
+        files = list(files)
+        latest = {file.name: file for file in files}
+        pending = {file.name for file in files if file.state.name == "PROCESSING"}
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = initial_delay
+
+        while pending:
+            if loop.time() + delay > deadline:
+                raise TimeoutError(
+                    f"Timed out waiting for {len(pending)} file(s) to finish processing.")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+            polled = await asyncio.gather(
+                *(self._in_thread(self.sync.get_file, name) for name in pending))
+
+            for file in polled:
+                latest[file.name] = file
+
+                if file.state.name == "FAILED":
+                    raise ValueError(
+                        f"File {file.display_name} could not be processed: {file.error.message}")
+
+                if file.state.name != "PROCESSING":
+                    pending.discard(file.name)
+
+        return [latest[file.name] for file in files]
+
+    async def list_files(self) -> AsyncIterator[File]:
+        """Get a list of uploaded files."""
+
+        for file in await self._in_thread(lambda: list(self.sync.list_files())):
+            yield file
+
+    async def get_file(self, file_display_name: str) -> File:
+        """Get a file by its display name."""
+
+        return await self._in_thread(self.sync.get_file, file_display_name)
+
+    async def delete_file(self, file_name: str):
+        """Manually delete an uploaded file."""
+
+        await self._in_thread(self.sync.delete_file, file_name)
@@ -1,11 +1,247 @@
+import asyncio
+import copy
+import mimetypes
 import os
-from typing import Any, Iterable
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Optional, Union
+import httplib2
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.generativeai.client import get_default_file_client
 from google.generativeai.types import GenerateContentResponse, File
-from google.generativeai import ChatSession
+from google.generativeai import ChatSession, caching, protos
+from google.api_core import exceptions
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, build_http
 from dataclasses import dataclass, field
 
+from llm_cli.utils.cache import ResponseCache, content_hash, make_cache_key
+from llm_cli.utils.constants import DEFAULT_MODEL
+from llm_cli.utils.context_cache import ContextIndex, prefix_hash
+from llm_cli.utils.file_index import FileIndex, UploadIndex, hash_file
+from llm_cli.utils import tracing
 from llm_cli.utils.helpers import preprocess_input
+from llm_cli.utils.processor import iter_stream
+from llm_cli.utils.keypool import KeyPool, PooledKey, resolve_api_keys
+from llm_cli.utils.ratelimit import estimate_input_tokens
+from llm_cli.utils.resilience import Resilience, ResiliencePolicy
+from llm_cli.utils.routing import RoutingLog, response_outcome
+from llm_cli.utils.tokens import TokenCountCache, UsageTracker
+
+if TYPE_CHECKING:
+    from llm_cli.utils.semantic_cache import SemanticCache
+
+
+# Files above this size are uploaded in resumable chunks that survive dropped connections.
+RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+UPLOAD_MAX_RETRIES = 5
+
+# Context caches need a stable model version.
+CONTEXT_CACHE_MODEL = 'gemini-1.5-flash-002'
+MIN_CONTEXT_CACHE_TOKENS = 32768
+
+_discovery_lock = threading.Lock()
+
+
+def resolve_api_key() -> str:
+    """Get the primary API key from the environment, raising a ValueError when it is not configured."""
+
+    return resolve_api_keys()[0]
+
+
+def client_options() -> dict:
+    """
+        Extra `genai.configure` arguments.
+
+        `LLM_CLI_API_ENDPOINT` points the SDK at another endpoint over REST, such as the
+        local stand-in server the tests and benchmarks run against.
+    """
+
+    endpoint = os.environ.get("LLM_CLI_API_ENDPOINT")
+    if not endpoint:
+        return {}
+
+    return {"transport": "rest", "client_options": {"api_endpoint": endpoint}}
+
+
+def generative_client(api_key: str) -> glm.GenerativeServiceClient:
+    """A generation client of its own for an API key, leaving the SDK's global configuration alone."""
+
+    options = client_options()
+    return glm.GenerativeServiceClient(
+        client_options={**options.get("client_options", {}), "api_key": api_key},
+        transport=options.get("transport"))
+
+
+class _RestAsyncClient:
+    """
+        The calls `generate_content_async` makes, over a REST generation client.
+
+        The SDK's async client only speaks gRPC, so over REST (`LLM_CLI_API_ENDPOINT`)
+        each call and each streamed chunk waits for the REST client in the event loop's
+        default executor.
+    """
+
+    def __init__(self, client: glm.GenerativeServiceClient):
+        self._client = client
+
+    async def generate_content(self, request, **options):
+        return await asyncio.to_thread(self._client.generate_content, request, **options)
+
+    async def stream_generate_content(self, request, **options):
+        return _RestAsyncStream(await asyncio.to_thread(self._client.stream_generate_content, request, **options))
+
+
+class _RestAsyncStream:
+    """The chunks of a REST stream as an async iterator, which can be cancelled like a gRPC one."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await asyncio.to_thread(next, self._stream, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    def cancel(self) -> None:
+        self._stream.cancel()
+
+
+def generative_async_client(api_key: str) -> Any:
+    """An asyncio generation client of its own for an API key, for the running event loop."""
+
+    options = client_options()
+    if options.get("transport") == "rest":
+        return _RestAsyncClient(generative_client(api_key))
+
+    return glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+
+
+def bind_client(model: genai.GenerativeModel, client: glm.GenerativeServiceClient, async_client: Any = None) -> genai.GenerativeModel:
+    """
+        A copy of a model that sends its requests through the given clients instead of the SDK's global ones.
+
+        `GenerativeModel` takes no client of its own, so this is the one place its private
+        `_client` and `_async_client` are set; tests/test_keypool.py checks them against the
+        installed SDK.
+    """
+
+    bound = copy.copy(model)
+    bound._client, bound._async_client = client, async_client
+    return bound
+
+
+def _setup_discovery_api(client) -> None:
+    """Load the Files API discovery document, from `LLM_CLI_API_ENDPOINT` when it is set."""
+
+    endpoint = os.environ.get("LLM_CLI_API_ENDPOINT")
+    if not endpoint:
+        client._setup_discovery_api()
+        return
+
+    api_key = client._client_options.api_key
+    http = build_http()
+    try:
+        _, content = http.request(
+            f"{endpoint.rstrip('/')}/$discovery/rest?version=v1beta&key={api_key}")
+    finally:
+        http.close()
+
+    client._discovery_api = build_from_document(content.decode("utf-8"), developerKey=api_key)
+
+
+def _upload_metadata(path: str, display_name: Optional[str] = None, mime_type: Optional[str] = None) -> tuple[str, Optional[str]]:
+    """The display name and MIME type a file is uploaded with, defaulting to its name and extension."""
+
+    if mime_type is None:
+        mime_type, _ = mimetypes.guess_type(path)
+    return display_name or os.path.basename(path), mime_type
+
+
+def build_model(system_instruction: str = "", generation_config: Optional[dict] = None, model_name: str = DEFAULT_MODEL) -> genai.GenerativeModel:
+    """Build the generative model shared by the sync and async clients."""
+
+    if system_instruction:
+        return genai.GenerativeModel(
+            model_name, system_instruction=system_instruction,
+            generation_config=generation_config or None)
+
+    return genai.GenerativeModel(
+        model_name, generation_config=generation_config or None)
+
+
+def _usage_args(response: GenerateContentResponse) -> dict:
+    """The token counts of a response, to attach to its trace span."""
+
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+
+    return {
+        "prompt_tokens": usage.prompt_token_count,
+        "output_tokens": usage.candidates_token_count,
+        "cached_tokens": getattr(usage, "cached_content_token_count", 0),
+    }
+
+
+def _cancel_stream(response: GenerateContentResponse) -> None:
+    """Stop a streamed response that is no longer needed, such as a losing hedged request."""
+
+    cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+    if cancel is not None:
+        cancel()
+
+
+async def _close_stream(response: GenerateContentResponse) -> None:
+    """Stop a streamed response of `generate_content_async` that is no longer needed."""
+
+    _cancel_stream(response)
+    close = getattr(getattr(response, "_iterator", None), "aclose", None)
+    if close is not None:
+        await close()
+
+
+class _OnComplete:
+    """Wrap a streamed response to run a callback (caching, usage) once it is fully iterated."""
+
+    def __init__(self, response: GenerateContentResponse, callback, request_id: Optional[str] = None):
+        self._response = response
+        self._callback = callback
+        self._request_id = request_id
+
+    def __iter__(self):
+        with tracing.span("stream", request_id=self._request_id) as span:
+            yield from iter_stream(self._response)
+            self._callback(self._response)
+
+            if tracing.enabled():
+                span.set(**_usage_args(self._response))
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+@dataclass
+class _Request:
+    """A request between the steps before and after it is sent, which `Gemini` and `AsyncGemini` share."""
+    contents: list
+    stream: bool
+    request_id: Optional[str] = None
+    cache_key: Optional[str] = None
+    embedding: Any = None
+    estimated: int = 0
+    pinned: bool = False
+    key: Optional[PooledKey] = None  # the key of the pool that answered
 
 
 @dataclass
@@ -15,32 +251,481 @@ class Gemini:
     chat_history: list = field(default_factory=list)
     chat: ChatSession = field(init=False)
     system_instruction: str = field(default="")
+    generation_config: dict = field(default_factory=dict)
+    cache: Optional[ResponseCache] = field(default=None)
+    refresh_cache: bool = field(default=False)
+    upload_index: Optional[UploadIndex] = field(default=None)
+    file_index: Optional[FileIndex] = field(default=None)
+    max_input_tokens: Optional[int] = field(default=None)
+    truncate_input: bool = field(default=False)
+    token_counts: Optional[TokenCountCache] = field(default=None)
+    usage: UsageTracker = field(default_factory=UsageTracker)
+    resilience_policy: Optional[ResiliencePolicy] = field(default=None)
+    semantic_cache: Optional["SemanticCache"] = field(default=None)
+    context_cache: Optional[str] = field(default=None)
+    context_index: Optional[ContextIndex] = field(default=None)
+    model_name: Optional[str] = field(default=None)
+    escalation: tuple[str, ...] = field(default=())
+    routing_log: Optional[RoutingLog] = field(default=None)
+    command: str = field(default="prompt")
 
     def __post_init__(self):
-        # validate if environment variable is set or exists or is not empty
-        if "GOOGLE_API_KEY" in os.environ and os.environ["GOOGLE_API_KEY"]:
-            self.api_key = os.environ["GOOGLE_API_KEY"]
+        self.api_keys = resolve_api_keys()
+        self.api_key = self.api_keys[0]
+        self.resilience = Resilience(
+            self.resilience_policy or ResiliencePolicy.from_env(), self.usage)
+
+        self.model_name = self.model_name or DEFAULT_MODEL
+
+        with tracing.span("configure"):
+            # the SDK's file and context cache helpers use its global clients, with the
+            # primary key; requests and token counts go through clients of each key's own
+            genai.configure(api_key=self.api_key, **client_options())
+
+            self.model = build_model(self.system_instruction, self.generation_config, self.model_name)
+            self.chat = self.model.start_chat(history=self.chat_history)
+
+            # the models a request is escalated to when an answer is empty or blocked
+            self.cascade = [self.model] + [
+                build_model(self.system_instruction, self.generation_config, name)
+                for name in self.escalation if name != self.model_name]
+
+        self.key_pool = KeyPool(self.api_keys, self.model.model_name)
+        self.rate_limiter = self.key_pool.primary.limiter
+        self._bind_lock = threading.Lock()
+
+        # the context cache is looked up on the first request, see `resolve_model`
+        self.cached_content = None
+        self._resolved = not (self.context_cache or self.system_instruction)
+        self._resolve_lock = threading.Lock()
+
+    def resolve_model(self) -> genai.GenerativeModel:
+        """
+            Switch to the context cache to generate with, if there is one, before the first request.
+
+            Finding it opens the local context index and asks the server whether the cache
+            is still live, so it is left out of the constructor: clients that are built
+            but never used, or only count tokens, don't pay for it.
+        """
+
+        with self._resolve_lock:
+            if self._resolved:
+                return self.model
+
+            cached = self._resolve_context_cache()
+            if cached is not None:
+                # the cached prefix takes the place of the system instruction; a context
+                # cache belongs to one model, so its requests never escalate
+                self.cached_content = cached
+                self.model = genai.GenerativeModel.from_cached_content(
+                    cached, generation_config=self.generation_config or None)
+                self.chat = self.model.start_chat(history=self.chat.history)
+                self.cascade = [self.model]
+                self.key_pool = KeyPool(self.api_keys, self.model.model_name)
+                self.rate_limiter = self.key_pool.primary.limiter
+
+            self._resolved = True
+            return self.model
+
+    def _contexts(self) -> ContextIndex:
+        """Get the local context cache index, opening it on first use."""
+
+        if self.context_index is None:
+            self.context_index = ContextIndex()
+        return self.context_index
+
+    def _resolve_context_cache(self) -> Optional[caching.CachedContent]:
+        """
+            The context cache to generate with: the one named by `context_cache`, or a
+            live cache of exactly this system instruction, reused automatically.
+        """
+
+        if self.context_cache:
+            name = self.context_cache
+            if not name.startswith("cachedContents/"):
+                context = self._contexts().find(name)
+                if context is None:
+                    raise ValueError(
+                        f"No live context cache named {name}. Create one with `lcli context create`.")
+                name = context.name
+
+            try:
+                return caching.CachedContent.get(name)
+            except exceptions.NotFound:
+                self._contexts().forget(name)
+                raise ValueError(f"The context cache {self.context_cache} has expired or was deleted.")
+
+        if not self.system_instruction:
+            return None
+
+        context = self._contexts().find_prefix(prefix_hash(self.system_instruction), self.model_name)
+        if context is None:
+            return None
+
+        try:
+            return caching.CachedContent.get(context.name)
+        except exceptions.NotFound:
+            self._contexts().forget(context.name)
+            return None
+
+    def _instruction_key(self) -> str:
+        """The system instruction, and the context cache standing in for it, for cache keys."""
+
+        if self.cached_content is None:
+            return self.system_instruction
+        return f"{self.system_instruction}\x00{self.cached_content.name}"
+
+    def _client_for(self, key: PooledKey) -> glm.GenerativeServiceClient:
+        """The generation client of a key of the pool, created on first use."""
+
+        with self._bind_lock:
+            if key.client is None:
+                key.client = {"client": generative_client(key.api_key)}
+            return key.client["client"]
+
+    def _async_client_for(self, key: PooledKey) -> Any:
+        """The asyncio generation client of a key of the pool, created in each event loop it is used in, as gRPC channels belong to one."""
+
+        loop = asyncio.get_running_loop()
+        self._client_for(key)
+        with self._bind_lock:
+            if key.client.get("loop") is not loop:
+                key.client["loop"], key.client["async_client"] = loop, generative_async_client(key.api_key)
+            return key.client["async_client"]
+
+    def _model_for(self, key: PooledKey, model: Optional[genai.GenerativeModel] = None) -> genai.GenerativeModel:
+        """
+            A model of the cascade, the first by default, bound to a key of the pool through a client of the key's own.
+
+            The primary key is bound too, so that no request depends on the SDK's global
+            configuration, which another client in the process may change.
+        """
+
+        model = model or self.model
+        client = self._client_for(key)
+        with self._bind_lock:
+            if model.model_name not in key.client:
+                key.client[model.model_name] = bind_client(model, client)
+            return key.client[model.model_name]
+
+    def _pinned(self, contents: list) -> bool:
+        """Uploaded files and context caches belong to the project of the primary key."""
+
+        return self.cached_content is not None or any(isinstance(part, File) for part in contents)
+
+    def _scheduled(self, send: Callable[[genai.GenerativeModel, Optional[float]], Any], tokens: int, pinned: bool = False, model: Optional[genai.GenerativeModel] = None) -> Callable[[Optional[float]], tuple[Any, PooledKey]]:
+        """
+            Make every attempt of a request go out with the key of the pool with the most
+            headroom, after waiting for its turn under that key's rate limits.
+        """
+
+        def attempt(timeout: Optional[float]) -> tuple[Any, PooledKey]:
+            started = time.monotonic()
+
+            def send_with(key: PooledKey) -> tuple[Any, PooledKey]:
+                remaining = timeout - (time.monotonic() - started) if timeout is not None else None
+                return send(self._model_for(key, model), remaining), key
+
+            return self.key_pool.run(send_with, tokens, max_wait=timeout, pinned=pinned)
+
+        return attempt
+
+    def _scheduled_async(self, send: Callable[[genai.GenerativeModel, Optional[float]], Awaitable[Any]], tokens: int, pinned: bool = False, model: Optional[genai.GenerativeModel] = None) -> Callable[[Optional[float]], Awaitable[tuple[Any, PooledKey]]]:
+        """The asyncio counterpart of `_scheduled`, with the model bound to the key's async client as well."""
+
+        async def attempt(timeout: Optional[float]) -> tuple[Any, PooledKey]:
+            started = time.monotonic()
+
+            async def send_with(key: PooledKey) -> tuple[Any, PooledKey]:
+                remaining = timeout - (time.monotonic() - started) if timeout is not None else None
+                bound = bind_client(self._model_for(key, model), self._client_for(key), self._async_client_for(key))
+                return await send(bound, remaining), key
+
+            return await self.key_pool.run_async(send_with, tokens, max_wait=timeout, pinned=pinned)
+
+        return attempt
+
+    def _estimate(self, contents: Iterable[Any]) -> int:
+        """Estimate the input tokens of a request, when any key's rate limits need them."""
+
+        if any(key.limiter for key in self.key_pool.members):
+            return estimate_input_tokens(contents)
+        return 0
+
+    def _settle(self, estimated: int, response: GenerateContentResponse, key: Optional[PooledKey] = None) -> None:
+        """Correct the tokens reserved for a request with the count the server reported."""
+
+        limiter = (key or self.key_pool.primary).limiter
+        usage = getattr(response, "usage_metadata", None)
+        if limiter is not None and usage is not None:
+            limiter.settle(estimated, usage.prompt_token_count)
+
+    def _log_request(self, model: genai.GenerativeModel, started: float, outcome: str, stream: bool, response: Optional[GenerateContentResponse] = None) -> None:
+        """Record the latency and outcome of a request to one model, for tuning the routing."""
+
+        if self.routing_log is None:
+            return
+
+        usage = getattr(response, "usage_metadata", None)
+        self.routing_log.request(
+            self.command, model.model_name, time.monotonic() - started, outcome, stream,
+            getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0)
+
+    def _semantic_lookup(self, text: str, request_id: Optional[str]) -> tuple[Any, Optional[GenerateContentResponse]]:
+        """Embed a text prompt and look it up in the semantic cache, returning the embedding and any hit."""
+
+        from llm_cli.utils.semantic_cache import cache_scope
+
+        with tracing.span("semantic_lookup", request_id=request_id) as span:
+            embedding = self.semantic_cache.embed(text)
+            cached = None if self.refresh_cache else self.semantic_cache.get(
+                embedding, cache_scope(self.model.model_name, self._instruction_key(), self.generation_config))
+            span.set(hit=cached is not None)
+
+        if cached is None:
+            return embedding, None
+        return embedding, GenerateContentResponse.from_response(protos.GenerateContentResponse(cached))
+
+    def _semantic_put(self, embedding: Any, response: GenerateContentResponse) -> None:
+        from llm_cli.utils.semantic_cache import cache_scope
+
+        self.semantic_cache.put(
+            embedding, cache_scope(self.model.model_name, self._instruction_key(), self.generation_config),
+            response.to_dict())
+
+    def _before_generate(self, contents: Any, stream: bool, semantic: bool = True) -> tuple[_Request, Optional[GenerateContentResponse]]:
+        """
+            The steps before a request goes out, returning it with any answer from the
+            response or semantic cache.
+
+            A request that does go out is checked against the input token budget and its
+            tokens are estimated for the rate limits.
+        """
+
+        self.resolve_model()
+        contents = contents if isinstance(contents, list) else [contents]
+        request = _Request(contents, stream, tracing.request_id())
+
+        if self.cache is not None:
+            with tracing.span("cache_lookup", request_id=request.request_id) as span:
+                request.cache_key = make_cache_key(
+                    self.model.model_name, self._instruction_key(), self.generation_config, contents)
+                cached = None if self.refresh_cache else self.cache.get(request.cache_key)
+                span.set(hit=cached is not None)
 
-        else:
+            if cached is not None:
+                return request, GenerateContentResponse.from_response(protos.GenerateContentResponse(cached))
+
+        # semantic matches are only looked for between plain text prompts
+        if semantic and self.semantic_cache is not None and len(contents) == 1 and isinstance(contents[0], str):
+            request.embedding, cached = self._semantic_lookup(contents[0], request.request_id)
+            if cached is not None:
+                return request, cached
+
+        request.contents = self._enforce_input_budget(contents)
+        request.estimated = self._estimate(request.contents)
+        request.pinned = self._pinned(request.contents)
+        self.usage.start()
+        return request, None
+
+    def _before_chat(self, message: str, stream: bool) -> tuple[_Request, Optional[GenerateContentResponse]]:
+        """The steps before a chat message goes out, returning it with any answer from the semantic cache."""
+
+        self.resolve_model()
+        message = preprocess_input(message)
+        request = _Request([message], stream, tracing.request_id())
+
+        # only a first turn can be answered like an earlier conversation's
+        if self.semantic_cache is not None and not self.chat.history:
+            request.embedding, cached = self._semantic_lookup(message, request.request_id)
+            if cached is not None:
+                self.chat.history = [
+                    protos.Content(role="user", parts=[protos.Part(text=message)]), cached.candidates[0].content]
+                return request, cached
+
+        request.estimated = self._estimate(
+            [message, *(part.text for content in self.chat.history for part in content.parts)])
+        request.pinned = self._pinned([])
+        self.usage.start()
+        return request, None
+
+    def _after_attempt(self, request: _Request, model: genai.GenerativeModel, started: float, response: GenerateContentResponse, span: Any, last: bool = True) -> bool:
+        """
+            The steps after a model answered a request: log the answer, and complete it
+            unless it is streamed. Returns whether to escalate to the next model instead.
+        """
+
+        outcome = response_outcome(response, streamed=request.stream)
+        if outcome != "ok" and not last:
+            # escalate: the wasted answer still counts against usage and quota
+            if not request.stream:
+                self.usage.record(response)
+                self._settle(request.estimated, response, request.key)
+            self._log_request(model, started, "escalated", request.stream, response)
+            span.set(escalated=outcome)
+            return True
+
+        self._log_request(model, started, outcome, request.stream, response)
+        if not request.stream:
+            self._complete(request, response)
+            if tracing.enabled():
+                span.set(**_usage_args(response))
+        return False
+
+    def _complete(self, request: _Request, response: GenerateContentResponse) -> None:
+        """The steps after a whole answer arrived: record its usage and cache it."""
+
+        self.usage.record(response)
+        self._settle(request.estimated, response, request.key)
+
+        # only cache complete answers, never blocked or empty responses
+        try:
+            if response.text:
+                if request.cache_key is not None:
+                    self.cache.put(request.cache_key, response.to_dict())
+                if request.embedding is not None:
+                    self._semantic_put(request.embedding, response)
+        except ValueError:
+            pass
+
+    def _generate_content(self, contents: Any, stream_response: bool = False, semantic: bool = True) -> GenerateContentResponse:
+        """
+            Generate content.
+
+            Responses are served from and stored in the cache when one is set, requests
+            that go out are checked against the input token budget, and the usage of
+            every response is recorded.
+        """
+
+        request, cached = self._before_generate(contents, stream_response, semantic)
+        if cached is not None:
+            return cached
+
+        for model in self.cascade:
+            # streamed, the span ends at the first chunk; the rest is timed by the "stream" span
+            with tracing.span("generate", request_id=request.request_id, model=model.model_name, stream=stream_response) as span:
+                started = time.monotonic()
+                try:
+                    response, request.key = self.resilience.call(
+                        self._scheduled(
+                            lambda bound, timeout: bound.generate_content(
+                                request.contents, stream=stream_response, request_options=self.resilience.request_options(timeout)),
+                            request.estimated, pinned=request.pinned, model=model),
+                        cancel=(lambda result: _cancel_stream(result[0])) if stream_response else None)
+                except Exception:
+                    self._log_request(model, started, "error", stream_response)
+                    raise
+
+                if not self._after_attempt(request, model, started, response, span, last=model is self.cascade[-1]):
+                    break
+
+        if stream_response:
+            return _OnComplete(response, lambda response: self._complete(request, response), request.request_id)
+
+        return response
+
+    def _token_counts(self) -> TokenCountCache:
+        """Get the memoized token counts, opening them on first use."""
+
+        if self.token_counts is None:
+            self.token_counts = TokenCountCache()
+        return self.token_counts
+
+    def _count(self, part: Any, content_key: str) -> int:
+        """Count the tokens of a single part, memoized by its content key."""
+
+        model_name = self.model.model_name
+        tokens = self._token_counts().get(model_name, content_key)
+
+        if tokens is None:
+            # a bare model, so the system instruction isn't counted again for every part
+            with tracing.span("count_tokens", model=model_name) as span:
+                counter = bind_client(genai.GenerativeModel(model_name), self._client_for(self.key_pool.primary))
+                tokens = counter.count_tokens([part]).total_tokens
+                span.set(tokens=tokens)
+            self._token_counts().put(model_name, content_key, tokens)
+
+        return tokens
+
+    def count_tokens(self, contents: Iterable[Any]) -> list[int]:
+        """Count the input tokens of each content part (text, image or uploaded file)."""
+
+        return [self._count(part, content_hash(part)) for part in contents]
+
+    def count_system_instruction_tokens(self) -> int:
+        """Count the input tokens the system instruction adds to every request."""
+
+        if not self.system_instruction:
+            return 0
+        return self._count(self.system_instruction, content_hash(self.system_instruction))
+
+    def count_file_tokens(self, path: str) -> int:
+        """
+            Count the input tokens of a local file.
+
+            The count is memoized by the file's content hash, so a file that was counted
+            before is neither uploaded nor counted again.
+        """
+
+        path = preprocess_input(path)
+        content_key = f"file:{hash_file(path)}"
+        tokens = self._token_counts().get(self.model.model_name, content_key)
+
+        if tokens is None:
+            file = self.wait_for_active([self.upload_file(path)])[0]
+            tokens = self._count(file, content_key)
+
+        return tokens
+
+    def _enforce_input_budget(self, contents: list) -> list:
+        """
+            Check a request against `max_input_tokens` before it is sent.
+
+            Over budget, the text prompt is truncated to fit when `truncate_input` is set,
+            otherwise the request is rejected with a ValueError.
+        """
+
+        if self.max_input_tokens is None:
+            return contents
+
+        counts = self.count_tokens(contents)
+        total = sum(counts) + self.count_system_instruction_tokens()
+
+        if total <= self.max_input_tokens:
+            return contents
+
+        if not self.truncate_input or not isinstance(contents[0], str):
             raise ValueError(
-                "API key not found. Please set the GOOGLE_API_KEY environment variable or properly configure it using `lcli configure`.")
+                f"The prompt is {total} tokens, over the input budget of {self.max_input_tokens} tokens.")
 
-        genai.configure(api_key=self.api_key)
+        available = self.max_input_tokens - (total - counts[0])
+        text, tokens = contents[0], counts[0]
 
-        if self.system_instruction:
-            self.model = genai.GenerativeModel(
-                'gemini-1.5-flash', system_instruction=self.system_instruction)
-        else:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+        # shrink proportionally; a few rounds converge since tokens scale with length
+        for _ in range(4):
+            if available <= 0:
+                break
 
-        self.chat = self.model.start_chat(history=self.chat_history)
+            text = text[:int(len(text) * available / tokens * 0.95)]
+            tokens = self.count_tokens([text])[0]
+
+            if tokens <= available:
+                return [text, *contents[1:]]
 
-    def generate_content_from_text_prompt(self, prompt: str, stream_response: bool = False) -> GenerateContentResponse:
-        """Generate content from a text prompt."""
+        raise ValueError(
+            f"The prompt cannot be truncated to fit the input budget of {self.max_input_tokens} tokens.")
+
+    def generate_content_from_text_prompt(self, prompt: str, stream_response: bool = False, semantic: bool = True) -> GenerateContentResponse:
+        """
+            Generate content from a text prompt.
+
+            With `semantic` False, the semantic cache neither answers nor stores the
+            prompt, e.g. for prompts that differ in details that matter.
+        """
 
         prompt = preprocess_input(prompt)
 
-        return self.model.generate_content(prompt, stream=stream_response)
+        return self._generate_content(prompt, stream_response=stream_response, semantic=semantic)
 
     def generate_content_from_text_image_prompt(self, prompt: str, image_args: list[dict], stream_response: bool = False) -> GenerateContentResponse:
         """
@@ -56,7 +741,7 @@ class Gemini:
 
         prompt = preprocess_input(prompt)
 
-        return self.model.generate_content([prompt, *image_args], stream=stream_response)
+        return self._generate_content([prompt, *image_args], stream_response=stream_response)
 
     def generate_content_from_text_and_file_prompt(self, prompt: str, file_args: Iterable[Any], stream_response: bool = False) -> GenerateContentResponse:
         """
@@ -70,8 +755,9 @@ class Gemini:
         """
 
         prompt = preprocess_input(prompt)
+        contents = [prompt, *file_args] if prompt else list(file_args)
 
-        return self.model.generate_content([prompt, *file_args], stream=stream_response)
+        return self._generate_content(contents, stream_response=stream_response)
 
     def list_files(self) -> Iterable[File]:
         """Get a list of uploaded files."""
@@ -85,24 +771,269 @@ class Gemini:
         """
         genai.delete_file(file_name)
 
-    def upload_files(self, files: list[str]) -> Iterable[File]:
-        """Upload files to the API."""
+        if "/" not in file_name:
+            file_name = f"files/{file_name}"
+        self._uploads().forget(file_name)
+        self._files().remove(file_name)
+
+    def sync_file_index(self) -> int:
+        """Refresh the local file index from a full listing, returning the number of files."""
+        return self._files().sync(genai.list_files())
+
+    def create_context_cache(self, display_name: str, system_instruction: str = "", files: Iterable[Union[str, tuple[str, Optional[str]]]] = (), ttl: float = 3600, model_name: str = CONTEXT_CACHE_MODEL) -> tuple[caching.CachedContent, bool]:
+        """
+            Cache a system instruction and files on the server for `ttl` seconds.
+
+            A live cache of the same prefix recorded locally is reused, with its expiry
+            extended, instead of uploading and processing it again. Returns the cache and
+            whether it was reused.
+        """
+
+        files = [(file, None) if isinstance(file, str) else file for file in files]
+        prefix = prefix_hash(system_instruction, [hash_file(path) for path, _ in files])
+
+        existing = self._contexts().find_prefix(prefix, model_name)
+        if existing is not None:
+            try:
+                cached = caching.CachedContent.get(existing.name)
+                cached.update(ttl=timedelta(seconds=ttl))
+                self._contexts().record(cached, prefix)
+                return cached, True
+            except exceptions.NotFound:
+                self._contexts().forget(existing.name)
+
+        if not files:
+            # the server only rejects a prefix below its minimum size once it is sent;
+            # an instruction alone is cheap to count first
+            tokens = genai.GenerativeModel(model_name).count_tokens(system_instruction).total_tokens
+            if tokens < MIN_CONTEXT_CACHE_TOKENS:
+                raise ValueError(
+                    f"A context cache needs at least {MIN_CONTEXT_CACHE_TOKENS} tokens and the system instruction "
+                    f"has {tokens}. Cache it together with files, or send it uncached.")
+
+        uploaded = self.wait_for_active(self.upload_files(files)) if files else []
+
+        with tracing.span("create_context_cache", files=len(files)):
+            cached = caching.CachedContent.create(
+                model=model_name, display_name=display_name, system_instruction=system_instruction or None,
+                contents=uploaded or None, ttl=timedelta(seconds=ttl))
+
+        self._contexts().record(cached, prefix)
+        return cached, False
+
+    def delete_context_cache(self, name: str) -> caching.CachedContent:
+        """Delete a context cache by its display name or resource name."""
 
-        for file in files:
-            yield self.upload_file(file)
+        if not name.startswith("cachedContents/"):
+            context = self._contexts().find(name)
+            if context is None:
+                raise ValueError(f"No live context cache named {name}.")
+            name = context.name
 
-    def upload_file(self, file: str, **kwargs) -> File:
-        """Upload a file to the API."""
+        cached = caching.CachedContent.get(name)
+        cached.delete()
+        self._contexts().forget(cached.name)
+        return cached
+
+    def sync_context_index(self) -> int:
+        """Refresh the local context cache index from a full listing, returning the number of caches."""
+        return self._contexts().sync(caching.CachedContent.list(page_size=100))
+
+    def upload_files(self, files: Iterable[Union[str, tuple[str, Optional[str]]]], max_workers: int = 4, **kwargs) -> Iterable[File]:
+        """
+            Upload files to the API concurrently, yielding them in input order.
+
+            `files` holds paths or `(path, mime_type)` pairs, as yielded by
+            `discover_files`. Uploads start as soon as each one is read from `files`,
+            so a lazily discovered iterable feeds the worker pool while it is still
+            being produced.
+        """
+
+        # open the indexes before the workers share them
+        self._uploads()
+        self._files()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for file in files:
+                path, mime_type = (file, None) if isinstance(file, str) else file
+                options = {**kwargs, "mime_type": mime_type} if mime_type else kwargs
+                futures.append(executor.submit(self.upload_file, path, **options))
+
+            for future in futures:
+                yield future.result()
+
+    def wait_for_active(self, files: Iterable[File], timeout: float = 600, initial_delay: float = 1, max_delay: float = 15) -> list[File]:
+        """
+            Wait until uploaded files have been processed by the server and can be used in prompts.
+
+            Videos and audio are processed asynchronously after upload. A single poller
+            checks every pending file per round and backs off exponentially between rounds.
+        """
+
+        files = list(files)
+        latest = {file.name: file for file in files}
+        pending = {file.name for file in files if file.state.name == "PROCESSING"}
+
+        if not pending:
+            return files
+
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+
+        with tracing.span("wait_for_active", files=len(pending)):
+            while pending:
+                if time.monotonic() + delay > deadline:
+                    raise TimeoutError(
+                        f"Timed out waiting for {len(pending)} file(s) to finish processing.")
+
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+                for name in list(pending):
+                    file = genai.get_file(name)
+                    latest[name] = file
+
+                    if file.state.name == "FAILED":
+                        raise ValueError(
+                            f"File {file.display_name} could not be processed: {file.error.message}")
+
+                    if file.state.name != "PROCESSING":
+                        pending.discard(name)
+
+        return [latest[file.name] for file in files]
+
+    def _create_file(self, path: str, mime_type: Optional[str] = None, name: Optional[str] = None, display_name: Optional[str] = None) -> File:
+        """
+            Upload a file through the Files API media endpoint.
+
+            Mirrors `genai.upload_file`, but gives every upload its own HTTP connection
+            (the SDK shares one, which is not thread safe) and sends large files in
+            resumable chunks. After a dropped connection the upload continues from the
+            last byte the server acknowledged instead of starting over.
+        """
+
+        client = get_default_file_client()
+
+        with _discovery_lock:
+            if client._discovery_api is None:
+                _setup_discovery_api(client)
+
+        display_name, mime_type = _upload_metadata(path, display_name, mime_type)
+
+        body = {"displayName": display_name}
+        if name is not None:
+            body["name"] = name if "/" in name else f"files/{name}"
+
+        resumable = os.path.getsize(path) > RESUMABLE_UPLOAD_THRESHOLD
+        media = MediaFileUpload(
+            path, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE if resumable else -1, resumable=resumable)
+        request = client._discovery_api.media().upload(
+            body={"file": body}, media_body=media)
+        http = build_http()  # fresh connection that treats 308 as upload progress, not a redirect
+
+        try:
+            if not resumable:
+                result = request.execute(http=http, num_retries=UPLOAD_MAX_RETRIES)
+            else:
+                result, failures = None, 0
+
+                while result is None:
+                    try:
+                        # no retries inside next_chunk: it would send the chunk's already read
+                        # file slice again, i.e. nothing; after a failure the next call asks the
+                        # server how much it has and continues from there
+                        _, result = request.next_chunk(http=http)
+                        failures = 0
+                    except (HttpError, OSError, httplib2.HttpLib2Error) as e:
+                        if isinstance(e, HttpError) and e.resp.status < 500 and e.resp.status != 429:
+                            raise
+                        failures += 1
+                        if failures > UPLOAD_MAX_RETRIES:
+                            raise
+                        time.sleep(min(2 ** failures, 30) * random.uniform(0.5, 1))
+        finally:
+            http.close()
+
+        return File(client.get_file(name=result["file"]["name"]))
+
+    def _uploads(self) -> UploadIndex:
+        """Get the upload deduplication index, opening it on first use."""
+
+        if self.upload_index is None:
+            self.upload_index = UploadIndex()
+        return self.upload_index
+
+    def _files(self) -> FileIndex:
+        """Get the local file metadata index, opening it on first use."""
+
+        if self.file_index is None:
+            self.file_index = FileIndex()
+        return self.file_index
+
+    def upload_file(self, file: str, dedupe: bool = True, **kwargs) -> File:
+        """
+            Upload a file to the API.
+
+            With `dedupe`, a file whose exact bytes were already uploaded under the same
+            display name and MIME type, and are still live on the server, is not sent again;
+            the existing remote file is returned. Uploads to a given resource `name` are
+            always sent.
+        """
 
         file = preprocess_input(file)
 
-        return genai.upload_file(file, **kwargs)
+        with tracing.span("upload", file=file, dedupe=dedupe) as span:
+            response, reused = self._upload_file(file, dedupe, **kwargs)
+            if tracing.enabled():
+                span.set(name=response.name, bytes=response.size_bytes, reused=reused)
+
+        return response
+
+    def _upload_file(self, file: str, dedupe: bool, **kwargs) -> tuple[File, bool]:
+        """Upload a file, or reuse a live remote copy, returning it and whether it was reused."""
+
+        if not dedupe or kwargs.get("name") is not None:
+            response = self._create_file(file, **kwargs)
+            self._files().upsert(response)
+            return response, False
+
+        display_name, mime_type = _upload_metadata(file, kwargs.get("display_name"), kwargs.get("mime_type"))
+        digest, size = hash_file(file), os.path.getsize(file)
+        entry = self._uploads().lookup(digest, size, display_name, mime_type)
+
+        if entry:
+            try:
+                remote = genai.get_file(entry["name"])
+                if remote.state.name != "FAILED":
+                    self._files().upsert(remote)
+                    return remote, True
+            except (exceptions.NotFound, exceptions.PermissionDenied):
+                pass  # deleted elsewhere or uploaded with another key
+
+            self._uploads().forget(entry["name"])
+
+        response = self._create_file(file, **kwargs)
+        self._uploads().record(digest, size, display_name, mime_type, response)
+        self._files().upsert(response)
+
+        return response, False
 
     def get_file(self, file_display_name: str) -> File:
-        """Get a file by its display name."""
+        """
+            Get a file by its display name.
+
+            Display names are resolved to resource names through the local file index;
+            resource names (`files/...`) are fetched directly.
+        """
 
         file_display_name = preprocess_input(file_display_name)
 
+        if not file_display_name.startswith("files/"):
+            indexed = self._files().find_by_display_name(file_display_name)
+            if indexed:
+                file_display_name = indexed.name
+
         return genai.get_file(file_display_name)
 
     def initialize_new_chat(self):
@@ -111,8 +1042,50 @@ class Gemini:
         self.chat_history = []
         self.chat = self.model.start_chat(history=self.chat_history)
 
-    def send_chat_message(self, message: str) -> GenerateContentResponse:
-        """Send a message to the chat session."""
+    def set_chat_history(self, history: list):
+        """Replace the history sent with the next chat message."""
 
-        message = preprocess_input(message)
-        return self.chat.send_message(message)
+        self.chat_history = history
+        self.chat = self.model.start_chat(history=self.chat_history)
+
+    def cancel_stream(self, response: GenerateContentResponse) -> None:
+        """Stop a streamed response that was abandoned before it was fully iterated."""
+
+        _cancel_stream(response)
+
+    def _send_chat(self, model: genai.GenerativeModel, message: str, **kwargs) -> GenerateContentResponse:
+        # turns are sequential, so the session can switch keys between them
+        self.chat.model = model
+        return self.chat.send_message(message, **kwargs)
+
+    def send_chat_message(self, message: str, stream_response: bool = False) -> GenerateContentResponse:
+        """
+            Send a message to the chat session.
+
+            A streamed reply is only added to the chat history once it has been fully iterated.
+        """
+
+        request, cached = self._before_chat(message, stream_response)
+        if cached is not None:
+            return cached
+
+        with tracing.span("chat", request_id=request.request_id, model=self.model.model_name, stream=stream_response) as span:
+            started = time.monotonic()
+            try:
+                # one chat session can only have one message in flight, so replies are never hedged
+                response, request.key = self.resilience.call(
+                    self._scheduled(
+                        lambda model, timeout: self._send_chat(
+                            model, request.contents[0], stream=stream_response, request_options=self.resilience.request_options(timeout)),
+                        request.estimated, pinned=request.pinned),
+                    hedge=False)
+            except Exception:
+                self._log_request(self.model, started, "error", stream_response)
+                raise
+
+            self._after_attempt(request, self.model, started, response, span)
+
+        if stream_response:
+            return _OnComplete(response, lambda response: self._complete(request, response), request.request_id)
+
+        return response
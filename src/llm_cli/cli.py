@@ -1,24 +1,162 @@
+import json
+import os
+import signal
+import time
+
+_IMPORT_STARTED = time.perf_counter_ns()  # startup is traced from here, retroactively
+
 import click
 
 from llm_cli import __version__
-from llm_cli.api.gemini import Gemini
-from llm_cli.utils.constants import COMMAND_COMPLETION_INSTRUCTIONS
-from llm_cli.utils.helpers import peek, version_, load_env, verify_env, write_dotenv, format_file_info
-from llm_cli.utils.processor import process_gemini_response
+from llm_cli.utils.constants import AUTO_MODEL, BENCH_CONCURRENCY, BENCH_SCENARIOS, COMMAND_COMPLETION_INSTRUCTIONS, CHAT_SUMMARY_INSTRUCTIONS, DEFAULT_CHUNK_TOKENS, DEFAULT_CONTEXT_TTL, DEFAULT_IMAGE_QUALITY, DEFAULT_MAX_DIMENSION, IMAGE_FORMATS
+from llm_cli.utils.helpers import peek, version_, load_env, verify_env, write_dotenv, format_file_info, parse_size, parse_duration, spawn_background, estimate_tokens
+from llm_cli.utils.processor import process_gemini_response, iter_gemini_response
+from llm_cli.utils import tracing
+
+# Everything else is imported inside the commands that use it, so that `--help`,
+# `--version` and the commands that never touch a store or the API start fast.
+
+
+def get_gemini(**kwargs):
+    """
+        Create a Gemini client.
+
+        The SDK (and gRPC/protobuf with it) is imported here rather than at module level,
+        so commands that never talk to the API start fast.
+    """
+    with tracing.span("import_sdk"):
+        from llm_cli.api.gemini import Gemini
+
+    return Gemini(**kwargs)
+
+
+def get_semantic_cache(threshold=None):
+    """Create the semantic cache; NumPy is imported here, only when the cache is used."""
+    from llm_cli.utils.semantic_cache import SemanticCache
+
+    return SemanticCache(threshold=threshold)
+
+
+def semantic_cache_options(command):
+    """Add the semantic cache options to a command."""
+    options = [
+        click.option("--semantic-cache/--no-semantic-cache", default=False, envvar="LLM_CLI_SEMANTIC_CACHE", help="Serve prompts similar to ones answered before from the local semantic cache. Needs NumPy. Can be enabled with LLM_CLI_SEMANTIC_CACHE=1."),
+        click.option("--similarity", type=click.FloatRange(0, 1), help="Minimum cosine similarity of a semantic cache hit. Defaults to LLM_CLI_SEMANTIC_THRESHOLD or 0.9."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def size_option(ctx, param, value):
+    """Click callback parsing sizes such as `10MB`."""
+    try:
+        return parse_size(value) if value is not None else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def duration_option(ctx, param, value):
+    """Click callback parsing durations such as `2h`."""
+    try:
+        return parse_duration(value) if value is not None else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def resilience_options(command):
+    """Add the retry, deadline and hedging options to a command."""
+    options = [
+        click.option("--retries", type=click.IntRange(min=0), help="Retries of transient failures (429, 5xx, timeouts). Defaults to LLM_CLI_MAX_RETRIES or 3."),
+        click.option("--deadline", callback=duration_option, help="Give up on a request after this long, retries included, e.g. '90s'. Defaults to LLM_CLI_DEADLINE."),
+        click.option("--hedge/--no-hedge", default=None, help="Send a duplicate request when the first chunk is slower than the recent p95. Defaults to LLM_CLI_HEDGE."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+model_option = click.option("--model", "-m", default=AUTO_MODEL, show_default=True, help="Model to use, or 'auto' to pick one by command, prompt size and attachments. See `lcli routing`.")
+cascade_option = click.option("--cascade/--no-cascade", default=False, envvar="LLM_CLI_CASCADE", help="Try the fast model first and escalate to the default model only when its answer is empty or blocked. Can be enabled with LLM_CLI_CASCADE=1.")
+
+
+def daemon_route(command, model, cascade=False, input_tokens=None, attachments=0) -> dict:
+    """
+        Route a request for the daemon, which records the decision in its routing log.
+
+        Only the pure routing rules are imported; no store is opened in this process.
+    """
+    from llm_cli.utils.routing import route
+
+    chosen = route(command, model, input_tokens, attachments, cascade)
+    return {"model": chosen.model, "escalation": list(chosen.escalation), "command": command,
+            "reason": chosen.reason, "input_tokens": input_tokens, "attachments": attachments}
+
+
+def route_request(command, model, cascade=False, input_tokens=None, attachments=0) -> dict:
+    """Route a request to a model, recording the decision, and return the client arguments of the route."""
+    from llm_cli.utils.routing import RoutingLog, route
+
+    routing_log = RoutingLog()
+    chosen = route(command, model, input_tokens, attachments, cascade)
+    routing_log.decision(command, chosen, input_tokens, attachments)
+
+    return {"model_name": chosen.model, "escalation": chosen.escalation, "routing_log": routing_log, "command": command}
+
 
+def echo_token_report(gemini, text, files, images=()) -> None:
+    """Echo the input token count of every part of a prompt, without sending it."""
+    rows = []
 
-load_env()
+    if gemini.system_instruction:
+        rows.append(("system instruction", gemini.count_system_instruction_tokens()))
+    if text:
+        rows.append(("text", gemini.count_tokens([text])[0]))
+    for path, blob in images:
+        rows.append((path, gemini.count_tokens([blob])[0]))
+    for path in files:
+        rows.append((path, gemini.count_file_tokens(path)))
+
+    for label, tokens in rows:
+        click.echo(f"{label}\t - \t{tokens}")
+
+    click.echo(
+        click.style(
+            f"Total input tokens: {sum(tokens for _, tokens in rows)}", bold=True
+        )
+    )
+
+
+def echo_stream(response, prefix: str = "", fg: str = "bright_blue") -> None:
+    """Echo a streamed response chunk by chunk, flushing each one as it arrives."""
+    click.echo(click.style(prefix, fg=fg), nl=False)
+
+    for chunk in iter_gemini_response(response):
+        click.echo(click.style(chunk, fg=fg), nl=False)
+
+    click.echo()
 
 
 @click.group(invoke_without_command=True)
 @click.option("--version", "-v", is_flag=True, help="Get the version of the llm-cli package.")
+@click.option("--trace", "trace_path", type=click.Path(dir_okay=False, writable=True), help="Write per-phase timings of the command to this file, in Chrome trace format.")
 @click.pass_context
-def cli(ctx, version):
+def cli(ctx, version, trace_path):
     """A CLI tool for interacting with the Gemini API.
     can be invoked with 'lcli' or 'llm-cli'.
 
     Examples: $ lcli --version
     """
+    metrics = bool(os.environ.get("LLM_CLI_METRICS"))
+
+    if trace_path or metrics:
+        tracing.enable(_IMPORT_STARTED)
+        tracing.record("startup", _IMPORT_STARTED, time.perf_counter_ns())
+        ctx.call_on_close(lambda: tracing.finish(trace_path, metrics))
+
+    with tracing.span("load_env"):
+        load_env()
+
     if version:
         click.echo(version_())
     elif ctx.invoked_subcommand is None:
@@ -27,7 +165,8 @@ def cli(ctx, version):
 
 @cli.command("configure")
 @click.option("--api-key", "-k", help="Quicker way to setup API for the Gemini API.")
-def configure(api_key):
+@click.option("--api-keys", help="Comma separated keys of other projects, to spread requests over. Stored as GOOGLE_API_KEYS.")
+def configure(api_key, api_keys):
     """Configure the API key for the Gemini API."""
     click.echo("Configuring API key...")
 
@@ -47,6 +186,8 @@ def configure(api_key):
                                        prompt_suffix=": ", hide_input=True, confirmation_prompt=True)
 
                 env_map = {"GOOGLE_API_KEY": api_key}
+                if api_keys:
+                    env_map["GOOGLE_API_KEYS"] = api_keys
                 write_dotenv(env_map)
 
                 click.echo(
@@ -66,6 +207,8 @@ def configure(api_key):
                 )
         else:
             env_map = {"GOOGLE_API_KEY": api_key}
+            if api_keys:
+                env_map["GOOGLE_API_KEYS"] = api_keys
             write_dotenv(env_map)
             click.echo(
                 click.style("\nAPI key has been set successfully.", fg="green")
@@ -104,11 +247,28 @@ def verify():
 
 @cli.command("prompt")
 @click.option("--text", "-t", help="Text prompt to interact with Gemini")
-@click.option("--image", "-i", multiple=True, help="Image path to upload to Gemini. Can upload multiple images")
-@click.option("--file", "-f", multiple=True, help="File path to upload to Gemini. Can upload multiple files. Images, Videos, Audio, Documents. Files are stored upto 48 hours before being deleted automatically. Uses files API", type=click.Path(exists=True))
+@click.option("--image", "-i", multiple=True, help="Image path to send inline with the prompt. Can send multiple images", type=click.Path(exists=True, dir_okay=False))
+@click.option("--max-dimension", type=click.IntRange(min=0), default=DEFAULT_MAX_DIMENSION, show_default=True, help="Downscale --image images so neither side exceeds this many pixels; 0 keeps their size.")
+@click.option("--image-format", type=click.Choice(IMAGE_FORMATS), default="webp", show_default=True, help="Re-encode --image images, without their metadata, or send the original files.")
+@click.option("--image-quality", type=click.IntRange(1, 100), default=DEFAULT_IMAGE_QUALITY, show_default=True, help="Encoder quality of re-encoded images.")
+@click.option("--file", "-f", multiple=True, help="File, directory or glob pattern (e.g. 'photos/**/*.jpg') to upload to Gemini. Can upload multiple files. Images, Videos, Audio, Documents; files in directories are uploaded when their contents are of a supported type. Files are stored upto 48 hours before being deleted automatically. Uses files API")
 @click.option("--stream", "-s", is_flag=True, default=False, help="Get the response in chunks.")
+@click.option("--cache/--no-cache", default=False, envvar="LLM_CLI_CACHE", help="Serve repeated prompts from the local response cache. Can be enabled with LLM_CLI_CACHE=1.")
+@click.option("--refresh", is_flag=True, default=False, help="Ignore any cached response and store a fresh one.")
+@semantic_cache_options
+@click.option("--context-cache", help="Generate with this server-side context cache, by display name or resource name. See `lcli context create`.")
+@click.option("--map-reduce", is_flag=True, default=False, help="Carry out the --text task on a text input of any size, read from --input or stdin: chunks are processed concurrently and their results combined. Deterministic, and checkpointed so a rerun only retries failed chunks.")
+@click.option("--input", "input_file", type=click.File("r"), help="Text file for --map-reduce. Reads from stdin by default.")
+@click.option("--chunk-tokens", type=click.IntRange(min=100), default=DEFAULT_CHUNK_TOKENS, show_default=True, help="Approximate size of --map-reduce chunks, in tokens.")
+@click.option("--concurrency", type=click.IntRange(min=1), default=4, show_default=True, help="Maximum number of --map-reduce requests in flight.")
+@click.option("--dry-run", is_flag=True, default=False, help="Only report the input tokens of each part of the prompt, without sending it.")
+@click.option("--max-input-tokens", type=click.IntRange(min=1), help="Reject prompts over this many input tokens before they are sent.")
+@click.option("--truncate", is_flag=True, default=False, help="Truncate the text prompt to fit --max-input-tokens instead of rejecting it.")
+@model_option
+@cascade_option
+@resilience_options
 @click.pass_context
-def prompt(ctx, text, image, file, stream):
+def prompt(ctx, text, image, max_dimension, image_format, image_quality, file, stream, cache, refresh, semantic_cache, similarity, context_cache, map_reduce, input_file, chunk_tokens, concurrency, dry_run, max_input_tokens, truncate, model, cascade, retries, deadline, hedge):
     """Generate content from a prompt and/or other files."""
     if not (text or image or file):
         click.echo(
@@ -118,20 +278,142 @@ def prompt(ctx, text, image, file, stream):
         click.echo(ctx.get_help())
     else:
         try:
-            gemini = Gemini()
+            response = None
 
-            if text:
-                response = gemini.generate_content_from_text_prompt(text)
+            if text and not (image or file or semantic_cache or context_cache or map_reduce or dry_run or max_input_tokens or retries is not None or deadline or hedge is not None):
+                from llm_cli.utils.daemon import request_daemon
 
-                result = process_gemini_response(response)
+                # a running `lcli serve` daemon answers plain text prompts without the startup cost
+                with tracing.span("daemon_connect"):
+                    response = request_daemon({
+                        "op": "generate", "prompt": text, "stream": stream, "cache": cache, "refresh": refresh,
+                        **daemon_route("prompt", model, cascade, input_tokens=estimate_tokens(text)),
+                    })
 
-                click.echo(
-                    click.style(
-                        f"\n{result}", fg="bright_blue"
+            if map_reduce and (image or file):
+                raise ValueError("--map-reduce works on text input; it can't be combined with --image or --file.")
+
+            if response is None:
+                from llm_cli.utils.cache import ResponseCache
+                from llm_cli.utils.images import ImageOptions, pillow_available, prepare_images
+                from llm_cli.utils.ingest import discover_files
+                from llm_cli.utils.mapreduce import plan_map_reduce, run_map_reduce
+                from llm_cli.utils.resilience import ResiliencePolicy
+
+                if map_reduce and dry_run:
+                    plan = plan_map_reduce(input_file or click.get_text_stream("stdin"), text, max_tokens=chunk_tokens)
+                    click.echo(
+                        click.style(
+                            f"Map-reduce: {plan.chunks} chunk(s), about {plan.tokens} input tokens in {plan.chunks} request(s)"
+                            f"{', plus the reduce requests combining their results' if plan.chunks > 1 else ''}. Nothing was sent.",
+                            bold=True
+                        )
                     )
-                )
+                    return
+
+                # a context cache belongs to one model, which it decides
+                routed = {} if context_cache or dry_run else route_request(
+                    "map-reduce" if map_reduce else "prompt", model, cascade,
+                    input_tokens=chunk_tokens if map_reduce else estimate_tokens(text or ""),
+                    attachments=len(image) + len(file))
+
+                gemini = get_gemini(
+                    # greedy decoding, so reruns reproduce the same chunk results and answer
+                    generation_config={"temperature": 0} if map_reduce else {},
+                    cache=ResponseCache() if cache else None, refresh_cache=refresh,
+                    semantic_cache=get_semantic_cache(similarity) if semantic_cache else None,
+                    context_cache=context_cache, max_input_tokens=max_input_tokens, truncate_input=truncate,
+                    resilience_policy=ResiliencePolicy.from_env(max_retries=retries, deadline=deadline, hedge=hedge),
+                    **routed)
+
+                if map_reduce:
+                    def generate(prompt_text: str) -> str:
+                        return process_gemini_response(
+                            gemini.generate_content_from_text_prompt(prompt_text, semantic=False))
+
+                    scope = json.dumps([gemini.resolve_model().model_name, gemini.generation_config,
+                                        getattr(gemini.cached_content, "name", None), list(gemini.escalation)])
+                    result = run_map_reduce(
+                        generate, input_file or click.get_text_stream("stdin"), text,
+                        max_tokens=chunk_tokens, concurrency=concurrency, scope=scope)
+
+                    click.echo(
+                        click.style(
+                            f"Map-reduce: {result.chunks} chunk(s), {result.levels} reduce level(s), {result.requests} request(s) sent.", fg="bright_yellow"
+                        ),
+                        err=True
+                    )
+                    click.echo(
+                        click.style(
+                            f"\n{result.text}", fg="bright_blue"
+                        )
+                    )
+                    return
+
+                images = []
+                if image:
+                    if image_format != "original" and not pillow_available():
+                        click.echo(
+                            click.style(
+                                'Pillow is not installed, sending the images unprocessed. Install it with: pip install "llm-cli[images]"', fg="bright_yellow"
+                            ),
+                            err=True
+                        )
+
+                    images = prepare_images(image, ImageOptions(
+                        max_dimension=max_dimension or None, format=image_format, quality=image_quality))
+
+                # directories and globs are scanned lazily, feeding the uploads as files are found
+                discovered = discover_files(file)
 
-        except ValueError as e:
+                if dry_run:
+                    echo_token_report(gemini, text, (path for path, _ in discovered), zip(image, images))
+                    return
+
+                if file:
+                    click.echo(
+                        click.style(
+                            "Uploading file(s)...", fg="bright_yellow"
+                        ),
+                        err=True
+                    )
+
+                    # uploads run concurrently, then one poller waits for all of them to be ACTIVE
+                    uploaded = gemini.wait_for_active(gemini.upload_files(discovered))
+                    if not uploaded:
+                        raise ValueError(f"No supported files found in: {', '.join(file)}")
+
+                    click.echo(
+                        click.style(
+                            f"Uploaded {len(uploaded)} file(s).", fg="bright_yellow"
+                        ),
+                        err=True
+                    )
+
+                    response = gemini.generate_content_from_text_and_file_prompt(
+                        text or "", [*images, *uploaded], stream_response=stream)
+
+                elif images:
+                    response = gemini.generate_content_from_text_image_prompt(
+                        text or "", images, stream_response=stream)
+
+                elif text:
+                    response = gemini.generate_content_from_text_prompt(
+                        text, stream_response=stream)
+
+            if response is not None:
+                if stream:
+                    echo_stream(response, prefix="\n")
+                else:
+                    result = process_gemini_response(response)
+
+                    click.echo(
+                        click.style(
+                            f"\n{result}", fg="bright_blue"
+                        )
+                    )
+
+        except (ValueError, TimeoutError) as e:
             click.echo(
                 click.style(f"An error occurred: {str(e)}", fg="red")
             )
@@ -139,14 +421,58 @@ def prompt(ctx, text, image, file, stream):
 
 @cli.command("chat")
 @click.option("--start", "-s", is_flag=True, help="Start a chat session with Gemini.")
-def chat(start):
+@click.option("--stream/--no-stream", default=True, show_default=True, help="Print replies as they are generated.")
+@click.option("--resume", "-r", help="Resume a saved chat session by its id.")
+@click.option("--list", "-l", "list_sessions", is_flag=True, help="List saved chat sessions.")
+@click.option("--max-turns", type=click.IntRange(min=1), default=20, show_default=True, help="Maximum number of recent turns sent with each message.")
+@click.option("--max-tokens", type=click.IntRange(min=1), help="Maximum (estimated) number of history tokens sent with each message.")
+@click.option("--summarize/--no-summarize", default=False, show_default=True, help="Summarize turns that fall out of the history window instead of dropping them.")
+@semantic_cache_options
+@model_option
+def chat(start, stream, resume, list_sessions, max_turns, max_tokens, summarize, semantic_cache, similarity, model):
     """Start a chat session with Gemini."""
+    from llm_cli.utils.sessions import ChatSessionStore, HistoryPolicy
+
     try:
-        gemini = Gemini()
-        if start:
+        store = ChatSessionStore()
+
+        if list_sessions:
+            sessions = store.list()
+
+            if not sessions:
+                click.echo(
+                    click.style(
+                        "No chat sessions found.", fg="bright_yellow"
+                    )
+                )
+
+            for session in sessions:
+                updated = time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(session["updated"]))
+                click.echo(
+                    click.style(
+                        f"{session['id']}\t - \t{updated}\t - \t{session['turns']} turn(s)\t - \t{session['preview'][:50]}", fg="magenta"
+                    )
+                )
+            return
+
+        if start or resume:
+            # the semantic cache answers first turns only
+            gemini = get_gemini(
+                semantic_cache=get_semantic_cache(similarity) if semantic_cache else None,
+                **route_request("chat", model))
+            session = store.load(resume) if resume else store.create()
+            policy = HistoryPolicy(
+                max_turns=max_turns, max_tokens=max_tokens, summarize=summarize)
+
+            def summarize_turns(transcript: str) -> str:
+                response = gemini.generate_content_from_text_prompt(
+                    f"{CHAT_SUMMARY_INSTRUCTIONS}\n{transcript}", semantic=False)
+                return process_gemini_response(response)
+
             click.echo(
                 click.style(
-                    "Starting chat session with Gemini...", fg="bright_blue"
+                    f"{'Resuming' if resume else 'Starting'} chat session {session.id} with Gemini...", fg="bright_blue"
                 )
             )
 
@@ -154,15 +480,35 @@ def chat(start):
                 message = click.prompt(
                     click.style("You"), prompt_suffix=": ")
 
-                response = gemini.send_chat_message(message)
+                gemini.set_chat_history(
+                    session.history(policy, summarize_turns))
 
-                result = process_gemini_response(response)
+                response = gemini.send_chat_message(
+                    message, stream_response=stream)
 
-                click.echo(
-                    click.style(
-                        f"Gemini: {result}", fg="bright_blue"
+                if stream:
+                    try:
+                        echo_stream(response, prefix="Gemini: ")
+                    except KeyboardInterrupt:
+                        # a cut-short reply is dropped together with its message
+                        gemini.cancel_stream(response)
+                        click.echo(
+                            click.style(
+                                "\nReply interrupted, this turn was not saved.", fg="bright_yellow"
+                            )
+                        )
+                        continue
+                    result = response.text
+                else:
+                    result = process_gemini_response(response)
+
+                    click.echo(
+                        click.style(
+                            f"Gemini: {result}", fg="bright_blue"
+                        )
                     )
-                )
+
+                session.add_turn(message, result)
 
     except click.Abort:
         click.echo(
@@ -176,19 +522,40 @@ def chat(start):
 
 
 @cli.command("files")
-@click.option("--list", "-l", is_flag=True, help="List all files uploaded to Gemini.")
+@click.option("--list", "-l", is_flag=True, help="List all files uploaded to Gemini, from the local file index.")
+@click.option("--sync", is_flag=True, help="Refresh the local file index from Gemini.")
+@click.option("--mime", help="Only list files of this MIME type, e.g. 'video/mp4' or 'video'.")
+@click.option("--larger-than", callback=size_option, help="Only list files larger than this size, e.g. '10MB'.")
+@click.option("--expiring-within", callback=duration_option, help="Only list files expiring within this duration, e.g. '2h'.")
 @click.option("--upload", "-u", help="Upload a file to Gemini by providing the file path and a display name in that order", nargs=2, type=(click.Path(exists=True), str))
 @click.option("--delete", "-d", help="Delete a file from Gemini by providing the file name.")
 @click.option("--fetch", "-f", help="Fetch a file from Gemini by providing the file display name.")
-def files(list, upload, delete, fetch):
+def files(list, sync, mime, larger_than, expiring_within, upload, delete, fetch):
     """Basic file management commands for Gemini."""
+    from llm_cli.utils.file_index import FileIndex
+
     try:
-        gemini = Gemini()
+        index = FileIndex()
+        # listing is served from the local index, only an initial or explicit sync needs the API
+        needs_api = sync or upload or delete or fetch or (list and not index.last_sync)
+        gemini = get_gemini(file_index=index) if needs_api else None
 
-        if list:
-            response = gemini.list_files()
+        if sync or (list and not index.last_sync):
+            count = gemini.sync_file_index()
+
+            click.echo(
+                click.style(
+                    f"Synced {count} file(s) from Gemini.", fg="bright_blue"
+                ),
+                err=True
+            )
 
-            file = peek(response)
+        elif list and index.claim_refresh():
+            spawn_background(["files", "--sync"])
+
+        if list:
+            file = peek(iter(index.list(
+                mime_type=mime, larger_than=larger_than, expiring_within=expiring_within)))
 
             if file:
                 click.echo(
@@ -228,7 +595,7 @@ def files(list, upload, delete, fetch):
                     )
                     return
 
-                gemini.delete_file(file.display_name)
+                gemini.delete_file(file.name)
 
                 click.echo(
                     click.style(
@@ -265,17 +632,70 @@ def files(list, upload, delete, fetch):
 
 @cli.command("completion")
 @click.option("--command", "-c", help="Input command to complete.", required=True)
-@click.option("--context", "-ctx", help="Context for the command.", required=True)
-def completion(command, context):
+@click.option("--context", "-ctx", help="Context for the command. Required unless --suggest is given.")
+@click.option("--cache/--no-cache", default=False, envvar="LLM_CLI_CACHE", help="Serve repeated completions from the local response cache. Can be enabled with LLM_CLI_CACHE=1.")
+@click.option("--refresh", is_flag=True, default=False, help="Ignore any cached completion and store a fresh one.")
+@click.option("--history/--no-history", default=True, show_default=True, envvar="LLM_CLI_COMPLETION_HISTORY", help="Answer repeated completions from the local history of past completions, refreshing stale ones in the background.")
+@click.option("--suggest", is_flag=True, default=False, help="List past completions of commands starting with --command, best ranked first, without calling the model.")
+@click.option("--limit", type=click.IntRange(min=1), default=5, show_default=True, help="Maximum number of --suggest results.")
+@click.option("--refresh-history", is_flag=True, default=False, hidden=True)
+@model_option
+@cascade_option
+def completion(command, context, cache, refresh, history, suggest, limit, refresh_history, model, cascade):
     """Complete a command based on the context provided."""
+    from llm_cli.utils.completions import CompletionHistory
+    from llm_cli.utils.daemon import request_daemon
+
     try:
-        gemini = Gemini(system_instruction=COMMAND_COMPLETION_INSTRUCTIONS)
+        store = CompletionHistory()
 
-        response = gemini.generate_content_from_text_prompt(
-            f"`{command}` {{{context}}}"
-        )
+        if suggest:
+            for entry in store.suggest(command, limit):
+                click.echo(entry.text)
+            return
+
+        if context is None:
+            raise click.UsageError("Missing option '--context' / '-ctx'.")
+
+        entry = store.get(command, context) if history and not (refresh or refresh_history) else None
+
+        if entry is not None:
+            if store.is_stale(entry):
+                # answer now, and fetch a fresh completion for next time
+                store.claim_refresh(entry)
+                spawn_background(["completion", "-c", command, "-ctx", context, "--refresh-history"])
+
+            store.use(entry)
+            click.echo(
+                click.style(
+                    f"\n{entry.text}", fg="bright_blue"
+                )
+            )
+            return
+
+        prompt_text = f"`{command}` {{{context}}}"
+
+        response = request_daemon({
+            "op": "generate", "prompt": prompt_text, "system_instruction": COMMAND_COMPLETION_INSTRUCTIONS,
+            "cache": cache, "refresh": refresh,
+            **daemon_route("completion", model, cascade, input_tokens=estimate_tokens(prompt_text)),
+        })
+
+        if response is None:
+            from llm_cli.utils.cache import ResponseCache
+
+            routed = route_request("completion", model, cascade, input_tokens=estimate_tokens(prompt_text))
+            gemini = get_gemini(
+                system_instruction=COMMAND_COMPLETION_INSTRUCTIONS,
+                cache=ResponseCache() if cache else None, refresh_cache=refresh, **routed)
+
+            response = gemini.generate_content_from_text_prompt(prompt_text)
 
         text = process_gemini_response(response)
+        store.record(command, context, text, use=not refresh_history)
+
+        if refresh_history:
+            return
 
         click.echo(
             click.style(
@@ -287,3 +707,396 @@ def completion(command, context):
         click.echo(
             click.style(f"An error occurred: {str(e)}", fg="red")
         )
+
+
+@cli.command("tokens")
+@click.option("--text", "-t", help="Text prompt to count.")
+@click.option("--file", "-f", multiple=True, type=click.Path(exists=True, dir_okay=False), help="File to count. Can be given multiple times. Files not counted before are uploaded to be counted.")
+@click.option("--completion", is_flag=True, default=False, help="Include the system instruction used by `lcli completion`.")
+def tokens(text, file, completion):
+    """Count the input tokens of a prompt, per part, without sending it."""
+    if not (text or file):
+        click.echo(
+            click.style(
+                "Please provide atleast one of the following options: --text, --file.", fg="bright_red")
+        )
+        return
+
+    try:
+        gemini = get_gemini(
+            system_instruction=COMMAND_COMPLETION_INSTRUCTIONS if completion else "")
+
+        echo_token_report(gemini, text, file)
+
+    except (ValueError, TimeoutError) as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red")
+        )
+
+
+@cli.command("routing")
+@click.option("--since", callback=duration_option, default="7d", show_default=True, help="Only report requests from this recent period, e.g. '24h'.")
+@click.option("--clear", is_flag=True, default=False, help="Forget every recorded decision and request.")
+def routing(since, clear):
+    """Report model routing decisions and per-model latencies, to tune the routing thresholds."""
+    from llm_cli.utils.routing import RoutingLog, default_model, fast_model, short_prompt_tokens
+
+    routing_log = RoutingLog()
+
+    if clear:
+        routing_log.clear()
+        click.echo(click.style("Routing log cleared.", fg="bright_blue"))
+        return
+
+    click.echo(
+        f"Default model: {default_model()}, fast model: {fast_model()}, "
+        f"short prompts: up to {short_prompt_tokens()} tokens"
+    )
+
+    stats = routing_log.stats(time.time() - since)
+    if not stats:
+        click.echo(click.style("No requests recorded yet.", fg="bright_yellow"))
+        return
+
+    click.echo(click.style("\nLatency (to the first chunk of streamed responses):", bold=True))
+    for row in stats:
+        outcomes = ", ".join(f"{outcome} {count}" for outcome, count in sorted(row["outcomes"].items()))
+        click.echo(
+            f"{row['command']}\t{row['model']}{' (stream)' if row['stream'] else ''}\t"
+            f"{row['requests']} request(s)\tp50 {row['p50']:.2f}s\tp95 {row['p95']:.2f}s\t"
+            f"~{row['mean_prompt_tokens']:.0f} prompt tokens\t{outcomes}"
+        )
+
+    click.echo(click.style("\nDecisions:", bold=True))
+    for command, model, reason, count in routing_log.decisions(time.time() - since):
+        click.echo(f"{command}\t{model}\t{reason}\t{count}")
+
+
+@cli.group("cache")
+def cache_group():
+    """Manage the local response cache."""
+
+
+@cache_group.command("stats")
+def cache_stats():
+    """Show hit rate and size of the response cache."""
+    from llm_cli.utils.cache import ResponseCache
+
+    stats = ResponseCache().stats()
+
+    click.echo(f"Entries:     {stats['entries']}")
+    click.echo(f"Size:        {stats['size_bytes']} / {stats['max_bytes']} bytes")
+    click.echo(f"Hits:        {stats['hits']}")
+    click.echo(f"Misses:      {stats['misses']}")
+    click.echo(f"Hit rate:    {stats['hit_rate']:.1%}")
+    click.echo(f"Bytes saved: {stats['bytes_saved']}")
+
+
+@cache_group.command("clear")
+def cache_clear():
+    """Remove all cached responses, semantic cache entries, processed images and map-reduce checkpoints."""
+    from llm_cli.utils.cache import ResponseCache
+    from llm_cli.utils.images import ImageCache
+    from llm_cli.utils.mapreduce import Checkpoint
+
+    if click.confirm("Are you sure you want to clear the response cache?", default=True, prompt_suffix=": "):
+        ResponseCache().clear()
+        ImageCache().clear()
+        Checkpoint().clear()
+
+        from llm_cli.utils.semantic_cache import clear_semantic_cache
+        clear_semantic_cache()
+        click.echo(click.style("Response cache cleared.", fg="bright_blue"))
+
+
+@cli.group("context")
+def context_group():
+    """Manage server-side context caches of large shared prompt prefixes."""
+
+
+@context_group.command("create")
+@click.option("--name", "-n", required=True, help="Display name to refer to the cache by.")
+@click.option("--system-instruction", "-s", help="System instruction to cache.")
+@click.option("--file", "-f", multiple=True, help="File, directory or glob pattern to upload and cache. Can be given multiple times.")
+@click.option("--ttl", callback=duration_option, default=DEFAULT_CONTEXT_TTL, show_default=True, help="How long the server keeps the cache, e.g. '30m'.")
+@click.option("--model", help="Versioned model to cache for. Defaults to the versioned default model.")
+def context_create(name, system_instruction, file, ttl, model):
+    """Cache a system instruction and/or files on the server, reusing a live cache of the same prefix."""
+    from llm_cli.utils.ingest import discover_files
+
+    if not (system_instruction or file):
+        click.echo(
+            click.style(
+                "Please provide atleast one of the following options: --system-instruction, --file.", fg="bright_red")
+        )
+        return
+
+    try:
+        gemini = get_gemini()
+        files = list(discover_files(file))
+        if file and not files:
+            raise ValueError(f"No supported files found in: {', '.join(file)}")
+
+        options = {"model_name": model} if model else {}
+        cached, reused = gemini.create_context_cache(name, system_instruction or "", files, ttl=ttl, **options)
+
+        click.echo(
+            click.style(
+                f"{'Reused' if reused else 'Created'} context cache: {cached.display_name} ({cached.name}), "
+                f"{cached.usage_metadata.total_token_count} tokens, expires {cached.expire_time:%Y-%m-%d %H:%M} UTC",
+                fg="bright_blue"
+            )
+        )
+
+    except Exception as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red")
+        )
+
+
+@context_group.command("list")
+@click.option("--sync", is_flag=True, help="Refresh the local index from Gemini first.")
+def context_list(sync):
+    """List the live context caches, from the local index."""
+    from llm_cli.utils.context_cache import ContextIndex
+
+    try:
+        if sync:
+            count = get_gemini().sync_context_index()
+
+            click.echo(
+                click.style(
+                    f"Synced {count} context cache(s) from Gemini.", fg="bright_blue"
+                ),
+                err=True
+            )
+
+        contexts = ContextIndex().list()
+        if not contexts:
+            click.echo(
+                click.style(
+                    "No context caches found.", fg="bright_yellow"
+                )
+            )
+            return
+
+        click.echo(f"Display Name\t - \tName\t - \tModel\t - \tTokens\t - \tExpires")
+        for context in contexts:
+            expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(context.expire_time))
+            click.echo(
+                click.style(
+                    f"{context.display_name}\t - \t{context.name}\t - \t{context.model.removeprefix('models/')}\t - \t{context.tokens}\t - \t{expires}",
+                    fg="magenta"
+                )
+            )
+
+    except Exception as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red")
+        )
+
+
+@context_group.command("delete")
+@click.argument("name")
+def context_delete(name):
+    """Delete a context cache by its display name or resource name."""
+    try:
+        if click.confirm(f"Are you sure you want to delete context cache" + click.style(f" {name}", fg="green", blink=True) + "?", default=True, prompt_suffix=": "):
+            cached = get_gemini().delete_context_cache(name)
+
+            click.echo(
+                click.style(
+                    f"Deleted context cache: {cached.name} with display name: {cached.display_name}", fg="bright_blue"
+                )
+            )
+
+    except Exception as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red")
+        )
+
+
+@cli.command("serve")
+@click.option("--socket", "socket_path", type=click.Path(dir_okay=False), help="Unix socket to listen on. Defaults to $LLM_CLI_SOCKET, or llm_cli.sock in $XDG_RUNTIME_DIR or the cache directory.")
+def serve(socket_path):
+    """Run a warm daemon that other lcli commands use when it is running."""
+    from llm_cli.utils.cache import ResponseCache
+    from llm_cli.utils.daemon import DaemonServer, default_socket_path
+    from llm_cli.utils.routing import Route, RoutingLog, route
+
+    socket_path = socket_path or default_socket_path()
+
+    routing_log = RoutingLog()
+
+    def make_client(system_instruction, cache, refresh, model_name, escalation, command):
+        return get_gemini(
+            system_instruction=system_instruction,
+            cache=ResponseCache() if cache else None, refresh_cache=refresh,
+            model_name=model_name, escalation=escalation, routing_log=routing_log, command=command)
+
+    def log_route(command, model_name, reason, input_tokens, attachments):
+        routing_log.decision(command, Route(model_name, reason), input_tokens, attachments)
+
+    try:
+        server = DaemonServer(socket_path, make_client, iter_gemini_response, log_route)
+
+        # build the common clients up front so the first requests are warm too
+        server.client("", model_name=route("prompt", input_tokens=0).model)
+        server.client("", model_name=route("prompt").model)
+        server.client(COMMAND_COMPLETION_INSTRUCTIONS, model_name=route("completion").model, command="completion")
+
+    except (ValueError, OSError) as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red")
+        )
+        return
+
+    click.echo(
+        click.style(
+            f"Serving on {socket_path}. Press Ctrl-C to stop.", fg="bright_blue"
+        )
+    )
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo(
+            click.style("\nDaemon stopped.", fg="bright_yellow")
+        )
+    finally:
+        server.server_close()
+
+
+@cli.command("batch")
+@click.option("--input", "-i", "input_file", type=click.File("r"), default="-", help="JSONL file of prompts, one object with 'id' and 'text' per line. Reads from stdin by default.")
+@click.option("--output", "-o", "output_path", type=click.Path(dir_okay=False), help="JSONL file to append results to. Ids already completed in this file are skipped, so an interrupted run can be resumed. Writes to stdout by default.")
+@click.option("--concurrency", "-c", type=click.IntRange(min=1), default=4, show_default=True, help="Maximum number of requests in flight.")
+@click.option("--ordered/--as-completed", default=True, show_default=True, help="Write results in input order or as soon as they complete.")
+@click.option("--context-cache", help="Generate every prompt with this server-side context cache, by display name or resource name.")
+@model_option
+@cascade_option
+@resilience_options
+def batch(input_file, output_path, concurrency, ordered, context_cache, model, cascade, retries, deadline, hedge):
+    """Run many text prompts concurrently from a JSONL file."""
+    from llm_cli.utils.batch import completed_ids, read_jsonl, run_batch
+    from llm_cli.utils.resilience import ResiliencePolicy
+
+    try:
+        gemini = get_gemini(
+            context_cache=context_cache,
+            resilience_policy=ResiliencePolicy.from_env(max_retries=retries, deadline=deadline, hedge=hedge),
+            **({} if context_cache else route_request("batch", model, cascade)))
+
+        done = completed_ids(output_path) if output_path else set()
+        skipped = 0
+
+        def pending_records():
+            nonlocal skipped
+            for record in read_jsonl(input_file):
+                if str(record["id"]) in done:
+                    skipped += 1
+                else:
+                    yield record
+
+        def generate(text: str) -> str:
+            return process_gemini_response(gemini.generate_content_from_text_prompt(text))
+
+        output = open(output_path, "a") if output_path else None
+        succeeded = failed = 0
+
+        try:
+            for result in run_batch(generate, pending_records(), concurrency=concurrency, ordered=ordered):
+                line = json.dumps(result, ensure_ascii=False)
+
+                if output:
+                    output.write(line + "\n")
+                    output.flush()
+                else:
+                    click.echo(line)
+
+                if "error" in result:
+                    failed += 1
+                else:
+                    succeeded += 1
+        finally:
+            if output:
+                output.close()
+
+        click.echo(
+            click.style(
+                f"Batch finished: {succeeded} succeeded, {failed} failed, {skipped} skipped.",
+                fg="bright_yellow" if failed else "green"
+            ),
+            err=True
+        )
+
+        usage = gemini.usage.summary(gemini.model.model_name)
+        click.echo(
+            f"Tokens: {usage['prompt_tokens']} in, {usage['output_tokens']} out, "
+            f"{usage['tokens_per_second']:.1f} tokens/s, estimated cost ${usage['cost_usd']:.4f}",
+            err=True
+        )
+
+        if len(gemini.key_pool.members) > 1:
+            click.echo(
+                "Requests per API key: " + ", ".join(
+                    f"{label} {requests}" for label, requests in gemini.key_pool.summary().items()),
+                err=True
+            )
+
+        if usage["retries"] or usage["hedges"]:
+            click.echo(
+                f"Retries: {usage['retries']}, hedged requests: {usage['hedges']} ({usage['hedge_wins']} won by the duplicate)",
+                err=True
+            )
+
+    except ValueError as e:
+        click.echo(
+            click.style(f"An error occurred: {str(e)}", fg="red"), err=True
+        )
+
+
+@cli.command()
+@click.option("--scenario", "-s", "scenarios", multiple=True, type=click.Choice(BENCH_SCENARIOS), help="Scenario to run, may be repeated. Runs all by default.")
+@click.option("--concurrency", "-c", default=",".join(map(str, BENCH_CONCURRENCY)), show_default=True, help="Comma-separated concurrency levels.")
+@click.option("--output", "-o", "output_path", default="bench.json", show_default=True, type=click.Path(dir_okay=False, writable=True), help="Write the JSON report to this file.")
+@click.option("--suite", type=click.Path(exists=True, dir_okay=False), help="The benchmark suite to run. Defaults to tests/test_bench.py of this source checkout.")
+@click.pass_context
+def bench(ctx, scenarios, concurrency, output_path, suite):
+    """Benchmark the client against a local fake Gemini server."""
+    import subprocess
+    import sys
+
+    try:
+        levels = [int(level) for level in concurrency.split(",") if level.strip()]
+        if not levels or not set(levels) <= set(BENCH_CONCURRENCY):
+            raise ValueError
+    except ValueError:
+        raise click.BadParameter(
+            f"Expected levels out of {','.join(map(str, BENCH_CONCURRENCY))}.", param_hint="--concurrency")
+
+    # the benchmarks are the pytest-benchmark suite under tests/, which is not installed with the package
+    suite = suite or os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "tests", "test_bench.py")
+    if not os.path.isfile(suite):
+        click.echo(
+            click.style("An error occurred: tests/test_bench.py was not found; run from a source checkout or pass --suite.", fg="red"),
+            err=True
+        )
+        ctx.exit(1)
+
+    tests = [
+        f"{os.path.abspath(suite)}::test_bench[{scenario}-{level}]"
+        for scenario in scenarios or BENCH_SCENARIOS for level in levels
+    ]
+    finished = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-m", "bench", *tests,
+         "--benchmark-json", os.path.abspath(output_path)]
+    )
+    if finished.returncode == 0:
+        click.echo(click.style(f"Benchmark report written to {output_path}", fg="green"), err=True)
+    ctx.exit(finished.returncode)
@@ -0,0 +1,112 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, TextIO
+
+
+def read_jsonl(stream: TextIO) -> Iterator[dict]:
+    """
+        Lazily read prompt records from a JSONL stream.
+
+        Each line is an object with a "text" (or "prompt") key and an optional "id".
+        Lines without an id are numbered by their (1-based) line number. Malformed
+        lines are yielded with an "error" key so the run can report them in place.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"id": line_number, "error": f"Invalid JSON: {str(e)}"}
+            continue
+
+        if not isinstance(record, dict):
+            yield {"id": line_number, "error": "Each line must be a JSON object."}
+            continue
+
+        record.setdefault("id", line_number)
+        text = record.get("text", record.get("prompt"))
+
+        if not isinstance(text, str) or not text.strip():
+            record["error"] = "Missing a non-empty 'text' field."
+        else:
+            record["text"] = text
+
+        yield record
+
+
+def completed_ids(output_path: str) -> set[str]:
+    """Collect the ids of records that already succeeded in an existing output file."""
+    done = set()
+
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a run killed mid-write can leave a truncated last line
+                continue
+
+            if isinstance(record, dict) and "error" not in record and "id" in record:
+                done.add(str(record["id"]))
+
+    return done
+
+
+def _run_record(fn: Callable[[str], str], record: dict) -> dict:
+    """Run a single record, turning any failure into a per-line error."""
+    if "error" in record:
+        return {"id": record["id"], "error": record["error"]}
+
+    try:
+        return {"id": record["id"], "text": fn(record["text"])}
+    except Exception as e:
+        return {"id": record["id"], "error": str(e) or e.__class__.__name__}
+
+
+def run_batch(fn: Callable[[str], str], records: Iterable[dict], concurrency: int = 4, ordered: bool = True) -> Iterator[dict]:
+    """
+        Run `fn` over the records with at most `concurrency` requests in flight.
+
+        Results are yielded in input order when `ordered` is set, otherwise as soon as
+        they complete. Only a small window of records is read ahead, so arbitrarily
+        large inputs are processed in constant memory.
+    """
+    records = iter(records)
+    window = concurrency * 2
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def submit_next() -> Any:
+            record = next(records, None)
+            if record is None:
+                return None
+            return executor.submit(_run_record, fn, record)
+
+        if ordered:
+            pending = deque()
+            while len(pending) < window and (future := submit_next()):
+                pending.append(future)
+
+            while pending:
+                yield pending.popleft().result()
+                if future := submit_next():
+                    pending.append(future)
+        else:
+            pending = set()
+            while len(pending) < window and (future := submit_next()):
+                pending.add(future)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    if next_future := submit_next():
+                        pending.add(next_future)
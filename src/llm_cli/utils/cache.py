@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+from .helpers import connect_db, get_cache_dir, parse_duration, parse_size
+
+DEFAULT_CACHE_MAX_BYTES = "100MB"
+DEFAULT_CACHE_TTL = "7d"
+
+
+def _content_fingerprint(part: Any) -> Any:
+    """Reduce a content part to something stable and hashable."""
+    if isinstance(part, str):
+        return part
+
+    if isinstance(part, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(part).hexdigest()}
+
+    if isinstance(part, dict):
+        # inline blobs such as {"mime_type": ..., "data": ...}
+        return {
+            key: _content_fingerprint(value) if isinstance(value, (bytes, bytearray, dict, list)) else value
+            for key, value in sorted(part.items())
+        }
+
+    if isinstance(part, (list, tuple)):
+        return [_content_fingerprint(item) for item in part]
+
+    # uploaded files: identified by their resource name and content hash
+    sha256_hash = getattr(part, "sha256_hash", b"")
+    if isinstance(sha256_hash, (bytes, bytearray)):
+        sha256_hash = sha256_hash.hex()
+
+    return {"file": getattr(part, "name", repr(part)), "sha256": sha256_hash}
+
+
+def content_hash(part: Any) -> str:
+    """Hash a single content part (text, inline blob or uploaded file)."""
+    return hashlib.sha256(
+        json.dumps(_content_fingerprint(part), sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def make_cache_key(model_name: str, system_instruction: str, generation_config: Optional[dict], contents: Iterable[Any]) -> str:
+    """Build a content-addressed cache key for a generate request."""
+    payload = {
+        "model": model_name,
+        "system_instruction": system_instruction or "",
+        "generation_config": generation_config or {},
+        "contents": [_content_fingerprint(part) for part in contents],
+    }
+
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ResponseCache:
+    """
+        An on-disk, content-addressed cache of generate responses.
+
+        Entries live in a SQLite database under the llm-cli cache directory, so parallel
+        lcli processes can share it. The cache is bounded in size (least recently used
+        entries are evicted first) and entries expire after a time-to-live.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.path = path or os.path.join(get_cache_dir(), "responses.db")
+        self.max_bytes = max_bytes if max_bytes is not None else parse_size(
+            os.environ.get("LLM_CLI_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+        self.ttl = ttl if ttl is not None else parse_duration(
+            os.environ.get("LLM_CLI_CACHE_TTL", DEFAULT_CACHE_TTL))
+
+        self.lock = threading.Lock()  # one connection is shared by batch workers
+        self.db = connect_db(self.path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('bytes_saved', 0);
+            """
+        )
+
+    def _bump(self, **counters: int) -> None:
+        for name, value in counters.items():
+            self.db.execute(
+                "UPDATE stats SET value = value + ? WHERE name = ?", (value, name))
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get a cached response, or None on a miss or an expired entry."""
+        now = time.time()
+
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, size, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[2] > self.ttl:
+                if row is not None:
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bump(misses=1)
+                return None
+
+            self.db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._bump(hits=1, bytes_saved=row[1])
+
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        """Store a response and evict expired and least recently used entries."""
+        data = json.dumps(value, default=str)
+        size = len(data.encode("utf-8"))
+
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, data, size, now, now))
+                self.db.execute(
+                    "DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+
+                total = self.db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+                if total > self.max_bytes:
+                    for old_key, old_size in self.db.execute(
+                            "SELECT key, size FROM entries ORDER BY accessed ASC").fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self.db.execute(
+                            "DELETE FROM entries WHERE key = ?", (old_key,))
+                        total -= old_size
+
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        """Get hit/miss counters and the current size of the cache."""
+        counters = dict(self.db.execute("SELECT name, value FROM stats"))
+        entries, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = counters["hits"] + counters["misses"]
+
+        return {
+            **counters,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        self.db.execute("DELETE FROM entries")
+        self.db.execute("UPDATE stats SET value = 0")
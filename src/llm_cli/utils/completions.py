@@ -0,0 +1,329 @@
+"""
+A local history of command completions, so `lcli completion` answers repeats without
+a model call.
+
+Completions are keyed by the (whitespace-normalized) command and context. The history
+lives in two files under the cache directory:
+
+- `index`: a compact sorted index, read through mmap and binary searched in place, so
+  opening it costs the same for ten entries or ten thousand. Layout (little endian):
+  `b"LCH1"`, the entry count (u32), one u32 offset per entry in key order, then the
+  entries, each `key length (u16), text length (u32), uses (u32), last used (f64),
+  fetched (f64)` followed by the UTF-8 key and completion.
+- `journal`: JSON lines appended since the index was written, one per new completion
+  or use. Past `JOURNAL_MAX_ENTRIES` lines it is merged into a new index, keeping the
+  `LLM_CLI_COMPLETION_HISTORY_MAX` best ranked entries.
+
+Entries are ranked by uses, decayed by the time since their last use.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Callable, NamedTuple, Optional
+
+from .helpers import get_cache_dir, parse_duration
+
+DEFAULT_HISTORY_MAX_ENTRIES = 10000
+DEFAULT_HISTORY_TTL = "7d"
+
+# Journal lines replayed on top of the index before it is rewritten.
+JOURNAL_MAX_ENTRIES = 256
+
+# A use is worth half as much after this long.
+RECENCY_HALF_LIFE = 14 * 86400
+
+# How long a background refresh of a stale entry may take before another one is started.
+REFRESH_CLAIM_SECONDS = 60
+
+# A compaction lock older than this was left by a crashed process.
+STALE_LOCK_SECONDS = 60
+
+_MAGIC = b"LCH1"
+_COUNT = struct.Struct("<I")
+_ENTRY = struct.Struct("<HIIdd")
+_SEPARATOR = "\x00"
+
+
+class Completion(NamedTuple):
+    command: str
+    context: str
+    text: str
+    uses: int
+    last_used: float
+    fetched: float
+
+    def score(self, now: float) -> float:
+        return self.uses * 0.5 ** (max(now - self.last_used, 0) / RECENCY_HALF_LIFE)
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.split())
+
+
+def make_key(command: str, context: str = "") -> str:
+    return f"{_normalize(command)}{_SEPARATOR}{_normalize(context)}"
+
+
+class _Index:
+    """Read-only view of an index file."""
+
+    def __init__(self, path: str):
+        self.map = None
+        self.count = 0
+
+        try:
+            with open(path, "rb") as file:
+                if os.fstat(file.fileno()).st_size > len(_MAGIC) + _COUNT.size:
+                    self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+
+        if self.map is not None and self.map[:len(_MAGIC)] == _MAGIC:
+            self.count = _COUNT.unpack_from(self.map, len(_MAGIC))[0]
+
+    def _offset(self, position: int) -> int:
+        return _COUNT.unpack_from(self.map, len(_MAGIC) + _COUNT.size * (position + 1))[0]
+
+    def key(self, position: int) -> bytes:
+        offset = self._offset(position)
+        key_length = _ENTRY.unpack_from(self.map, offset)[0]
+        start = offset + _ENTRY.size
+        return self.map[start:start + key_length]
+
+    def entry(self, position: int) -> tuple[str, Completion]:
+        offset = self._offset(position)
+        key_length, text_length, uses, last_used, fetched = _ENTRY.unpack_from(self.map, offset)
+        start = offset + _ENTRY.size
+        key = self.map[start:start + key_length].decode("utf-8")
+        text = self.map[start + key_length:start + key_length + text_length].decode("utf-8")
+        command, _, context = key.partition(_SEPARATOR)
+        return key, Completion(command, context, text, uses, last_used, fetched)
+
+    def find(self, key: str) -> Optional[Completion]:
+        encoded = key.encode("utf-8")
+        position = bisect.bisect_left(_Keys(self), encoded)
+        if position < self.count and self.key(position) == encoded:
+            return self.entry(position)[1]
+        return None
+
+    def prefix(self, prefix: str) -> dict[str, Completion]:
+        encoded = prefix.encode("utf-8")
+        position = bisect.bisect_left(_Keys(self), encoded)
+        entries = {}
+
+        while position < self.count and self.key(position).startswith(encoded):
+            key, entry = self.entry(position)
+            entries[key] = entry
+            position += 1
+
+        return entries
+
+    def entries(self) -> dict[str, Completion]:
+        return dict(self.entry(position) for position in range(self.count))
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+
+
+class _Keys:
+    """The keys of an index as a lazy sequence, for bisect."""
+
+    def __init__(self, index: _Index):
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.index.count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.index.key(position)
+
+
+def _apply(event: dict, entries: dict[str, Completion], claims: dict[str, float], find: Callable[[str], Optional[Completion]]) -> None:
+    """Apply one journal event to `entries`, looking up entries it does not hold with `find`."""
+    key, now = event["key"], event["time"]
+
+    if event.get("claim"):
+        claims[key] = now
+        return
+
+    entry = entries.get(key) or find(key)
+    if entry is None and "text" not in event:
+        return
+
+    command, _, context = key.partition(_SEPARATOR)
+    uses = event.get("uses", 1)
+
+    entries[key] = Completion(
+        command, context,
+        event["text"] if "text" in event else entry.text,
+        (entry.uses if entry else 0) + uses,
+        now if uses or entry is None else entry.last_used,
+        now if "text" in event else entry.fetched,
+    )
+
+
+def _replay(journal: str, entries: dict[str, Completion], claims: dict[str, float], find: Callable[[str], Optional[Completion]]) -> int:
+    """Apply the events of a journal file, returning how many there were."""
+    try:
+        with open(journal, "r", encoding="utf-8") as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return 0
+
+    count = 0
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue  # a line cut short by a crash
+
+        _apply(event, entries, claims, find)
+        count += 1
+
+    return count
+
+
+def _write_index(path: str, entries: dict[str, Completion]) -> None:
+    """Write entries as a new index, replacing the old one atomically."""
+    keys = sorted(entries, key=lambda key: key.encode("utf-8"))
+    records, offsets = [], []
+    offset = len(_MAGIC) + _COUNT.size * (len(keys) + 1)
+
+    for key in keys:
+        entry = entries[key]
+        encoded_key, encoded_text = key.encode("utf-8"), entry.text.encode("utf-8")
+        record = _ENTRY.pack(len(encoded_key), len(encoded_text), entry.uses, entry.last_used, entry.fetched)
+        records.append(record + encoded_key + encoded_text)
+        offsets.append(offset)
+        offset += len(records[-1])
+
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(_MAGIC + _COUNT.pack(len(keys)))
+        file.write(b"".join(_COUNT.pack(offset) for offset in offsets))
+        file.write(b"".join(records))
+    os.replace(temporary, path)
+
+
+class CompletionHistory:
+    """Past completions, looked up by exact command and context or by command prefix."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.path = path or get_cache_dir("completions")
+        self.index_path = os.path.join(self.path, "index")
+        self.journal_path = os.path.join(self.path, "journal")
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.environ.get("LLM_CLI_COMPLETION_HISTORY_MAX") or DEFAULT_HISTORY_MAX_ENTRIES)
+        self.ttl = ttl if ttl is not None else parse_duration(
+            os.environ.get("LLM_CLI_COMPLETION_TTL") or DEFAULT_HISTORY_TTL)
+
+        self._load()
+
+    def _load(self) -> None:
+        self.index = _Index(self.index_path)
+        self.overlay, self.claims, self.journal_entries = {}, {}, 0
+
+        # a journal being compacted by another process is still part of the history
+        for journal in (f"{self.journal_path}.compacting", self.journal_path):
+            self.journal_entries += _replay(journal, self.overlay, self.claims, self.index.find)
+
+    def _append(self, event: dict) -> None:
+        _apply(event, self.overlay, self.claims, self.index.find)
+
+        # one write to an O_APPEND descriptor, so concurrent processes never interleave lines
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        descriptor = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(descriptor, line)
+        finally:
+            os.close(descriptor)
+
+        self.journal_entries += 1
+        if self.journal_entries > JOURNAL_MAX_ENTRIES:
+            self.compact()
+
+    def get(self, command: str, context: str) -> Optional[Completion]:
+        """The completion for exactly this command and context."""
+        key = make_key(command, context)
+        return self.overlay.get(key) or self.index.find(key)
+
+    def suggest(self, prefix: str, limit: int = 5) -> list[Completion]:
+        """Completions of commands starting with `prefix`, best ranked first."""
+        prefix = _normalize(prefix)
+        entries = self.index.prefix(prefix)
+        entries.update((key, entry) for key, entry in self.overlay.items() if key.startswith(prefix))
+
+        now = time.time()
+        return sorted(entries.values(), key=lambda entry: entry.score(now), reverse=True)[:limit]
+
+    def is_stale(self, entry: Completion) -> bool:
+        """Whether an entry is older than the TTL and no refresh of it is under way."""
+        now = time.time()
+        key = make_key(entry.command, entry.context)
+        return now - entry.fetched > self.ttl and now - self.claims.get(key, 0) > REFRESH_CLAIM_SECONDS
+
+    def record(self, command: str, context: str, text: str, use: bool = True) -> None:
+        """Store a completion from the model; `use` counts it as served."""
+        if text.strip():
+            self._append({"key": make_key(command, context), "text": text, "time": time.time(), "uses": int(use)})
+
+    def use(self, entry: Completion) -> None:
+        """Count a completion served from the history."""
+        self._append({"key": make_key(entry.command, entry.context), "time": time.time()})
+
+    def claim_refresh(self, entry: Completion) -> None:
+        """Note that a refresh of a stale entry has started, so others don't start one too."""
+        self._append({"key": make_key(entry.command, entry.context), "time": time.time(), "claim": True})
+
+    def compact(self) -> None:
+        """Merge the journal into a new index, evicting the lowest ranked entries past the limit."""
+        lock = os.path.join(self.path, "compact.lock")
+
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.remove(lock)
+        except OSError:
+            pass
+
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return  # another process is compacting
+
+        compacting = f"{self.journal_path}.compacting"
+        try:
+            if not os.path.exists(compacting):
+                os.replace(self.journal_path, compacting)
+
+            # reread the index, since other processes may have rewritten it since this one loaded
+            index = _Index(self.index_path)
+            entries = index.entries()
+            index.close()
+            _replay(compacting, entries, {}, lambda key: None)
+
+            now = time.time()
+            kept = sorted(entries.items(), key=lambda item: item[1].score(now), reverse=True)
+            _write_index(self.index_path, dict(kept[:self.max_entries]))
+            os.remove(compacting)
+        except FileNotFoundError:
+            pass  # nothing to compact
+        finally:
+            os.remove(lock)
+
+        self.index.close()
+        self._load()
+
+    def clear(self) -> None:
+        self.index.close()
+        for path in (self.index_path, self.journal_path, f"{self.journal_path}.compacting"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self._load()
@@ -30,6 +30,36 @@ SUPPORTED_AUDIO_MIME_TYPES = [
     "audio/flac",
 ]
 
+SUPPORTED_DOCUMENT_MIME_TYPES = [
+    "application/pdf",
+]
+
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+
+# Option defaults, kept here so the CLI can declare its options without importing the
+# modules that use them
+AUTO_MODEL = "auto"
+IMAGE_FORMATS = ("webp", "jpeg", "original")
+DEFAULT_MAX_DIMENSION = 1536
+DEFAULT_IMAGE_QUALITY = 80
+DEFAULT_CONTEXT_TTL = "1h"
+DEFAULT_CHUNK_TOKENS = 16000
+
+
+# Prices in USD per million tokens as (input, output), for prompts up to 128k tokens
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-pro": (3.50, 10.50),
+}
+
+
+# Scenarios and concurrency levels of the benchmarks `lcli bench` runs from tests/test_bench.py
+BENCH_SCENARIOS = ("prompt", "chat", "batch", "upload")
+BENCH_CONCURRENCY = (1, 4, 16)
+
 
 # System Instructions
 COMMAND_COMPLETION_INSTRUCTIONS = """
@@ -45,3 +75,23 @@ The output should not have any formatting given in the input command, no escape
 
 The command returned should be a valid command that can be run on the system provided, and should be returned as a string without any additional formatting.
 """
+
+CHAT_SUMMARY_INSTRUCTIONS = """
+Summarize the conversation below between a user and an assistant so that it can replace the original messages as context for continuing the conversation.
+
+Keep every fact, decision, name, number, code identifier and open question that later messages might refer to. Drop greetings, repetition and filler.
+Write the summary as short plain-text bullet points, without any preamble.
+"""
+
+MAP_INSTRUCTIONS = """
+You are given one part of a larger input that was split into consecutive parts, and a task about the whole input.
+
+Carry out the task on this part only. Report what this part contains that is relevant to the task, concisely, keeping the specifics (names, numbers, quotes, identifiers) that a combined answer may need.
+If nothing in this part is relevant, reply with exactly: NOTHING RELEVANT
+"""
+
+REDUCE_INSTRUCTIONS = """
+You are given partial results of a task, each computed on a consecutive part of a larger input, in input order, and the task itself.
+
+Combine them into one result for the task, as if it had been computed on the whole input: merge duplicates, add up counts and keep the specifics. Reply with the combined result only, without mentioning the parts.
+"""
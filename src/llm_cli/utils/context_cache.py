@@ -0,0 +1,137 @@
+"""
+Local bookkeeping of server-side context caches (`cachedContents`).
+
+A context cache holds a large shared prompt prefix, a system instruction and/or
+uploaded files, that the server keeps processed until it expires. Every cache created
+through lcli is recorded with its display name, model, expiry and a hash of its prefix,
+so a cache can be named in prompts and one that is still live is reused when the same
+prefix shows up again instead of being created twice.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional
+
+from .file_index import EXPIRY_MARGIN_SECONDS, _timestamp
+from .helpers import connect_db, get_cache_dir
+
+if TYPE_CHECKING:
+    from google.generativeai.caching import CachedContent
+
+
+def prefix_hash(system_instruction: str = "", content_hashes: Iterable[str] = ()) -> str:
+    """Identify a cached prefix by its system instruction and the hashes of its contents."""
+    return hashlib.sha256(json.dumps(
+        [system_instruction or "", list(content_hashes)]).encode("utf-8")).hexdigest()
+
+
+def model_matches(cache_model: str, model_name: str) -> bool:
+    """Whether a cache made for `cache_model` serves `model_name`, e.g. gemini-1.5-flash-002 for gemini-1.5-flash."""
+    cache_model, model_name = cache_model.removeprefix("models/"), model_name.removeprefix("models/")
+    return cache_model == model_name or re.fullmatch(rf"{re.escape(model_name)}-\d{{3}}", cache_model) is not None
+
+
+class IndexedContext(NamedTuple):
+    """A context cache as recorded in the local index."""
+    name: str
+    display_name: str
+    model: str
+    prefix: str
+    tokens: int
+    expire_time: float
+
+
+class ContextIndex:
+    """The context caches created through lcli, by name, display name and prefix."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.lock = threading.RLock()
+        self.db = connect_db(path or os.path.join(get_cache_dir(), "contexts.db"))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS contexts (
+                name TEXT PRIMARY KEY,
+                display_name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prefix TEXT,
+                tokens INTEGER NOT NULL,
+                expire_time REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS contexts_prefix ON contexts (prefix);
+            CREATE INDEX IF NOT EXISTS contexts_display_name ON contexts (display_name);
+            """
+        )
+
+    def _live(self, rows) -> Optional[IndexedContext]:
+        # the latest expiring first; don't hand out a cache that could expire mid-request
+        for row in rows:
+            context = IndexedContext(*row)
+            if context.expire_time > time.time() + EXPIRY_MARGIN_SECONDS:
+                return context
+        return None
+
+    def record(self, cached: "CachedContent", prefix: Optional[str] = None) -> None:
+        """Remember a created (or updated) cache, keeping a known prefix hash."""
+        usage = getattr(cached, "usage_metadata", None)
+
+        with self.lock:
+            if prefix is None:
+                row = self.db.execute("SELECT prefix FROM contexts WHERE name = ?", (cached.name,)).fetchone()
+                prefix = row[0] if row else None
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO contexts VALUES (?, ?, ?, ?, ?, ?)",
+                (cached.name, cached.display_name or "", cached.model, prefix,
+                 getattr(usage, "total_token_count", 0) or 0, _timestamp(cached.expire_time))
+            )
+
+    def find(self, name: str) -> Optional[IndexedContext]:
+        """A live cache by its resource name (`cachedContents/...`) or display name."""
+        with self.lock:
+            return self._live(self.db.execute(
+                "SELECT * FROM contexts WHERE name = ? OR display_name = ? ORDER BY expire_time DESC", (name, name)))
+
+    def find_prefix(self, prefix: str, model_name: Optional[str] = None) -> Optional[IndexedContext]:
+        """A live cache of this prefix, made for `model_name` when one is given."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM contexts WHERE prefix = ? ORDER BY expire_time DESC", (prefix,)).fetchall()
+
+        return self._live(row for row in rows if model_name is None or model_matches(row[2], model_name))
+
+    def list(self) -> list[IndexedContext]:
+        """Every recorded cache that has not expired, dropping the expired ones."""
+        with self.lock:
+            self.db.execute("DELETE FROM contexts WHERE expire_time < ?", (time.time(),))
+            return [IndexedContext(*row) for row in self.db.execute(
+                "SELECT * FROM contexts ORDER BY display_name, expire_time")]
+
+    def forget(self, name: str) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM contexts WHERE name = ?", (name,))
+
+    def sync(self, caches: Iterable["CachedContent"]) -> int:
+        """Replace the index with a full listing from the server, keeping known prefixes."""
+        caches = list(caches)
+
+        with self.lock:
+            known = dict(self.db.execute("SELECT name, prefix FROM contexts"))
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM contexts")
+                for cached in caches:
+                    usage = getattr(cached, "usage_metadata", None)
+                    self.db.execute(
+                        "INSERT INTO contexts VALUES (?, ?, ?, ?, ?, ?)",
+                        (cached.name, cached.display_name or "", cached.model, known.get(cached.name),
+                         getattr(usage, "total_token_count", 0) or 0, _timestamp(cached.expire_time))
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+        return len(caches)
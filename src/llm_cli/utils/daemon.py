@@ -0,0 +1,182 @@
+"""
+A warm `lcli serve` daemon and the thin client the CLI uses to talk to it.
+
+The daemon keeps Gemini clients (one per system instruction and model) and their connections
+alive between invocations. Requests and responses are JSON lines over a unix socket:
+the client sends one request line and reads `{"chunk": ...}` lines followed by
+`{"done": true}`, or a single `{"error": ...}` line.
+
+The client side must stay cheap to import: it never imports the SDK.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import Callable, Iterator, Optional
+
+from .helpers import get_cache_dir
+
+
+def default_socket_path() -> str:
+    """Get the daemon socket path, honouring `LLM_CLI_SOCKET` and `XDG_RUNTIME_DIR`."""
+    if os.environ.get("LLM_CLI_SOCKET"):
+        return os.environ["LLM_CLI_SOCKET"]
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    return os.path.join(runtime_dir or get_cache_dir(), "llm_cli.sock")
+
+
+class RemoteResponse:
+    """A response streamed back from the daemon, yielding text chunks as they arrive."""
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self._lines = sock.makefile("r", encoding="utf-8")
+        self._chunks = []
+        self._done = False
+
+    def __iter__(self) -> Iterator[str]:
+        if self._done:
+            yield from self._chunks
+            return
+
+        try:
+            for line in self._lines:
+                message = json.loads(line)
+
+                if "error" in message:
+                    raise ValueError(message["error"])
+                if message.get("done"):
+                    break
+
+                self._chunks.append(message["chunk"])
+                yield message["chunk"]
+        finally:
+            self._done = True
+            self._lines.close()
+            self._sock.close()
+
+    @property
+    def text(self) -> str:
+        """The full text of the response, reading the rest of the stream if needed."""
+        for _ in self:
+            pass
+        return "".join(self._chunks)
+
+
+def request_daemon(request: dict, socket_path: Optional[str] = None) -> Optional[RemoteResponse]:
+    """
+        Send a request to a running daemon.
+
+        Returns None when no daemon is listening, so the caller can fall back to
+        running the request in-process.
+    """
+    if os.environ.get("LLM_CLI_NO_DAEMON") or not hasattr(socket, "AF_UNIX"):
+        return None
+
+    socket_path = socket_path or default_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+    except OSError:
+        sock.close()
+        return None
+
+    return RemoteResponse(sock)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def _send(self, message: dict) -> None:
+        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            for chunk in self.server.handle_request_message(request):
+                self._send({"chunk": chunk})
+            self._send({"done": True})
+
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away
+        except Exception as e:
+            try:
+                self._send({"error": str(e) or e.__class__.__name__})
+            except OSError:
+                pass
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Serves generate requests with warm, shared Gemini clients.
+
+        `make_client(system_instruction, cache, refresh, model_name, escalation, command)`
+        builds a client the first time a combination is requested; it is reused by every
+        later request. The command only labels the client's requests in the routing log.
+        `log_route(command, model_name, reason, input_tokens, attachments)` records the
+        routing decisions clients made, so they don't open the routing log themselves.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, make_client: Callable, stream_text: Callable, log_route: Optional[Callable] = None):
+        self.socket_path = socket_path
+        self.make_client = make_client
+        self.stream_text = stream_text
+        self.log_route = log_route
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise ValueError(f"A daemon is already listening on {socket_path}.")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)  # left behind by a daemon that died
+            finally:
+                probe.close()
+
+        # only the owner may connect, from the moment the socket exists
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def client(self, system_instruction: str = "", cache: bool = False, refresh: bool = False, model_name: Optional[str] = None, escalation: tuple[str, ...] = (), command: str = "prompt"):
+        """Get the warm client for a configuration, creating it on first use."""
+        key = (system_instruction, cache, refresh, model_name, escalation, command)
+
+        with self.clients_lock:
+            if key not in self.clients:
+                self.clients[key] = self.make_client(*key)
+            return self.clients[key]
+
+    def handle_request_message(self, request: dict) -> Iterator[str]:
+        if request.get("op") != "generate":
+            raise ValueError(f"Unsupported operation: {request.get('op')}")
+
+        command = request.get("command", "prompt")
+        gemini = self.client(
+            request.get("system_instruction", ""), bool(request.get("cache")), bool(request.get("refresh")),
+            request.get("model"), tuple(request.get("escalation", ())), command)
+
+        if self.log_route is not None and request.get("reason"):
+            self.log_route(command, request.get("model"), request["reason"],
+                           request.get("input_tokens"), request.get("attachments", 0))
+
+        response = gemini.generate_content_from_text_prompt(
+            request["prompt"], stream_response=bool(request.get("stream")))
+
+        return self.stream_text(response)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional
+
+from .helpers import connect_db, get_cache_dir
+
+if TYPE_CHECKING:
+    from google.generativeai.types import File
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Don't reuse a remote file that is about to expire, a prompt referencing it could outlive it.
+EXPIRY_MARGIN_SECONDS = 15 * 60
+
+# How old the local file listing may get before a background refresh is started.
+FILE_INDEX_STALE_SECONDS = 10 * 60
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute the sha256 of a file chunk by chunk, without reading it into memory."""
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    with open(path, "rb") as file:
+        while read := file.readinto(buffer):
+            digest.update(view[:read])
+
+    return digest.hexdigest()
+
+
+def _timestamp(value) -> float:
+    """Convert a proto datetime to an epoch timestamp, 0 when unset."""
+    try:
+        return value.timestamp() if value else 0.0
+    except (AttributeError, OverflowError, ValueError):
+        return 0.0
+
+
+def files_db_path() -> str:
+    """Path of the local database describing files uploaded to the Files API."""
+    return os.path.join(get_cache_dir(), "files.db")
+
+
+class UploadIndex:
+    """
+        A local index from file content (sha256 and size), display name and MIME type to the
+        remote file it was uploaded as.
+
+        Lets repeated uploads of identical bytes under the same name and type reuse the remote
+        copy while it is still live.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.lock = threading.RLock()  # shared by concurrent upload workers
+        self.db = connect_db(path or files_db_path())
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                display_name TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                expiration_time REAL NOT NULL,
+                PRIMARY KEY (sha256, size, display_name, mime_type)
+            );
+            CREATE INDEX IF NOT EXISTS uploads_name ON uploads (name);
+            """
+        )
+
+    def lookup(self, sha256: str, size: int, display_name: str, mime_type: Optional[str]) -> Optional[dict]:
+        """Get the live remote file recorded for this content, name and type, if any."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT name, uri, expiration_time FROM uploads "
+                "WHERE sha256 = ? AND size = ? AND display_name = ? AND mime_type = ?",
+                (sha256, size, display_name, mime_type or "")
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            if row[2] < time.time() + EXPIRY_MARGIN_SECONDS:
+                self.forget(row[0])
+                return None
+
+        return {"name": row[0], "uri": row[1], "expiration_time": row[2]}
+
+    def record(self, sha256: str, size: int, display_name: str, mime_type: Optional[str], file: "File") -> None:
+        """Remember that this content, uploaded under this name and type, now lives in the given remote file."""
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, size, display_name, mime_type or "", file.name, file.uri,
+                 _timestamp(file.expiration_time))
+            )
+
+    def forget(self, name: str) -> None:
+        """Drop every entry pointing at a remote file, e.g. after it was deleted."""
+        with self.lock:
+            self.db.execute("DELETE FROM uploads WHERE name = ?", (name,))
+
+
+class IndexedFile(NamedTuple):
+    """Metadata of a remote file as recorded in the local index."""
+    name: str
+    display_name: str
+    mime_type: str
+    size_bytes: int
+    uri: str
+    create_time: float
+    expiration_time: float
+
+
+class FileIndex:
+    """
+        A local mirror of the metadata of files uploaded to the Files API.
+
+        Kept up to date by uploads and deletes made through `Gemini`, and refreshed from
+        the server only by an explicit sync. Listing and display-name lookups are
+        answered locally.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.lock = threading.RLock()
+        self.db = connect_db(path or files_db_path())
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                display_name TEXT,
+                mime_type TEXT,
+                size_bytes INTEGER,
+                uri TEXT,
+                create_time REAL,
+                expiration_time REAL
+            );
+            CREATE INDEX IF NOT EXISTS files_display_name ON files (display_name);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            """
+        )
+
+    def _meta(self, key: str) -> float:
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def _set_meta(self, key: str, value: float) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _insert(self, file: "File") -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file.name, file.display_name, file.mime_type, int(file.size_bytes or 0), file.uri,
+             _timestamp(file.create_time), _timestamp(file.expiration_time))
+        )
+
+    def upsert(self, file: "File") -> None:
+        """Record (or update) a remote file."""
+        with self.lock:
+            self._insert(file)
+
+    def remove(self, name: str) -> None:
+        """Forget a remote file."""
+        with self.lock:
+            self.db.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def sync(self, files: Iterable["File"]) -> int:
+        """Replace the index with a full listing from the server, returning the number of files."""
+        # the listing pages over the network; fetch it all before taking the write lock
+        files = list(files)
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM files")
+                for file in files:
+                    self._insert(file)
+                self._set_meta("last_sync", time.time())
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+        return len(files)
+
+    @property
+    def last_sync(self) -> float:
+        """When the index was last synced with the server, 0 if never."""
+        with self.lock:
+            return self._meta("last_sync")
+
+    def claim_refresh(self, stale_after: float = FILE_INDEX_STALE_SECONDS) -> bool:
+        """
+            Decide whether this process should start a background refresh.
+
+            Returns True at most once per `stale_after` seconds across all processes.
+        """
+        now = time.time()
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                last = max(self._meta("last_sync"), self._meta("last_refresh_attempt"))
+                claimed = now - last > stale_after
+                if claimed:
+                    self._set_meta("last_refresh_attempt", now)
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+        return claimed
+
+    def find_by_display_name(self, display_name: str) -> Optional[IndexedFile]:
+        """Find the most recently created live file with the given display name."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM files WHERE display_name = ? AND expiration_time > ? "
+                "ORDER BY create_time DESC LIMIT 1",
+                (display_name, time.time())
+            ).fetchone()
+
+        return IndexedFile(*row) if row else None
+
+    def list(self, mime_type: Optional[str] = None, larger_than: Optional[int] = None, expiring_within: Optional[float] = None) -> list[IndexedFile]:
+        """
+            List live files, optionally filtered.
+
+            `mime_type` matches exactly (`video/mp4`) or by top-level type (`video` or `video/`).
+        """
+        now = time.time()
+        query, params = "SELECT * FROM files WHERE expiration_time > ?", [now]
+
+        if mime_type:
+            if "/" in mime_type.rstrip("/"):
+                query += " AND mime_type = ?"
+                params.append(mime_type)
+            else:
+                query += " AND mime_type LIKE ?"
+                params.append(mime_type.rstrip("/") + "/%")
+
+        if larger_than is not None:
+            query += " AND size_bytes > ?"
+            params.append(larger_than)
+
+        if expiring_within is not None:
+            query += " AND expiration_time <= ?"
+            params.append(now + expiring_within)
+
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM files WHERE expiration_time <= ?", (now,))
+            rows = self.db.execute(
+                query + " ORDER BY create_time DESC", params).fetchall()
+
+        return [IndexedFile(*row) for row in rows]
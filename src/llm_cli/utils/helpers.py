@@ -1,9 +1,19 @@
 import itertools
-from google.generativeai.types import File
-from dotenv import load_dotenv
+import math
+import re
+import sys
+from typing import TYPE_CHECKING, Optional
 import os
 from llm_cli import __version__
 from .constants import SUPPORTED_IMAGE_MIME_TYPES, SUPPORTED_VIDEO_MIME_TYPES, SUPPORTED_AUDIO_MIME_TYPES
+from . import tracing
+
+# sqlite3, subprocess, dotenv and the MIME sniffer are imported where they are used,
+# so importing the CLI for `--help` or `--version` doesn't pay for them
+if TYPE_CHECKING:
+    import sqlite3
+
+    from google.generativeai.types import File
 
 
 def write_dotenv(env: dict) -> None:
@@ -15,6 +25,8 @@ def write_dotenv(env: dict) -> None:
 
 def load_env() -> None:
     """Load environment variables from a .env file."""
+    from dotenv import load_dotenv
+
     load_dotenv()
 
 
@@ -49,16 +61,29 @@ def validate_audio_type(audio_path: str) -> bool:
     return mime_type in SUPPORTED_AUDIO_MIME_TYPES
 
 
+# Extensions whose MIME subtype is spelled differently
+_EXTENSION_SUBTYPES = {"jpg": "jpeg", "jpe": "jpeg", "aif": "aiff", "qt": "mov"}
+
+
 def extract_mime_type(path: str, format: str = "image") -> str:
-    """Extract the MIME type of an file (image/audio/video)."""
-    extension = get_file_extension(path)
+    """
+    Extract the MIME type of an file (image/audio/video).
+
+    Files without an extension are identified from their header bytes.
+    """
+    extension = get_file_extension(path).lower()
+
+    if not extension:
+        from .ingest import sniff_mime_type
+
+        return sniff_mime_type(path) or ""
 
-    return f"{format}/{extension}"
+    return f"{format}/{_EXTENSION_SUBTYPES.get(extension, extension)}"
 
 
 def get_file_extension(file_path: str) -> str:
-    """Get the file extension of a file."""
-    return file_path.split(".")[-1]
+    """Get the file extension of a file, empty when it has none."""
+    return os.path.splitext(file_path)[1][1:]
 
 
 def peek(iterable):
@@ -70,13 +95,98 @@ def peek(iterable):
     return first, itertools.chain([first], iterable)
 
 
-def format_file_info(file: File) -> str:
+def format_file_info(file: "File") -> str:
     """Format file information for display."""
     return f"{file.display_name}\t - \t{file.mime_type}\t - \t{file.size_bytes}\t - \t{file.uri}"
 
 
+def get_cache_dir(*parts: str) -> str:
+    """
+    Get (and create) a directory under the llm-cli cache.
+
+    Defaults to `~/.cache/llm_cli`, honouring `XDG_CACHE_HOME` and the `LLM_CLI_CACHE_DIR` override.
+    """
+    base = os.environ.get("LLM_CLI_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "llm_cli")
+
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def connect_db(path: str) -> "sqlite3.Connection":
+    """
+    Open a SQLite database that can be shared by concurrent lcli processes.
+
+    Connections run in autocommit mode; use `BEGIN IMMEDIATE` for multi-statement writes.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(
+        path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+_SIZE_UNITS = {"": 1, "b": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3,
+               "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3}
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_size(value: str) -> int:
+    """Parse a human readable size such as `512`, `10MB` or `1.5GiB` into bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value}")
+
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration such as `90`, `30s`, `15m`, `2h` or `7d` into seconds."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]?)\s*", str(value))
+    if not match or match.group(2).lower() not in _DURATION_UNITS:
+        raise ValueError(f"Invalid duration: {value}")
+
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2).lower()]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate the number of tokens in a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of the values, None when there are none."""
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def spawn_background(args: list[str]) -> None:
+    """Run an lcli command in a detached background process, discarding its output."""
+    import subprocess
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+
+    subprocess.Popen(
+        [sys.executable, "-m", "llm_cli", *args],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        **kwargs
+    )
+
+
 def preprocess_input(input_text: str) -> str:
     """
     Preprocess the input text.
     """
-    return input_text.strip()  # remove leading and trailing whitespaces
+    with tracing.span("preprocess_input"):
+        return input_text.strip()  # remove leading and trailing whitespaces
@@ -0,0 +1,218 @@
+"""
+Client-side preprocessing of images sent inline with `prompt --image`.
+
+Images are downscaled to a maximum dimension, re-encoded as WebP or JPEG and stripped
+of metadata (EXIF, ICC profiles, XMP) before they are sent, which cuts camera photos from
+megabytes to a few hundred kilobytes. An image that comes out no smaller, such as an
+already heavily compressed one, is sent as it is. Processed images are cached on disk,
+keyed by the hash of the source and the processing options, so repeated prompts skip the
+work.
+
+Processing needs Pillow (`pip install "llm-cli[images]"`). Without it, images are sent
+as they are.
+"""
+import hashlib
+import importlib.util
+import mimetypes
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from . import tracing
+from .constants import DEFAULT_IMAGE_QUALITY as DEFAULT_QUALITY, DEFAULT_MAX_DIMENSION, SUPPORTED_IMAGE_MIME_TYPES
+from .file_index import hash_file
+from .helpers import get_cache_dir, parse_size
+
+DEFAULT_IMAGE_CACHE_MAX_BYTES = "500MB"
+
+# Fewer misses than this are processed in-process; a pool costs more to start than it saves.
+PROCESS_POOL_THRESHOLD = 4
+
+_MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+_EXTENSION_MIME_TYPES = {".heic": "image/heic", ".heif": "image/heif", ".webp": "image/webp"}
+
+# Cached in place of processed bytes when the original image is to be sent.
+_ORIGINAL = b""
+
+
+@dataclass(frozen=True)
+class ImageOptions:
+    """How images are processed before they are sent."""
+    max_dimension: Optional[int] = DEFAULT_MAX_DIMENSION  # None keeps the original size
+    format: str = "webp"                                  # "webp", "jpeg" or "original"
+    quality: int = DEFAULT_QUALITY
+
+    @property
+    def processed(self) -> bool:
+        return self.format != "original"
+
+    def cache_key(self, sha256: str) -> str:
+        return hashlib.sha256(
+            f"{sha256}:{self.max_dimension}:{self.format}:{self.quality}".encode("utf-8")).hexdigest()
+
+
+def pillow_available() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+
+def image_mime_type(path: str) -> str:
+    """The MIME type of an image from its extension, raising a ValueError if it is not supported."""
+    extension = os.path.splitext(path)[1].lower()
+    mime_type = _EXTENSION_MIME_TYPES.get(extension) or mimetypes.guess_type(path)[0]
+
+    if mime_type not in SUPPORTED_IMAGE_MIME_TYPES:
+        raise ValueError(
+            f"Unsupported image type: {path}. Supported types are {', '.join(SUPPORTED_IMAGE_MIME_TYPES)}.")
+    return mime_type
+
+
+def encode_image(path: str, options: ImageOptions) -> Optional[bytes]:
+    """
+        Downscale and re-encode an image without its metadata.
+
+        Returns None when Pillow cannot decode the image (e.g. HEIC without a plugin) or
+        the result is no smaller than the original, in which case the original should
+        be sent.
+    """
+    from io import BytesIO
+
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as source:
+            # apply the EXIF orientation before the EXIF data is dropped
+            image = ImageOps.exif_transpose(source)
+            if options.max_dimension:
+                image.thumbnail((options.max_dimension, options.max_dimension), Image.Resampling.LANCZOS)
+
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            if options.format == "jpeg" and has_alpha:
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if has_alpha else "RGB")
+
+            # only pixels are written: no exif, icc_profile or xmp arguments are passed on
+            output = BytesIO()
+            if options.format == "jpeg":
+                image.save(output, "JPEG", quality=options.quality, optimize=True)
+            else:
+                image.save(output, "WEBP", quality=options.quality, method=4)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    encoded = output.getvalue()
+    return encoded if len(encoded) < os.path.getsize(path) else None
+
+
+class ImageCache:
+    """Processed images on disk, named by their cache key and evicted least recently used first."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or get_cache_dir("images")
+        self.max_bytes = max_bytes if max_bytes is not None else parse_size(
+            os.environ.get("LLM_CLI_IMAGE_CACHE_MAX") or DEFAULT_IMAGE_CACHE_MAX_BYTES)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._file(key), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        os.utime(self._file(key))  # recency, for eviction
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        # write and rename, so concurrent processes never read a partial image
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self._file(key))
+
+    def prune(self) -> None:
+        """Evict the least recently used images until the cache fits its size limit."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                os.remove(entry.path)
+
+
+def _encode_job(job: tuple[str, ImageOptions]) -> Optional[bytes]:
+    return encode_image(*job)
+
+
+def prepare_images(paths: Iterable[str], options: ImageOptions = ImageOptions(), cache: Optional[ImageCache] = None, max_workers: Optional[int] = None) -> list[dict]:
+    """
+        Load images as inline blobs (`{"mime_type": ..., "data": ...}`), processed
+        according to `options` when Pillow is installed.
+
+        Images missing from the cache are processed in a process pool when there are
+        at least `PROCESS_POOL_THRESHOLD` of them.
+    """
+    paths = list(paths)
+    mime_types = [image_mime_type(path) for path in paths]
+
+    if not (options.processed and pillow_available()):
+        blobs = []
+        for path, mime_type in zip(paths, mime_types):
+            with open(path, "rb") as file:
+                blobs.append({"mime_type": mime_type, "data": file.read()})
+        return blobs
+
+    cache = cache or ImageCache()
+    mime_type = _MIME_TYPES[options.format]
+
+    with tracing.span("prepare_images", images=len(paths)) as span:
+        keys = [options.cache_key(hash_file(path)) for path in paths]
+        data = [cache.get(key) for key in keys]
+        misses = [index for index, value in enumerate(data) if value is None]
+        span.set(cache_hits=len(paths) - len(misses))
+
+        jobs = [(paths[index], options) for index in misses]
+        if len(jobs) >= PROCESS_POOL_THRESHOLD:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                encoded = list(executor.map(_encode_job, jobs))
+        else:
+            encoded = [_encode_job(job) for job in jobs]
+
+        for index, value in zip(misses, encoded):
+            # remember to send the original too, so it is not processed again
+            data[index] = _ORIGINAL if value is None else value
+            cache.put(keys[index], data[index])
+
+        if misses:
+            cache.prune()
+
+        blobs = []
+        for path, original_type, value in zip(paths, mime_types, data):
+            if value == _ORIGINAL:
+                with open(path, "rb") as file:
+                    blobs.append({"mime_type": original_type, "data": file.read()})
+            else:
+                blobs.append({"mime_type": mime_type, "data": value})
+
+    return blobs
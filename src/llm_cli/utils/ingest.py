@@ -0,0 +1,174 @@
+"""
+Discovery of files to upload from paths, directories and glob patterns.
+
+Directories are walked lazily and the type of every candidate is detected from its
+first bytes (magic numbers) rather than its name, in a thread pool so the scan is
+bound by disk reads rather than the interpreter. Files whose type is not in the
+allow-lists of `constants` are skipped. Matches are yielded as they are found, so
+uploads start while the tree is still being scanned.
+"""
+import glob
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+from .constants import SUPPORTED_AUDIO_MIME_TYPES, SUPPORTED_DOCUMENT_MIME_TYPES, SUPPORTED_IMAGE_MIME_TYPES, SUPPORTED_VIDEO_MIME_TYPES
+
+SUPPORTED_MIME_TYPES = frozenset(
+    SUPPORTED_IMAGE_MIME_TYPES + SUPPORTED_VIDEO_MIME_TYPES + SUPPORTED_AUDIO_MIME_TYPES + SUPPORTED_DOCUMENT_MIME_TYPES)
+
+# Enough for every signature below, including the Matroska doctype of WebM files.
+HEADER_BYTES = 64
+
+# Files sniffed per task, so the pool's per-task overhead is paid once per batch.
+SNIFF_BATCH = 64
+
+_GLOB_CHARACTERS = re.compile(r"[*?[]")
+
+# ISO base media brands (the four bytes after "ftyp")
+_FTYP_BRANDS = {
+    b"heic": "image/heic", b"heix": "image/heic", b"hevc": "image/heic", b"hevx": "image/heic",
+    b"heim": "image/heic", b"heis": "image/heic",
+    b"mif1": "image/heif", b"msf1": "image/heif", b"heif": "image/heif",
+    b"qt  ": "video/mov",
+    b"3gp4": "video/3gpp", b"3gp5": "video/3gpp", b"3gp6": "video/3gpp", b"3g2a": "video/3gpp",
+    b"isom": "video/mp4", b"iso2": "video/mp4", b"iso5": "video/mp4", b"iso6": "video/mp4",
+    b"mp41": "video/mp4", b"mp42": "video/mp4", b"avc1": "video/mp4", b"dash": "video/mp4",
+    b"M4V ": "video/mp4", b"MSNV": "video/mp4",
+}
+
+# RIFF and IFF containers: the form type at bytes 8-12
+_RIFF_FORMS = {b"WEBP": "image/webp", b"AVI ": "video/avi", b"WAVE": "audio/wav"}
+_IFF_FORMS = {b"AIFF": "audio/aiff", b"AIFC": "audio/aiff"}
+
+_PREFIXES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"%PDF-", "application/pdf"),
+    (b"FLV\x01", "video/x-flv"),
+    (b"\x00\x00\x01\xba", "video/mpeg"),
+    (b"\x00\x00\x01\xb3", "video/mpeg"),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "video/wmv"),
+    (b"ID3", "audio/mp3"),
+    (b"OggS", "audio/ogg"),
+    (b"fLaC", "audio/flac"),
+)
+
+
+def mime_type_from_header(header: bytes) -> Optional[str]:
+    """The MIME type a file's first bytes identify, or None when they match no known format."""
+    for prefix, mime_type in _PREFIXES:
+        if header.startswith(prefix):
+            return mime_type
+
+    if header[4:8] == b"ftyp":
+        return _FTYP_BRANDS.get(header[8:12])
+    if header[:4] == b"RIFF":
+        return _RIFF_FORMS.get(header[8:12])
+    if header[:4] == b"FORM":
+        return _IFF_FORMS.get(header[8:12])
+    if header[:4] == b"\x1a\x45\xdf\xa3":  # Matroska; only its WebM flavour is supported
+        return "video/webm" if b"webm" in header else None
+
+    if len(header) >= 2 and header[0] == 0xFF:
+        if header[1] & 0xF6 == 0xF0:  # ADTS frame sync
+            return "audio/aac"
+        if header[1] & 0xE6 == 0xE2:  # MPEG audio layer III frame sync
+            return "audio/mp3"
+
+    return None
+
+
+def sniff_mime_type(path: str) -> Optional[str]:
+    """Detect the MIME type of a file by reading only its header bytes."""
+    # a raw descriptor: a buffered file object costs more than the read itself
+    try:
+        descriptor = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except OSError:
+        return None
+
+    try:
+        return mime_type_from_header(os.read(descriptor, HEADER_BYTES))
+    except OSError:
+        return None
+    finally:
+        os.close(descriptor)
+
+
+def _sniff_batch(paths: list[str]) -> list[Optional[str]]:
+    return [sniff_mime_type(path) for path in paths]
+
+
+def walk_files(directory: str) -> Iterator[str]:
+    """Lazily yield the files under a directory, skipping hidden entries and symlinked directories."""
+    stack = [directory]
+
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                subdirectories = []
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        # depth first, in directory order
+        stack.extend(reversed(subdirectories))
+
+
+def _candidates(targets: Iterable[str]) -> Iterator[tuple[str, bool]]:
+    """Expand targets into files, flagging those that were named explicitly."""
+    for target in targets:
+        if os.path.isdir(target):
+            yield from ((path, False) for path in walk_files(target))
+        elif os.path.isfile(target):
+            yield target, True
+        elif _GLOB_CHARACTERS.search(target):
+            for path in glob.iglob(target, recursive=True):
+                if os.path.isdir(path):
+                    yield from ((file, False) for file in walk_files(path))
+                else:
+                    yield path, False
+        else:
+            raise ValueError(f"File not found: {target}")
+
+
+def discover_files(targets: Iterable[str], max_workers: int = 16) -> Iterator[tuple[str, Optional[str]]]:
+    """
+        Yield `(path, mime_type)` for every supported file named by, or found under, `targets`.
+
+        Files named explicitly are always yielded, with their sniffed type or None to let
+        the upload guess it from the name. Files found in directories or by glob patterns
+        are yielded only when their sniffed type is supported.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lcli-sniff") as executor:
+        window, batch = deque(), []
+
+        def submit() -> None:
+            window.append((batch[:], executor.submit(_sniff_batch, [path for path, _ in batch])))
+            batch.clear()
+
+        def drain(size: int) -> Iterator[tuple[str, Optional[str]]]:
+            # past the window size wait for the oldest batch; below it, take what is done
+            while window and (len(window) > size or window[0][1].done()):
+                candidates, future = window.popleft()
+                for (path, explicit), mime_type in zip(candidates, future.result()):
+                    if explicit or mime_type in SUPPORTED_MIME_TYPES:
+                        yield path, mime_type
+
+        for candidate in _candidates(targets):
+            batch.append(candidate)
+            if len(batch) == SNIFF_BATCH:
+                submit()
+                yield from drain(max_workers * 4)
+
+        if batch:
+            submit()
+        yield from drain(0)
@@ -0,0 +1,230 @@
+"""
+A pool of API keys, so one process can use the quota of several projects.
+
+Keys come from `GOOGLE_API_KEYS` (comma separated), after the primary `GOOGLE_API_KEY`.
+Each request goes to the key with the most headroom under its rate limits (see
+`ratelimit`): the one it would wait least for, then the one with the most quota left,
+then the one with the fewest requests in flight. Without configured limits that spreads
+requests evenly, so throughput grows with the number of keys.
+
+A key answering with a quota error (429) is ejected for `EJECT_SECONDS`, doubling up to
+`MAX_EJECT_SECONDS` while it keeps failing, and the request is sent again at once with
+another key. Ejections are shared by every lcli process through the rate limit database.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .helpers import connect_db, get_cache_dir
+from .ratelimit import RateLimiter, key_id, limits_for
+
+T = TypeVar("T")
+
+EJECT_SECONDS = 60
+MAX_EJECT_SECONDS = 900
+
+
+def resolve_api_keys() -> list[str]:
+    """The configured API keys, the primary first, raising a ValueError when there are none."""
+    keys = []
+    for key in [os.environ.get("GOOGLE_API_KEY", ""), *os.environ.get("GOOGLE_API_KEYS", "").split(",")]:
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+
+    if not keys:
+        raise ValueError(
+            "API key not found. Please set the GOOGLE_API_KEY environment variable or properly configure it using `lcli configure`.")
+    return keys
+
+
+def is_quota_error(error: BaseException) -> bool:
+    return getattr(error, "code", None) == 429
+
+
+@dataclass(eq=False)
+class PooledKey:
+    """One key of the pool, with its rate limiter and whatever client the caller binds to it."""
+    api_key: str
+    limiter: Optional[RateLimiter] = None
+    client: Any = None
+    in_flight: int = 0
+    requests: int = 0
+    id: str = field(init=False)
+
+    def __post_init__(self):
+        self.id = key_id(self.api_key)
+
+    @property
+    def label(self) -> str:
+        """The last characters of the key, as in `LLM_CLI_RATE_LIMITS`."""
+        return f"...{self.api_key[-4:]}"
+
+
+@dataclass
+class KeyPool:
+    """Schedules requests over API keys by their rate limit headroom, ejecting exhausted keys."""
+    keys: list[str]
+    model_name: str
+    path: Optional[str] = None
+    members: list[PooledKey] = field(init=False)
+
+    def __post_init__(self):
+        self.members = []
+        for api_key in self.keys:
+            limits = limits_for(api_key, self.model_name)
+            self.members.append(PooledKey(
+                api_key, RateLimiter(api_key, self.model_name, limits) if limits else None))
+
+        self.path = self.path or os.path.join(get_cache_dir(), "ratelimit.db")
+        self.lock = threading.Lock()
+        self.db = None
+        self.struck = set()  # ids of keys with an ejection on record, cleared once they answer again
+
+    @property
+    def primary(self) -> PooledKey:
+        return self.members[0]
+
+    def _connect(self):
+        if self.db is None:
+            self.db = connect_db(self.path)
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ejections (
+                    key_id TEXT PRIMARY KEY,
+                    until REAL NOT NULL,
+                    strikes INTEGER NOT NULL
+                )
+                """
+            )
+        return self.db
+
+    def _ejected(self) -> dict[str, float]:
+        """When each ejected key comes back, for the keys still ejected."""
+        with self.lock:
+            rows = dict(self._connect().execute("SELECT key_id, until FROM ejections"))
+            self.struck = set(rows)
+
+        now = time.time()
+        return {id: until for id, until in rows.items() if until > now}
+
+    def eject(self, member: PooledKey) -> float:
+        """Take a key out of rotation after a quota error, returning for how long."""
+        with self.lock:
+            db = self._connect()
+            row = db.execute("SELECT strikes FROM ejections WHERE key_id = ?", (member.id,)).fetchone()
+            strikes = (row[0] if row else 0) + 1
+            seconds = min(EJECT_SECONDS * 2 ** (strikes - 1), MAX_EJECT_SECONDS)
+            db.execute("INSERT OR REPLACE INTO ejections VALUES (?, ?, ?)", (member.id, time.time() + seconds, strikes))
+            self.struck.add(member.id)
+
+        return seconds
+
+    def _restore(self, member: PooledKey) -> None:
+        with self.lock:
+            self._connect().execute("DELETE FROM ejections WHERE key_id = ?", (member.id,))
+            self.struck.discard(member.id)
+
+    def choose(self, tokens: int = 0, exclude: tuple = ()) -> PooledKey:
+        """The key a request of `tokens` tokens should go to now."""
+        candidates = [member for member in self.members if member not in exclude] or self.members
+        if len(candidates) == 1:
+            return candidates[0]
+
+        ejected = self._ejected()
+        live = [member for member in candidates if member.id not in ejected]
+        if not live:
+            # every key is exhausted: try the one that comes back first
+            return min(candidates, key=lambda member: ejected[member.id])
+
+        def rank(indexed: tuple[int, PooledKey]):
+            index, member = indexed
+            wait, headroom = member.limiter.peek(tokens) if member.limiter else (0.0, 1.0)
+            return wait, -headroom, member.in_flight, index
+
+        return min(enumerate(live), key=rank)[1]
+
+    def run(self, send: Callable[[PooledKey], T], tokens: int = 0, max_wait: Optional[float] = None, pinned: bool = False) -> T:
+        """
+            Send a request with the best key, waiting for its turn under its rate limits.
+
+            On a quota error the key is ejected and the request is sent with the next
+            best key, until every key has been tried. `pinned` requests, e.g. ones that
+            refer to uploaded files, which belong to the project of the key that uploaded
+            them, always use the primary key.
+        """
+        tried = []
+
+        while True:
+            member = self.primary if pinned else self.choose(tokens, exclude=tuple(tried))
+            started = time.monotonic()
+
+            if member.limiter is not None:
+                member.limiter.acquire(tokens, max_wait=max_wait)
+            if max_wait is not None:
+                max_wait -= time.monotonic() - started
+
+            self._check_out(member)
+            try:
+                result = send(member)
+            except Exception as error:
+                if not self._next_key_after(member, error, tried, pinned):
+                    raise
+                continue
+            finally:
+                self._check_in(member)
+
+            if member.id in self.struck:
+                self._restore(member)
+            return result
+
+    async def run_async(self, send: Callable[[PooledKey], Awaitable[T]], tokens: int = 0, max_wait: Optional[float] = None, pinned: bool = False) -> T:
+        """The asyncio counterpart of `run`, for a coroutine function `send`."""
+        tried = []
+
+        while True:
+            member = self.primary if pinned else self.choose(tokens, exclude=tuple(tried))
+            started = time.monotonic()
+
+            if member.limiter is not None:
+                await member.limiter.acquire_async(tokens, max_wait=max_wait)
+            if max_wait is not None:
+                max_wait -= time.monotonic() - started
+
+            self._check_out(member)
+            try:
+                result = await send(member)
+            except Exception as error:
+                if not self._next_key_after(member, error, tried, pinned):
+                    raise
+                continue
+            finally:
+                self._check_in(member)
+
+            if member.id in self.struck:
+                self._restore(member)
+            return result
+
+    def _check_out(self, member: PooledKey) -> None:
+        with self.lock:
+            member.in_flight += 1
+            member.requests += 1
+
+    def _check_in(self, member: PooledKey) -> None:
+        with self.lock:
+            member.in_flight -= 1
+
+    def _next_key_after(self, member: PooledKey, error: Exception, tried: list[PooledKey], pinned: bool) -> bool:
+        """Whether a failed request is sent again with another key, ejecting the key on a quota error."""
+        if not is_quota_error(error) or pinned or len(self.members) == 1:
+            return False
+
+        self.eject(member)
+        tried.append(member)
+        return len(tried) < len(self.members)
+
+    def summary(self) -> dict[str, int]:
+        """Requests sent with each key, by label."""
+        return {member.label: member.requests for member in self.members}
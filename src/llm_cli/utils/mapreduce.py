@@ -0,0 +1,241 @@
+"""
+Map-reduce over inputs too large for one prompt, such as a log piped into `lcli prompt`.
+
+The input is read as a stream and cut into chunks of about `max_tokens` tokens on
+paragraph boundaries, or line boundaries when a paragraph is too long, so memory use is
+bound by the chunk size rather than the input size. Each chunk is sent with the map
+prompt, at most `concurrency` at a time, and the partial results are combined in input
+order, a group at a time, with the reduce prompt until one result is left.
+
+Every result is checkpointed under a hash of its prompt, so running the same command
+again after a failure only sends the chunks (and reductions) that did not complete.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Iterator, NamedTuple, Optional, TextIO
+
+from . import tracing
+from .batch import run_batch
+from .constants import DEFAULT_CHUNK_TOKENS, MAP_INSTRUCTIONS, REDUCE_INSTRUCTIONS
+from .helpers import connect_db, estimate_tokens, get_cache_dir, parse_duration
+
+DEFAULT_CHECKPOINT_TTL = "7d"
+
+# As `estimate_tokens` counts them.
+CHARS_PER_TOKEN = 4
+
+NOTHING_RELEVANT = "NOTHING RELEVANT"
+
+
+def _cut(window: str) -> int:
+    """Where to end a chunk: the last paragraph break in its second half, else the last line break."""
+    paragraph = window.rfind("\n\n")
+    if paragraph >= len(window) // 2:
+        return paragraph + 2
+
+    line = window.rfind("\n")
+    return line + 1 if line >= 0 else len(window)
+
+
+def iter_chunks(stream: TextIO, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> Iterator[str]:
+    """
+        Lazily cut a text stream into chunks of at most about `max_tokens` tokens.
+
+        Chunks end at a paragraph break (a blank line) when there is one late enough
+        in the chunk, or at a line break. Lines longer than a whole chunk are cut by length.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    buffer = ""
+
+    # a chunk's worth at a time: memory stays bound by the chunk size, even for one huge line
+    while True:
+        block = stream.read(max_chars)
+        buffer += block
+
+        while len(buffer) > max_chars or (buffer and not block):
+            cut = _cut(buffer[:max_chars]) if len(buffer) > max_chars else len(buffer)
+            chunk, buffer = buffer[:cut], buffer[cut:]
+            if chunk.strip():
+                yield chunk
+
+        if not block:
+            return
+
+
+def map_prompt(task: str, chunk: str) -> str:
+    return f"{MAP_INSTRUCTIONS}\nTask: {task}\n\nPart of the input:\n{chunk}"
+
+
+def reduce_prompt(task: str, partials: list[str]) -> str:
+    parts = "\n\n".join(f"--- Partial result {number} ---\n{partial}" for number, partial in enumerate(partials, start=1))
+    return f"{REDUCE_INSTRUCTIONS}\nTask: {task}\n\n{parts}"
+
+
+def group_partials(partials: list[str], max_tokens: int) -> list[list[str]]:
+    """Pack consecutive partial results into groups that fit one reduce prompt, at least two per group."""
+    groups, size = [], 0
+
+    for partial in partials:
+        tokens = estimate_tokens(partial)
+        if groups and (len(groups[-1]) < 2 or size + tokens <= max_tokens):
+            groups[-1].append(partial)
+            size += tokens
+        else:
+            groups.append([partial])
+            size = tokens
+
+    # a lone last partial is carried up unchanged; merge it instead so every level shrinks
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        groups[-2].extend(groups.pop())
+
+    return groups
+
+
+class MapReducePlan(NamedTuple):
+    chunks: int
+    tokens: int     # estimated input tokens of the first level of prompts
+
+
+def plan_map_reduce(stream: TextIO, task: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> MapReducePlan:
+    """
+        Estimate what `run_map_reduce` would send for its chunks, without sending anything.
+
+        The reduce prompts are left out: their size depends on the answers to the chunks.
+    """
+    chunks, tokens, first = 0, 0, None
+
+    for chunk in iter_chunks(stream, max_tokens):
+        if first is None:
+            first = chunk
+        chunks += 1
+        tokens += estimate_tokens(map_prompt(task, chunk))
+
+    if first is None:
+        raise ValueError("The input is empty.")
+    if chunks == 1:
+        tokens = estimate_tokens(f"{task}\n\n{first}")
+
+    return MapReducePlan(chunks, tokens)
+
+
+class Checkpoint:
+    """Completed map and reduce results, by a hash of their model settings and prompt."""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else parse_duration(
+            os.environ.get("LLM_CLI_CHECKPOINT_TTL") or DEFAULT_CHECKPOINT_TTL)
+        self.lock = threading.Lock()
+        self.db = connect_db(path or os.path.join(get_cache_dir(), "mapreduce.db"))
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+
+    @staticmethod
+    def key(scope: str, prompt: str) -> str:
+        return hashlib.sha256(f"{scope}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT text FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, text: str) -> None:
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, text, time.time()))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM results")
+
+
+class MapReduceResult(NamedTuple):
+    text: str
+    chunks: int
+    levels: int     # reduce levels, 0 when the input fit one chunk
+    requests: int   # prompts sent, the rest were checkpointed
+
+
+def run_map_reduce(generate: Callable[[str], str], stream: TextIO, task: str, max_tokens: int = DEFAULT_CHUNK_TOKENS, concurrency: int = 4, checkpoint: Optional[Checkpoint] = None, scope: str = "") -> MapReduceResult:
+    """
+        Carry out `task` on a text stream of any size with `generate`, a prompt-to-text function.
+
+        `scope` identifies the model and settings in checkpoint keys. Failed prompts are
+        retried by `generate` itself; if some still fail, a ValueError is raised once the
+        others of the same level are done and checkpointed.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    requests = 0
+    counter = threading.Lock()
+
+    def run(prompt: str) -> str:
+        nonlocal requests
+        key = Checkpoint.key(scope, prompt)
+
+        text = checkpoint.get(key)
+        if text is None:
+            with counter:
+                requests += 1
+            text = generate(prompt)
+            if text.strip():  # an empty answer is not worth keeping
+                checkpoint.put(key, text)
+
+        return text
+
+    def run_all(prompts: Iterator[str], stage: str) -> list[str]:
+        results, failed = [], []
+        records = ({"id": number, "text": prompt} for number, prompt in enumerate(prompts, start=1))
+
+        for result in run_batch(run, records, concurrency=concurrency, ordered=True):
+            if "error" in result:
+                failed.append(result)
+            else:
+                results.append(result["text"])
+
+        if failed:
+            raise ValueError(
+                f"{len(failed)} of {len(results) + len(failed)} {stage} prompt(s) failed, first: {failed[0]['error']}. "
+                "The others are checkpointed; run the same command again to retry only the failed ones.")
+        return results
+
+    chunks = iter_chunks(stream, max_tokens)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("The input is empty.")
+
+    second = next(chunks, None)
+    if second is None:
+        # it fits one prompt: no partial results to combine
+        return MapReduceResult(run(f"{task}\n\n{first}"), 1, 0, requests)
+
+    def prompts() -> Iterator[str]:
+        yield map_prompt(task, first)
+        yield map_prompt(task, second)
+        yield from (map_prompt(task, chunk) for chunk in chunks)
+
+    with tracing.span("map", concurrency=concurrency) as span:
+        partials = run_all(prompts(), "map")
+        span.set(chunks=len(partials))
+
+    chunk_count = len(partials)
+    relevant = [partial for partial in partials if partial.strip() != NOTHING_RELEVANT]
+    partials = relevant or partials[:1]
+    levels = 0
+
+    # combine a level at a time, in input order, until one result is left
+    while len(partials) > 1 or levels == 0:
+        groups = group_partials(partials, max_tokens)
+        levels += 1
+
+        with tracing.span("reduce", level=levels, groups=len(groups)):
+            partials = run_all((reduce_prompt(task, group) for group in groups), "reduce")
+
+    return MapReduceResult(partials[0], chunk_count, levels, requests)
@@ -1,10 +1,116 @@
-from google.generativeai.types import GenerateContentResponse
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
 
+from . import tracing
 
-def process_gemini_response(response: GenerateContentResponse, stream: bool = False) -> str:
+if TYPE_CHECKING:
+    from google.generativeai.types import AsyncGenerateContentResponse, GenerateContentResponse
+
+
+def iter_stream(response: "GenerateContentResponse") -> Iterator[Any]:
+    """
+    Iterate the chunks of a streamed response as soon as each one arrives.
+
+    The SDK's own iterator reads a chunk ahead, so it only yields a chunk once the
+    next one has arrived. This reads the underlying stream directly, keeping the
+    response's state as the SDK does, so its text and usage are complete afterwards.
+    Anything else, such as a finished response, is iterated as is.
+    """
+
+    state = getattr(response, "__dict__", {})
+    if state.get("_done", True) or state.get("_iterator") is None:
+        yield from response
+        return
+
+    from google.generativeai.types.generation_types import GenerateContentResponse, _join_chunks
+
+    index = 0
+    while True:
+        while index < len(response._chunks):
+            yield GenerateContentResponse.from_response(response._chunks[index])
+            index += 1
+
+        try:
+            item = next(response._iterator)
+        except StopIteration:
+            response._done = True
+            return
+        except Exception as e:
+            response._error, response._done = e, True
+            raise
+
+        response._chunks.append(item)
+        response._result = _join_chunks([response._result, item])
+
+
+async def aiter_stream(response: "AsyncGenerateContentResponse") -> AsyncIterator[Any]:
+    """
+    The asyncio counterpart of `iter_stream`, for a response of `generate_content_async`.
+
+    Other responses, such as one answered from a cache, are iterated as they are.
+    """
+
+    if not hasattr(response, "__aiter__"):
+        for chunk in iter_stream(response):
+            yield chunk
+        return
+
+    state = getattr(response, "__dict__", {})
+    if state.get("_done", True) or state.get("_iterator") is None:
+        async for chunk in response:
+            yield chunk
+        return
+
+    from google.generativeai.types.generation_types import GenerateContentResponse, _join_chunks
+
+    index = 0
+    while True:
+        while index < len(response._chunks):
+            yield GenerateContentResponse.from_response(response._chunks[index])
+            index += 1
+
+        try:
+            item = await anext(response._iterator)
+        except StopAsyncIteration:
+            response._done = True
+            return
+        except Exception as e:
+            response._error, response._done = e, True
+            raise
+
+        response._chunks.append(item)
+        response._result = _join_chunks([response._result, item])
+
+
+def iter_gemini_response(response: "GenerateContentResponse") -> Iterator[str]:
+    """
+    Yield the text of a (streamed) response from the Gemini API chunk by chunk.
+
+    Chunks are yielded as soon as they arrive; a non-streamed response yields its
+    full text once.
+    """
+
+    for chunk in iter_stream(response):
+        if isinstance(chunk, str):  # already text, e.g. relayed by the `lcli serve` daemon
+            yield chunk
+        elif chunk.candidates and chunk.parts:  # skip chunks carrying only metadata
+            yield chunk.text
+
+
+async def aiter_gemini_response(response: "AsyncGenerateContentResponse") -> AsyncIterator[str]:
+    """The asyncio counterpart of `iter_gemini_response`."""
+
+    async for chunk in aiter_stream(response):
+        if chunk.candidates and chunk.parts:
+            yield chunk.text
+
+
+def process_gemini_response(response: "GenerateContentResponse", stream: bool = False) -> str:
     """
     Process the response from the Gemini API.
     """
 
-    if not stream:
-        return response.text  # return the text response
+    with tracing.span("process_response", stream=stream):
+        if not stream:
+            return response.text  # return the text response
+
+        return "".join(iter_gemini_response(response))
@@ -0,0 +1,212 @@
+"""
+Client-side requests-per-minute and tokens-per-minute limits, shared by every lcli
+process on the host.
+
+Each API key and model has a request bucket and a token bucket, stored in a SQLite
+database in the cache directory. A caller reserves its request and (estimated) tokens
+in one short write transaction and then sleeps until its reservation is due. Buckets
+may go into debt, so reservations are served in the order they were made and
+concurrent processes share a queue instead of polling. In aggregate they send at the
+configured rate instead of bursting into 429s and backing off.
+
+Limits are opt-in:
+
+    LLM_CLI_RPM=15 LLM_CLI_TPM=1000000         defaults for every key and model
+    LLM_CLI_RATE_LIMITS="gemini-1.5-pro=2/32000;x7Qa@gemini-1.5-flash=2000/4000000"
+
+Entries in `LLM_CLI_RATE_LIMITS` are `[<last 4 characters of the key>@]<model>=<rpm>/<tpm>`;
+either limit may be left empty.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from . import tracing
+from .helpers import connect_db, estimate_tokens, get_cache_dir
+
+# Bursts may use up to this many seconds worth of quota at once.
+BURST_SECONDS = 10
+
+# Rough input tokens of a non-text part (an image or uploaded file) before the real count is known.
+NON_TEXT_PART_TOKENS = 258
+
+
+@dataclass
+class RateLimits:
+    """Requests and tokens allowed per minute; None means unlimited."""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+
+
+def _parse_limits(value: str) -> RateLimits:
+    rpm, _, tpm = value.partition("/")
+    return RateLimits(float(rpm) if rpm.strip() else None, float(tpm) if tpm.strip() else None)
+
+
+def limits_for(api_key: str, model_name: str) -> Optional[RateLimits]:
+    """The configured limits for a key and model, or None when neither is limited."""
+    model_name = model_name.removeprefix("models/")
+    limits = RateLimits(
+        float(os.environ["LLM_CLI_RPM"]) if os.environ.get("LLM_CLI_RPM") else None,
+        float(os.environ["LLM_CLI_TPM"]) if os.environ.get("LLM_CLI_TPM") else None,
+    )
+
+    # a key specific entry overrides a model entry, which overrides the defaults
+    overrides = {}
+    for entry in os.environ.get("LLM_CLI_RATE_LIMITS", "").replace(",", ";").split(";"):
+        name, _, value = entry.partition("=")
+        if not value:
+            continue
+
+        key_suffix, _, model = name.strip().rpartition("@")
+        if model == model_name and (not key_suffix or api_key.endswith(key_suffix)):
+            overrides[bool(key_suffix)] = _parse_limits(value)
+
+    for specific in (False, True):
+        if specific in overrides:
+            limits = overrides[specific]
+
+    return limits if limits.rpm or limits.tpm else None
+
+
+def key_id(api_key: str) -> str:
+    """A stable identifier of an API key that does not reveal it."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_input_tokens(contents: Iterable) -> int:
+    """Cheaply estimate the input tokens of request contents, to reserve before sending."""
+    return sum(
+        estimate_tokens(part) if isinstance(part, str) else NON_TEXT_PART_TOKENS for part in contents)
+
+
+class RateLimiter:
+    """Shared token buckets for one API key and model."""
+
+    def __init__(self, api_key: str, model_name: str, limits: RateLimits, path: Optional[str] = None):
+        self.limits = limits
+        self.bucket = f"{key_id(api_key)}:{model_name.removeprefix('models/')}"
+        self.path = path or os.path.join(get_cache_dir(), "ratelimit.db")
+        self.lock = threading.Lock()
+        self.db = None
+
+    def _connect(self):
+        if self.db is None:
+            self.db = connect_db(self.path)
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    bucket TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+        return self.db
+
+    def _take(self, name: str, per_minute: float, amount: float, now: float) -> tuple[float, float]:
+        """Refill a bucket to now and take from it, returning the new level and the wait for it."""
+        rate, capacity = per_minute / 60, max(per_minute * BURST_SECONDS / 60, 1.0)
+
+        row = self.db.execute(
+            "SELECT level, updated FROM buckets WHERE bucket = ?", (name,)).fetchone()
+        level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+
+        # a request larger than a burst goes once the bucket is full; its debt delays the next ones
+        wait = max(0.0, (min(amount, capacity) - level) / rate)
+        return level - amount, wait
+
+    def _buckets(self, tokens: int) -> list[tuple[str, Optional[float], float]]:
+        buckets = [(f"{self.bucket}:rpm", self.limits.rpm, 1)]
+        if self.limits.tpm and tokens:
+            buckets.append((f"{self.bucket}:tpm", self.limits.tpm, tokens))
+        return buckets
+
+    def peek(self, tokens: int = 0) -> tuple[float, float]:
+        """
+            Without reserving anything: how long a request of `tokens` tokens would wait,
+            and the headroom left, as the fraction of the fullest bucket's burst capacity.
+        """
+        with self.lock:
+            self._connect()
+            now, wait, headroom = time.time(), 0.0, 1.0
+
+            for name, per_minute, amount in self._buckets(tokens):
+                if per_minute:
+                    level, bucket_wait = self._take(name, per_minute, amount, now)
+                    wait = max(wait, bucket_wait)
+                    headroom = min(headroom, (level + amount) / max(per_minute * BURST_SECONDS / 60, 1.0))
+
+        return wait, headroom
+
+    def reserve(self, tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """
+            Reserve one request and `tokens` tokens, returning how long to wait before sending.
+
+            Raises a TimeoutError, without reserving anything, when the wait would be
+            longer than `max_wait`.
+        """
+        buckets = self._buckets(tokens)
+
+        with self.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now, wait, levels = time.time(), 0.0, []
+
+                for name, per_minute, amount in buckets:
+                    if per_minute:
+                        level, bucket_wait = self._take(name, per_minute, amount, now)
+                        levels.append((name, level))
+                        wait = max(wait, bucket_wait)
+
+                if max_wait is not None and wait > max_wait:
+                    raise TimeoutError(
+                        f"The rate limit would delay the request by {wait:.1f}s, past its deadline.")
+
+                for name, level in levels:
+                    db.execute(
+                        "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (name, level, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+        return wait
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> None:
+        """Reserve a request and wait for its turn."""
+        wait = self.reserve(tokens, max_wait)
+
+        if wait > 0:
+            with tracing.span("rate_limit", wait=wait, tokens=tokens):
+                time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0, max_wait: Optional[float] = None) -> None:
+        """Reserve a request and wait for its turn without blocking the event loop."""
+        wait = self.reserve(tokens, max_wait)
+
+        if wait > 0:
+            with tracing.span("rate_limit", wait=wait, tokens=tokens):
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct a token reservation once the real count is known."""
+        if not self.limits.tpm or actual == estimated:
+            return
+
+        with self.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                name, now = f"{self.bucket}:tpm", time.time()
+                level, _ = self._take(name, self.limits.tpm, actual - estimated, now)
+                db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (name, level, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
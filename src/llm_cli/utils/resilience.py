@@ -0,0 +1,327 @@
+"""
+Retries, deadlines and hedging for requests to the API.
+
+Transient failures (429, 5xx, timeouts, dropped connections) are retried with
+exponential backoff and full jitter, waiting at least as long as any retry-after hint
+from the server. A deadline bounds a request including all of its retries. With
+hedging, a request that has not produced its first chunk by the recent p95 latency is
+duplicated; whichever copy answers first wins and the other is cancelled.
+
+Only the call that produces the first chunk is retried or hedged: once a streamed
+response has started, a failure mid-stream is raised as is, so output is never repeated.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from . import tracing
+from .helpers import parse_duration, percentile
+
+T = TypeVar("T")
+
+# 408 Request Timeout, 429 Too Many Requests and server errors that are usually transient
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_RETRY_IN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+
+def _in_thread(function: Callable[..., T], *args: Any) -> "Future[T]":
+    """
+        Run a hedged copy of a request in a daemon thread of its own.
+
+        The losing copy of a request that cannot be cancelled runs on until its answer
+        arrives; in an executor thread it would hold up the exit of the process.
+    """
+    future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, name="lcli-hedge", daemon=True).start()
+    return future
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed request is worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+
+    # connection failures raised by the HTTP libraries the SDK uses
+    return isinstance(error, OSError) and type(error).__module__.startswith(("requests", "urllib3", "http."))
+
+
+def _seconds(value: Any) -> Optional[float]:
+    if isinstance(value, str):  # "12.5s", as in REST RetryInfo details
+        try:
+            return float(value.rstrip("s"))
+        except ValueError:
+            return None
+    if hasattr(value, "seconds"):  # a protobuf Duration
+        return value.seconds + getattr(value, "nanos", 0) / 1e9
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """The delay in seconds the server asked for before retrying, if it gave one."""
+    response = getattr(error, "response", None)
+    header = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+
+    for detail in getattr(error, "details", None) or []:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else getattr(detail, "retry_delay", None)
+        if delay is not None and (seconds := _seconds(delay)) is not None:
+            return seconds
+
+    match = _RETRY_IN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+@dataclass
+class ResiliencePolicy:
+    """How requests are retried, bounded and hedged."""
+    max_retries: int = 3
+    initial_backoff: float = 1.0
+    max_backoff: float = 30.0
+    deadline: Optional[float] = None    # seconds per request, retries included
+    hedge: bool = False
+    hedge_after: float = 5.0            # hedge delay until enough latencies are observed
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "ResiliencePolicy":
+        """
+            Read `LLM_CLI_MAX_RETRIES`, `LLM_CLI_DEADLINE` (e.g. `90s`), `LLM_CLI_HEDGE`
+            and `LLM_CLI_HEDGE_AFTER`; overrides that are not None take precedence.
+        """
+        policy = cls()
+
+        if os.environ.get("LLM_CLI_MAX_RETRIES"):
+            policy.max_retries = int(os.environ["LLM_CLI_MAX_RETRIES"])
+        if os.environ.get("LLM_CLI_DEADLINE"):
+            policy.deadline = parse_duration(os.environ["LLM_CLI_DEADLINE"])
+        if os.environ.get("LLM_CLI_HEDGE"):
+            policy.hedge = os.environ["LLM_CLI_HEDGE"].lower() not in ("0", "false", "no")
+        if os.environ.get("LLM_CLI_HEDGE_AFTER"):
+            policy.hedge_after = parse_duration(os.environ["LLM_CLI_HEDGE_AFTER"])
+
+        for name, value in overrides.items():
+            if value is not None:
+                setattr(policy, name, value)
+
+        return policy
+
+    def backoff(self, attempt: int, hint: Optional[float] = None) -> float:
+        """The delay before retry number `attempt` (from 1), never shorter than the server's hint."""
+        delay = random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** (attempt - 1)))
+        if hint is not None:
+            delay = max(delay, hint * random.uniform(1.0, 1.1))
+        return delay
+
+
+class Resilience:
+    """
+        Runs requests under a `ResiliencePolicy`.
+
+        Keeps a window of recent first-chunk latencies for the adaptive hedge delay.
+        Retries and hedges are counted on `stats` (a `UsageTracker`) when one is given.
+    """
+
+    def __init__(self, policy: ResiliencePolicy, stats: Any = None):
+        self.policy = policy
+        self.stats = stats
+        self.latencies = deque(maxlen=256)
+        self.lock = threading.Lock()
+
+    def request_options(self, timeout: Optional[float]) -> dict:
+        """SDK request options for one attempt: our own retries replace the SDK's."""
+        options = {"retry": None}
+        if timeout is not None:
+            options["timeout"] = timeout
+        return options
+
+    def hedge_delay(self) -> float:
+        """The adaptive hedge delay: the recent p95 first-chunk latency."""
+        with self.lock:
+            latencies = list(self.latencies)
+
+        if len(latencies) < self.policy.hedge_min_samples:
+            return self.policy.hedge_after
+        return percentile(latencies, self.policy.hedge_percentile)
+
+    def _count(self, **counts: int) -> None:
+        if self.stats is not None:
+            self.stats.add(**counts)
+
+    def call(self, request: Callable[[Optional[float]], T], hedge: bool = True, cancel: Optional[Callable[[T], None]] = None) -> T:
+        """
+            Run `request(timeout)` until it succeeds, retrying transient failures.
+
+            `timeout` is the time left before the deadline (None without one). `cancel`
+            is called with the result of a hedged copy that lost the race.
+        """
+        policy = self.policy
+        deadline = time.monotonic() + policy.deadline if policy.deadline else None
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            started = time.monotonic()
+
+            try:
+                if hedge and policy.hedge:
+                    result = self._hedged(request, remaining, cancel)
+                else:
+                    result = request(remaining)
+            except Exception as error:
+                attempt += 1
+                delay = self._backoff(error, attempt, deadline)
+                with tracing.span("retry_backoff", attempt=attempt, error=type(error).__name__, delay=delay):
+                    time.sleep(delay)
+                continue
+
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+            return result
+
+    async def call_async(self, request: Callable[[Optional[float]], Awaitable[T]], hedge: bool = True, cancel: Optional[Callable[[T], None]] = None) -> T:
+        """The asyncio counterpart of `call`, for a coroutine function `request`."""
+        policy = self.policy
+        deadline = time.monotonic() + policy.deadline if policy.deadline else None
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            started = time.monotonic()
+
+            try:
+                if hedge and policy.hedge:
+                    result = await self._hedged_async(request, remaining, cancel)
+                else:
+                    result = await request(remaining)
+            except Exception as error:
+                attempt += 1
+                delay = self._backoff(error, attempt, deadline)
+                with tracing.span("retry_backoff", attempt=attempt, error=type(error).__name__, delay=delay):
+                    await asyncio.sleep(delay)
+                continue
+
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+            return result
+
+    def _backoff(self, error: Exception, attempt: int, deadline: Optional[float]) -> float:
+        """The delay before retrying a failed attempt, raising its error when it is not to be retried."""
+        policy = self.policy
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"The request did not complete within its {policy.deadline:g}s deadline.") from error
+
+        if attempt > policy.max_retries or not is_retryable(error):
+            raise error
+
+        delay = policy.backoff(attempt, retry_after(error))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise error
+
+        self._count(retries=1)
+        return delay
+
+    def _hedged(self, request: Callable[[Optional[float]], T], remaining: Optional[float], cancel: Optional[Callable[[T], None]]) -> T:
+        delay = self.hedge_delay()
+        primary = _in_thread(request, remaining)
+
+        if remaining is not None and delay >= remaining:
+            return primary.result()
+
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+
+        self._count(hedges=1)
+        with tracing.span("hedge", after=delay) as span:
+            backup = _in_thread(request, remaining - delay if remaining is not None else None)
+            pending, error = {primary, backup}, None
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+
+                    if cancel is not None:
+                        loser = backup if future is primary else primary
+                        loser.add_done_callback(lambda f: f.exception() is None and cancel(f.result()))
+
+                    if future is backup:
+                        self._count(hedge_wins=1)
+                    span.set(winner="backup" if future is backup else "primary")
+                    return future.result()
+
+            raise error
+
+    async def _hedged_async(self, request: Callable[[Optional[float]], Awaitable[T]], remaining: Optional[float], cancel: Optional[Callable[[T], None]]) -> T:
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(request(remaining))
+
+        if remaining is not None and delay >= remaining:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count(hedges=1)
+        with tracing.span("hedge", after=delay) as span:
+            backup = asyncio.ensure_future(request(remaining - delay if remaining is not None else None))
+            pending, error = {primary, backup}, None
+
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                    for task in done:
+                        if task.exception() is not None:
+                            error = error or task.exception()
+                            continue
+
+                        # unlike a thread, the losing copy can be stopped outright
+                        loser = backup if task is primary else primary
+                        loser.cancel()
+                        if cancel is not None:
+                            loser.add_done_callback(
+                                lambda t: not t.cancelled() and t.exception() is None and cancel(t.result()))
+
+                        if task is backup:
+                            self._count(hedge_wins=1)
+                        span.set(winner="backup" if task is backup else "primary")
+                        return task.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+
+            raise error
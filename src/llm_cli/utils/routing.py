@@ -0,0 +1,222 @@
+"""
+Model routing: which model a request goes to, from its command, size and attachments.
+
+Quick requests, command completions and short text prompts, go to a fast model; long
+prompts and prompts with images or files go to the default model. With a cascade, a
+request starts on the fast model and is escalated to the default model only when the
+answer comes back empty or blocked.
+
+Every decision, and the latency and outcome of every request, is recorded in
+`routing.db`, so the thresholds can be tuned from real data with `lcli routing`.
+
+    LLM_CLI_MODEL               the default model (gemini-1.5-flash)
+    LLM_CLI_FAST_MODEL          the fast model (gemini-1.5-flash-8b)
+    LLM_CLI_SHORT_PROMPT_TOKENS text prompts up to this many tokens are short (200)
+"""
+import os
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from .constants import AUTO_MODEL as AUTO, DEFAULT_MODEL
+from .helpers import connect_db, get_cache_dir, parse_duration, percentile
+
+DEFAULT_FAST_MODEL = "gemini-1.5-flash-8b"
+DEFAULT_SHORT_PROMPT_TOKENS = 200
+DEFAULT_ROUTING_LOG_TTL = "30d"
+
+# Expired entries are deleted on a write at most this often, across processes.
+EXPIRY_INTERVAL_SECONDS = 24 * 3600
+
+# Commands whose requests are always quick, whatever their size.
+FAST_COMMANDS = ("completion",)
+
+# Finish reasons of an answer the model refused or was stopped from giving.
+BLOCKED_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII", "LANGUAGE", "OTHER"}
+
+
+def default_model() -> str:
+    return os.environ.get("LLM_CLI_MODEL") or DEFAULT_MODEL
+
+
+def fast_model() -> str:
+    return os.environ.get("LLM_CLI_FAST_MODEL") or DEFAULT_FAST_MODEL
+
+
+def short_prompt_tokens() -> int:
+    return int(os.environ.get("LLM_CLI_SHORT_PROMPT_TOKENS") or DEFAULT_SHORT_PROMPT_TOKENS)
+
+
+class Route(NamedTuple):
+    model: str
+    reason: str
+    escalation: tuple[str, ...] = ()  # models to escalate to, in order, with a cascade
+
+
+def route(command: str, requested: Optional[str] = AUTO, input_tokens: Optional[int] = None, attachments: int = 0, cascade: bool = False) -> Route:
+    """
+        Pick the model of a request.
+
+        A `requested` model other than `auto` is used as is. `input_tokens` is the
+        (estimated) size of the text prompt, None when it is not known up front, e.g.
+        for a chat. With `cascade`, an automatically routed request starts on the fast
+        model, and requests on the fast model escalate to the default model.
+    """
+    default, fast = default_model(), fast_model()
+
+    if requested and requested != AUTO:
+        model, reason = requested, "requested"
+    elif cascade:
+        model, reason = fast, "cascade"
+    elif command in FAST_COMMANDS:
+        model, reason = fast, "command"
+    elif attachments:
+        model, reason = default, "attachments"
+    elif input_tokens is not None and input_tokens <= short_prompt_tokens():
+        model, reason = fast, "short prompt"
+    else:
+        model, reason = default, "long prompt" if input_tokens is not None else "unsized"
+
+    # only the fast model escalates; a requested model is not traded for a lesser one
+    escalation = (default,) if cascade and model == fast and fast != default else ()
+    return Route(model, reason, escalation)
+
+
+def response_outcome(response: Any, streamed: bool = False) -> str:
+    """
+        Whether a response is `ok`, `empty` or `blocked`.
+
+        Of a streamed response only the first chunk has arrived, so it is only `blocked`
+        when the prompt itself was.
+    """
+    feedback = getattr(response, "prompt_feedback", None)
+    if feedback is not None and getattr(feedback, "block_reason", 0):
+        return "blocked"
+    if streamed:
+        return "ok"
+
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return "empty"
+
+    candidate = candidates[0]
+    if getattr(candidate.finish_reason, "name", "") in BLOCKED_FINISH_REASONS:
+        return "blocked"
+    if not any(getattr(part, "text", "") for part in candidate.content.parts):
+        return "empty"
+    return "ok"
+
+
+class RoutingLog:
+    """Routing decisions and per-model request latencies and outcomes, for `lcli routing`."""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else parse_duration(
+            os.environ.get("LLM_CLI_ROUTING_LOG_TTL") or DEFAULT_ROUTING_LOG_TTL)
+        self.lock = threading.Lock()
+        self.db = connect_db(path or os.path.join(get_cache_dir(), "routing.db"))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS decisions (
+                time REAL NOT NULL,
+                command TEXT NOT NULL,
+                model TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                input_tokens INTEGER,
+                attachments INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS requests (
+                time REAL NOT NULL,
+                command TEXT NOT NULL,
+                model TEXT NOT NULL,
+                latency REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                stream INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS decisions_time ON decisions (time);
+            CREATE INDEX IF NOT EXISTS requests_time ON requests (time);
+            """
+        )
+        self.expired_at = None  # when expired entries were last deleted, read on the first write
+
+    def _expire(self, now: float) -> None:
+        """Delete the expired entries, unless that was done within the last day."""
+        if self.expired_at is None:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'expired_at'").fetchone()
+            self.expired_at = row[0] if row else 0.0
+        if now - self.expired_at < EXPIRY_INTERVAL_SECONDS:
+            return
+
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM decisions WHERE time < ?", (now - self.ttl,))
+            self.db.execute("DELETE FROM requests WHERE time < ?", (now - self.ttl,))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('expired_at', ?)", (now,))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.expired_at = now
+
+    def _since(self, since: float) -> float:
+        # entries past the TTL may not have been deleted yet
+        return max(since, time.time() - self.ttl)
+
+    def decision(self, command: str, chosen: Route, input_tokens: Optional[int] = None, attachments: int = 0) -> None:
+        with self.lock:
+            self._expire(time.time())
+            self.db.execute(
+                "INSERT INTO decisions VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), command, chosen.model, chosen.reason, input_tokens, attachments))
+
+    def request(self, command: str, model: str, latency: float, outcome: str, stream: bool = False, prompt_tokens: int = 0, output_tokens: int = 0) -> None:
+        """Record one request to one model; `latency` is to the first chunk of streamed responses."""
+        with self.lock:
+            self._expire(time.time())
+            self.db.execute(
+                "INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), command, model.removeprefix("models/"), latency, outcome, int(stream),
+                 prompt_tokens, output_tokens))
+
+    def decisions(self, since: float = 0) -> list[tuple[str, str, str, int]]:
+        """How often each model was picked for each command and reason."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT command, model, reason, COUNT(*) FROM decisions WHERE time >= ? "
+                "GROUP BY command, model, reason ORDER BY command, COUNT(*) DESC", (self._since(since),)).fetchall()
+
+    def stats(self, since: float = 0) -> list[dict]:
+        """Latency percentiles and outcome counts per command, model and streaming."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT command, model, stream, latency, outcome, prompt_tokens FROM requests WHERE time >= ?",
+                (self._since(since),)).fetchall()
+
+        groups = {}
+        for command, model, stream, latency, outcome, prompt_tokens in rows:
+            group = groups.setdefault((command, model, bool(stream)), {"latencies": [], "outcomes": {}, "prompt_tokens": 0})
+            group["latencies"].append(latency)
+            group["outcomes"][outcome] = group["outcomes"].get(outcome, 0) + 1
+            group["prompt_tokens"] += prompt_tokens
+
+        return [
+            {
+                "command": command, "model": model, "stream": stream,
+                "requests": len(group["latencies"]),
+                "p50": percentile(group["latencies"], 50), "p95": percentile(group["latencies"], 95),
+                "mean_prompt_tokens": group["prompt_tokens"] / len(group["latencies"]),
+                "outcomes": group["outcomes"],
+            }
+            for (command, model, stream), group in sorted(groups.items())
+        ]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM decisions")
+            self.db.execute("DELETE FROM requests")
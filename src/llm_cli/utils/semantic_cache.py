@@ -0,0 +1,191 @@
+"""
+An opt-in semantic response cache: prompts that mean the same as one answered before
+(rephrasings, whitespace or casing variants) are served the earlier answer.
+
+Each prompt is embedded and compared, by cosine similarity in one NumPy matrix product,
+with the embeddings of the prompts answered before under the same model, system
+instruction and generation config. The best match above the threshold is a hit.
+
+Embeddings live in a memory-mapped float32 matrix with one row per slot; the responses
+and the slot bookkeeping live in SQLite. The cache holds at most `max_entries` answers,
+evicting the least recently used, and entries expire with the response cache TTL.
+
+Needs NumPy (`pip install "llm-cli[semantic]"`). Prompts are embedded by the Gemini
+embedding API, one request per prompt: local embeddings of word overlap score prompts
+that differ in one word, such as "ascending" and "descending", above any useful threshold.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+from .cache import DEFAULT_CACHE_TTL
+from .helpers import connect_db, get_cache_dir, parse_duration
+
+try:
+    import numpy as np
+except ImportError:  # an optional dependency
+    np = None
+
+DEFAULT_SEMANTIC_THRESHOLD = 0.9
+DEFAULT_SEMANTIC_MAX_ENTRIES = 10000
+
+
+class GeminiEmbedder:
+    """Embeddings from the Gemini embedding API; one request per batch of prompts."""
+
+    def __init__(self, model: str = "models/text-embedding-004"):
+        self.model = model
+        self.name = model.removeprefix("models/")
+
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        import google.generativeai as genai
+
+        result = genai.embed_content(model=self.model, content=texts, task_type="semantic_similarity")
+        return np.asarray(result["embedding"], dtype=np.float32)
+
+
+def cache_scope(model_name: str, system_instruction: str, generation_config: Optional[dict]) -> str:
+    """Answers are only shared between prompts sent with the same model and settings."""
+    return hashlib.sha256(json.dumps(
+        [model_name, system_instruction or "", generation_config or {}], sort_keys=True, default=str
+    ).encode("utf-8")).hexdigest()
+
+
+def _checksum(vector: "np.ndarray") -> str:
+    return hashlib.blake2b(vector.tobytes(), digest_size=8).hexdigest()
+
+
+def clear_semantic_cache() -> None:
+    """Remove every semantic cache, for every embedder."""
+    shutil.rmtree(get_cache_dir("semantic"), ignore_errors=True)
+
+
+class SemanticCache:
+    """Responses looked up by the similarity of their prompt's embedding."""
+
+    def __init__(self, embedder=None, threshold: Optional[float] = None, max_entries: Optional[int] = None, ttl: Optional[float] = None, path: Optional[str] = None):
+        if np is None:
+            raise ValueError('The semantic cache needs NumPy. Install it with: pip install "llm-cli[semantic]"')
+
+        self.embedder = embedder or GeminiEmbedder()
+        self.threshold = threshold if threshold is not None else float(
+            os.environ.get("LLM_CLI_SEMANTIC_THRESHOLD") or DEFAULT_SEMANTIC_THRESHOLD)
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.environ.get("LLM_CLI_SEMANTIC_CACHE_MAX") or DEFAULT_SEMANTIC_MAX_ENTRIES)
+        self.ttl = ttl if ttl is not None else parse_duration(
+            os.environ.get("LLM_CLI_CACHE_TTL", DEFAULT_CACHE_TTL))
+
+        # embeddings of different embedders can't be compared, so each gets its own cache
+        self.path = path or get_cache_dir("semantic", self.embedder.name)
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = connect_db(os.path.join(self.path, "entries.db"))
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                slot INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_scope ON entries (scope, created)")
+        self.vectors = None
+
+    def _matrix(self, dimensions: int) -> "np.ndarray":
+        """The embedding matrix, one row per slot, sized on first use."""
+        if self.vectors is None or self.vectors.shape[1] != dimensions:
+            path = os.path.join(self.path, f"vectors-{dimensions}.f32")
+            size = self.max_entries * dimensions * 4
+
+            with open(path, "ab") as file:
+                if file.tell() != size:
+                    file.truncate(size)  # sparse where the file system allows it
+
+            self.db.execute("DELETE FROM entries WHERE slot >= ?", (self.max_entries,))
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(self.max_entries, dimensions))
+
+        return self.vectors
+
+    def embed(self, text: str) -> "np.ndarray":
+        """A unit length embedding of a prompt."""
+        vector = self.embedder.embed([text])[0]
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def get(self, embedding: "np.ndarray", scope: str) -> Optional[dict]:
+        """The response of the most similar prompt in `scope`, if it is similar enough."""
+        now = time.time()
+
+        with self.lock:
+            slots = np.fromiter(
+                (slot for slot, in self.db.execute(
+                    "SELECT slot FROM entries WHERE scope = ? AND created >= ?", (scope, now - self.ttl))),
+                dtype=np.int64)
+            if not len(slots):
+                return None
+
+            # the rows are unit length, so their dot products with the prompt are cosine similarities;
+            # one product over the used rows is cheaper than gathering the scope's rows first
+            similarities = (self._matrix(len(embedding))[:int(slots.max()) + 1] @ embedding)[slots]
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            slot = int(slots[best])
+            row = self.db.execute("SELECT checksum, value FROM entries WHERE slot = ?", (slot,)).fetchone()
+
+            # another process may be reusing the slot for a new prompt
+            if row is None or row[0] != _checksum(self.vectors[slot]):
+                return None
+
+            self.db.execute("UPDATE entries SET accessed = ? WHERE slot = ?", (now, slot))
+
+        return json.loads(row[1])
+
+    def put(self, embedding: "np.ndarray", scope: str, value: dict) -> None:
+        """Store a response, in a free slot or the least recently used one."""
+        data = json.dumps(value, default=str)
+        now = time.time()
+
+        with self.lock:
+            matrix = self._matrix(len(embedding))
+
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+
+                used = self.db.execute("SELECT COUNT(*), COALESCE(MAX(slot), -1) FROM entries").fetchone()
+                if used[0] < self.max_entries:
+                    # the first free slot: past the highest one, or a gap left by an eviction
+                    slot = used[1] + 1 if used[1] + 1 < self.max_entries else self.db.execute(
+                        "SELECT MIN(slot + 1) FROM entries WHERE slot + 1 NOT IN (SELECT slot FROM entries)"
+                    ).fetchone()[0]
+                    if slot is None or slot >= self.max_entries:
+                        slot = 0
+                else:
+                    slot = self.db.execute(
+                        "SELECT slot FROM entries ORDER BY accessed ASC LIMIT 1").fetchone()[0]
+
+                # the vector is written before the row that makes it visible is committed
+                matrix[slot] = embedding
+                matrix.flush()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (slot, scope, _checksum(matrix[slot]), data, now, now))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"embedder": self.embedder.name, "entries": entries, "max_entries": self.max_entries,
+                "threshold": self.threshold}
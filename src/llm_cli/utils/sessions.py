@@ -0,0 +1,180 @@
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .helpers import estimate_tokens, get_cache_dir
+
+
+@dataclass
+class HistoryPolicy:
+    """
+        Bounds how much chat history is sent with each message.
+
+        The most recent turns (a user message and its reply) are kept within `max_turns`
+        and `max_tokens` on every message. With `summarize`, turns are folded into a
+        summary sent ahead of the window as they fall out of it; the summary call only
+        takes the previous summary and the turns leaving, so it stays small.
+    """
+    max_turns: Optional[int] = 20
+    max_tokens: Optional[int] = None
+    summarize: bool = False
+
+    def window(self, turns: list[tuple[str, str]]) -> int:
+        """Get the number of most recent turns that fit the policy (at least one)."""
+        count, tokens = 0, 0
+
+        for user, model in reversed(turns):
+            tokens += estimate_tokens(user) + estimate_tokens(model)
+
+            if count and (
+                (self.max_turns is not None and count >= self.max_turns)
+                or (self.max_tokens is not None and tokens > self.max_tokens)
+            ):
+                break
+            count += 1
+
+        return count
+
+
+@dataclass
+class ChatSession:
+    """A chat session persisted as an append-only JSONL log."""
+    id: str
+    path: str
+    turns: list[tuple[str, str]] = field(default_factory=list)
+    summary: str = ""
+    summarized_turns: int = 0
+
+    def _append(self, *records: dict) -> None:
+        # one write per call, so a turn is either fully logged or not at all
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(data)
+
+    def add_turn(self, message: str, reply: str) -> None:
+        """Record a user message and the model's reply."""
+        now = time.time()
+        self.turns.append((message, reply))
+        self._append(
+            {"role": "user", "text": message, "ts": now},
+            {"role": "model", "text": reply, "ts": now},
+        )
+
+    def set_summary(self, summary: str, covers: int) -> None:
+        """Record a summary of the first `covers` turns."""
+        self.summary, self.summarized_turns = summary, covers
+        self._append(
+            {"role": "summary", "text": summary, "covers": covers, "ts": time.time()})
+
+    def history(self, policy: HistoryPolicy, summarize: Optional[Callable[[str], str]] = None) -> list[dict]:
+        """
+            Build the chat history to send with the next message.
+
+            `summarize` is called with a transcript when older turns need compacting.
+        """
+        window = policy.window(self.turns)
+        start = len(self.turns) - window
+
+        if policy.summarize and summarize is not None:
+            if start > self.summarized_turns:
+                # only turns that left the window: the window is always sent as is
+                transcript = "\n\n".join(
+                    f"User: {user}\nAssistant: {model}"
+                    for user, model in self.turns[self.summarized_turns:start]
+                )
+                if self.summary:
+                    transcript = f"Earlier summary:\n{self.summary}\n\n{transcript}"
+
+                self.set_summary(summarize(transcript), start)
+
+            # a session resumed with a wider window: its summarized turns aren't sent twice
+            start = max(start, self.summarized_turns)
+
+        history = []
+        if self.summary and start >= self.summarized_turns:
+            history += [
+                {"role": "user", "parts": [
+                    f"Summary of our conversation so far:\n{self.summary}"]},
+                {"role": "model", "parts": ["Understood."]},
+            ]
+
+        for user, model in self.turns[start:]:
+            history += [
+                {"role": "user", "parts": [user]},
+                {"role": "model", "parts": [model]},
+            ]
+
+        return history
+
+
+class ChatSessionStore:
+    """Chat session logs stored under the llm-cli cache directory."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or get_cache_dir("sessions")
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def create(self) -> ChatSession:
+        """Start a new, empty session."""
+        session_id = time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(2)
+        return ChatSession(id=session_id, path=self._path(session_id))
+
+    def load(self, session_id: str) -> ChatSession:
+        """Replay a session log."""
+        path = self._path(session_id)
+        if os.path.basename(session_id) != session_id or not os.path.exists(path):
+            raise ValueError(f"Chat session {session_id} not found.")
+
+        session = ChatSession(id=session_id, path=path)
+        pending = None
+
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a torn final line from an interrupted write
+
+                if record["role"] == "user":
+                    pending = record["text"]
+                elif record["role"] == "model" and pending is not None:
+                    session.turns.append((pending, record["text"]))
+                    pending = None
+                elif record["role"] == "summary":
+                    session.summary, session.summarized_turns = record["text"], record["covers"]
+
+        return session
+
+    def list(self) -> list[dict]:
+        """List sessions, most recently updated first."""
+        sessions = []
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".jsonl"):
+                continue
+
+            turns, preview = 0, ""
+            with open(entry.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if '"role": "user"' in line:
+                        turns += 1
+                        if not preview:
+                            try:
+                                preview = json.loads(line)["text"]
+                            except json.JSONDecodeError:
+                                pass
+
+            sessions.append({
+                "id": entry.name[:-len(".jsonl")],
+                "updated": entry.stat().st_mtime,
+                "turns": turns,
+                "preview": preview,
+            })
+
+        return sorted(sessions, key=lambda session: session["updated"], reverse=True)
@@ -0,0 +1,103 @@
+"""
+Startup cost benchmark for the CLI.
+
+Runs `python -X importtime` in a fresh interpreter and fails when importing the CLI
+goes over a time budget or pulls in modules that only network commands need.
+
+The import is timed a few times and the fastest run counts, so a single slow run on a
+busy machine doesn't fail the check.
+
+Usage: python -m llm_cli.utils.startup [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import subprocess
+import sys
+from typing import Optional
+
+# Modules that must only be imported lazily, inside commands that talk to the API.
+LAZY_MODULES = (
+    "google.generativeai",
+    "google.ai.generativelanguage",
+    "grpc",
+    "google.protobuf",
+)
+
+DEFAULT_BUDGET_MS = 150
+DEFAULT_RUNS = 5
+
+
+def _import_once(module: str) -> tuple[float, dict[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        try:
+            timings[name.strip()] = int(cumulative.strip())
+        except ValueError:
+            continue  # the header line
+
+    return timings.get(module, 0) / 1000, timings
+
+
+def measure_import_time(module: str = "llm_cli.cli", runs: int = DEFAULT_RUNS) -> tuple[float, dict[str, int]]:
+    """
+        Import a module in `runs` fresh interpreters with `-X importtime`.
+
+        Returns the cumulative import time of the module in milliseconds, of the fastest
+        run, and a mapping of every module that run imported to its own cumulative time
+        in microseconds.
+    """
+    return min((_import_once(module) for _ in range(max(runs, 1))), key=lambda run: run[0])
+
+
+def check_startup_budget(module: str = "llm_cli.cli", budget_ms: float = DEFAULT_BUDGET_MS, measured: Optional[tuple[float, dict[str, int]]] = None) -> list[str]:
+    """
+        Return a list of startup budget violations, empty if the import is within budget.
+
+        `measured` is a result of `measure_import_time`, which is run when it is not given.
+    """
+    total_ms, timings = measured or measure_import_time(module)
+    problems = []
+
+    if total_ms > budget_ms:
+        problems.append(
+            f"Importing {module} took {total_ms:.1f} ms, over the {budget_ms:.0f} ms budget.")
+
+    eager = sorted(
+        name for name in timings
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    if eager:
+        problems.append(
+            f"Importing {module} eagerly loads {', '.join(eager[:5])}" + (" ..." if len(eager) > 5 else ""))
+
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="llm_cli.cli")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    # measured once: the number printed is the number checked
+    measured = measure_import_time(args.module, args.runs)
+    print(f"import {args.module}: {measured[0]:.1f} ms, best of {args.runs} (budget {args.budget_ms:.0f} ms)")
+
+    problems = check_startup_budget(args.module, args.budget_ms, measured)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
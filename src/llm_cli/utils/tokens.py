@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from .constants import MODEL_PRICING
+from .helpers import connect_db, get_cache_dir
+
+
+class TokenCountCache:
+    """
+        Memoized token counts keyed by model and content hash.
+
+        Counting tokens is a network call; identical content never needs to be counted twice.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.lock = threading.Lock()
+        self.db = connect_db(path or os.path.join(get_cache_dir(), "tokens.db"))
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS counts (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+
+    def get(self, model: str, content_hash: str) -> Optional[int]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT tokens FROM counts WHERE model = ? AND hash = ?", (model, content_hash)
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, model: str, content_hash: str, tokens: int) -> None:
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?)", (model, content_hash, tokens))
+
+
+class UsageTracker:
+    """
+        Accumulates the usage metadata reported with each response.
+
+        Thread safe, so one tracker can be shared by concurrent batch workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.started = None
+        self.finished = None
+
+    def start(self) -> None:
+        """Mark the start of the measured run, if not marked yet."""
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+
+    def record(self, response: Any) -> None:
+        """Record the usage metadata of a (fully iterated) response."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_token_count
+            self.output_tokens += usage.candidates_token_count
+            self.cached_tokens += getattr(usage, "cached_content_token_count", 0)
+            self.finished = time.monotonic()
+
+    def add(self, **counts: int) -> None:
+        """Add to the request counters (`retries`, `hedges`, `hedge_wins`)."""
+        with self.lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def summary(self, model_name: str) -> dict:
+        """Totals for the run, with throughput and an estimated cost."""
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        total = self.prompt_tokens + self.output_tokens
+
+        input_price, output_price = MODEL_PRICING.get(
+            model_name.removeprefix("models/"), (0.0, 0.0))
+        cost = (self.prompt_tokens * input_price + self.output_tokens * output_price) / 1_000_000
+
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "total_tokens": total,
+            "elapsed_seconds": elapsed,
+            "tokens_per_second": total / elapsed if elapsed else 0.0,
+            "cost_usd": cost,
+        }
@@ -0,0 +1,166 @@
+"""
+Span tracing for the hot path of a command.
+
+Tracing is off unless `enable` is called (`lcli --trace out.json ...`, or with
+`LLM_CLI_METRICS` set). While it is off, `span` returns one shared no-op object, so
+instrumented code pays a global lookup and nothing else.
+
+Finished spans are written as Chrome trace events (load them in chrome://tracing or
+https://ui.perfetto.dev) and/or summarized on one line of stderr.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed phase; use it as a context manager or call `end` explicitly."""
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter_ns()
+        self.finished = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.end()
+        return False
+
+    def set(self, **args: Any) -> None:
+        """Attach arguments such as request ids or token counts."""
+        self.args.update(args)
+
+    def end(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.thread, self.args)
+
+
+class Tracer:
+    """Collects finished spans of one process."""
+
+    def __init__(self, origin_ns: Optional[int] = None):
+        self.origin = origin_ns or time.perf_counter_ns()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, name: str, start_ns: int, end_ns: int, thread: Optional[int] = None, args: Optional[dict] = None) -> None:
+        with self.lock:
+            self.events.append((name, start_ns, end_ns, thread or threading.get_ident(), args or {}))
+
+    def chrome_trace(self) -> dict:
+        """The spans as Chrome trace "complete" events, in microseconds from the origin."""
+        pid = os.getpid()
+
+        with self.lock:
+            events = list(self.events)
+
+        return {
+            "traceEvents": [
+                {
+                    "name": name, "cat": "lcli", "ph": "X", "pid": pid, "tid": thread,
+                    "ts": (start - self.origin) / 1000, "dur": (end - start) / 1000, "args": args,
+                }
+                for name, start, end, thread, args in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def summary(self) -> str:
+        """One line with the total time, the time spent per phase and the tokens used."""
+        totals, counts, tokens = {}, {}, {"prompt_tokens": 0, "output_tokens": 0}
+
+        with self.lock:
+            events = list(self.events)
+
+        for name, start, end, _, args in events:
+            totals[name] = totals.get(name, 0) + end - start
+            counts[name] = counts.get(name, 0) + 1
+            for key in tokens:
+                tokens[key] += args.get(key, 0)
+
+        parts = [f"lcli {(time.perf_counter_ns() - self.origin) / 1e6:.1f} ms"]
+        for name, total in totals.items():
+            count = f" {counts[name]}x" if counts[name] > 1 else ""
+            parts.append(f"{name}{count} {total / 1e6:.1f} ms")
+        if tokens["prompt_tokens"] or tokens["output_tokens"]:
+            parts.append(f"tokens {tokens['prompt_tokens']} in / {tokens['output_tokens']} out")
+
+        return " | ".join(parts)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable(origin_ns: Optional[int] = None) -> Tracer:
+    """Start collecting spans, timed from `origin_ns` (a `perf_counter_ns` value) or now."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(origin_ns)
+    return _tracer
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def request_id() -> Optional[str]:
+    """A fresh id to correlate the spans of one request, or None when tracing is off."""
+    if _tracer is None:
+        return None
+
+    import secrets
+    return secrets.token_hex(8)
+
+
+def span(name: str, **args: Any):
+    """Open a span, or get a no-op stand-in when tracing is off."""
+    if _tracer is None:
+        return _NOOP
+    return Span(_tracer, name, args)
+
+
+def record(name: str, start_ns: int, end_ns: int, **args: Any) -> None:
+    """Record a span measured before tracing was enabled, such as the CLI import."""
+    if _tracer is not None:
+        _tracer.record(name, start_ns, end_ns, args=args)
+
+
+def finish(trace_path: Optional[str] = None, metrics: bool = False) -> None:
+    """Write the collected spans to `trace_path` and/or the one-line summary to stderr."""
+    if _tracer is None:
+        return
+
+    if trace_path:
+        with open(trace_path, "w") as file:
+            json.dump(_tracer.chrome_trace(), file)
+
+    if metrics:
+        print(_tracer.summary(), file=sys.stderr)
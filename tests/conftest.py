@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from fake_gemini import FakeGeminiConfig, FakeGeminiServer
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    """Keep every test's caches, keys and daemon socket to itself."""
+    for name in list(os.environ):
+        if name.startswith("LLM_CLI_") or name.startswith("GOOGLE_API_KEY"):
+            monkeypatch.delenv(name)
+
+    monkeypatch.setenv("LLM_CLI_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("LLM_CLI_NO_DAEMON", "1")
+    monkeypatch.setenv("LLM_CLI_SOCKET", str(tmp_path / "lcli.sock"))
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    # for the lcli processes some tests start
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [SRC, os.environ.get("PYTHONPATH")])))
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """A local stand-in for the Gemini API, which clients created in the test talk to."""
+    server = FakeGeminiServer(FakeGeminiConfig(latency_ms=1, chunk_interval_ms=1, chunks=3))
+    server.start()
+    monkeypatch.setenv("LLM_CLI_API_ENDPOINT", server.url)
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
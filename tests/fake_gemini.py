@@ -0,0 +1,349 @@
+"""
+A local stand-in for the Gemini REST API, used by the tests and benchmarks.
+
+Serves `generateContent`, `streamGenerateContent`, `countTokens` (a token per word of
+text), `batchEmbedContents` (hashed words and word pairs), file uploads (simple and
+resumable) and file listings and lookups with configurable latency, chunk cadence and
+error rate, so the client's own overhead can be measured without the network or a
+quota. Requests made with an `--exhausted-key`
+are answered with quota errors, and requests to a `--blocked-model` with answers
+blocked for safety.
+
+Usage: python tests/fake_gemini.py [--port 0] [--latency-ms 50] ...
+Prints the URL it listens on as its first line of output.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class FakeGeminiConfig:
+    """How the fake server behaves."""
+    latency_ms: float = 50.0         # before the first (or only) chunk
+    chunk_interval_ms: float = 10.0  # between streamed chunks
+    chunks: int = 8
+    chunk_text: str = "lorem ipsum dolor sit amet "
+    error_rate: float = 0.0          # fraction of requests answered with 503
+    exhausted_keys: tuple[str, ...] = ()  # API keys answered with 429
+    blocked_models: tuple[str, ...] = ()  # models whose answers are blocked
+
+
+def discovery_document(root_url: str) -> dict:
+    """The subset of the Files API discovery document the client uses for uploads."""
+    return {
+        "kind": "discovery#restDescription",
+        "name": "generativelanguage",
+        "version": "v1beta",
+        "rootUrl": root_url,
+        "servicePath": "",
+        "resources": {"media": {"methods": {"upload": {
+            "id": "generativelanguage.media.upload",
+            "path": "v1beta/files",
+            "httpMethod": "POST",
+            "request": {"$ref": "CreateFileRequest"},
+            "response": {"$ref": "CreateFileResponse"},
+            "supportsMediaUpload": True,
+            "mediaUpload": {"accept": ["*/*"], "protocols": {
+                "simple": {"multipart": True, "path": "/upload/v1beta/files"},
+                "resumable": {"multipart": True, "path": "/resumable/upload/v1beta/files"},
+            }},
+        }}}},
+        "schemas": {
+            "CreateFileRequest": {"id": "CreateFileRequest", "type": "object",
+                                  "properties": {"file": {"type": "object"}}},
+            "CreateFileResponse": {"id": "CreateFileResponse", "type": "object"},
+        },
+    }
+
+
+def _count_words(value) -> int:
+    """Count the words of every text part of a request, standing in for its tokens."""
+    if isinstance(value, dict):
+        return sum(len(item.split()) if key == "text" and isinstance(item, str) else _count_words(item)
+                   for key, item in value.items())
+    if isinstance(value, list):
+        return sum(_count_words(item) for item in value)
+    return 0
+
+
+def _embedding(text: str, dimensions: int = 256) -> list[float]:
+    """Embed the words and word pairs of a text, so case, spacing and punctuation do not change it."""
+    words = re.findall(r"\w+", text.lower())
+    vector = [0.0] * dimensions
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    return vector
+
+
+def _text(content: dict) -> str:
+    return " ".join(part.get("text", "") for part in content.get("parts", []))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the real API
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _json(self, status: int, payload: dict, headers: dict = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _fail(self) -> bool:
+        """Answer with an injected error, at the configured rate, or a quota error for an exhausted key."""
+        api_key = self.headers.get("x-goog-api-key") or parse_qs(urlparse(self.path).query).get("key", [""])[0]
+        if api_key in self.server.config.exhausted_keys:
+            self._json(429, {"error": {
+                "code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}})
+            return True
+
+        if random.random() >= self.server.config.error_rate:
+            return False
+
+        self._json(503, {"error": {
+            "code": 503, "message": "Injected failure.", "status": "UNAVAILABLE"}})
+        return True
+
+    def _chunk(self, index: int, last: bool) -> dict:
+        config = self.server.config
+        chunk = {"candidates": [{
+            "content": {"role": "model", "parts": [{"text": config.chunk_text}]},
+            "index": 0,
+        }]}
+
+        if last:
+            chunk["candidates"][0]["finishReason"] = "STOP"
+            chunk["usageMetadata"] = {
+                "promptTokenCount": 8,
+                "candidatesTokenCount": config.chunks * 4,
+                "totalTokenCount": 8 + config.chunks * 4,
+            }
+        return chunk
+
+    def _blocked(self, path: str) -> bool:
+        """Answer a request to a blocked model with an empty, safety-blocked candidate."""
+        model = path.rsplit("/", 1)[-1].split(":", 1)[0]
+        if model not in self.server.config.blocked_models:
+            return False
+
+        time.sleep(self.server.config.latency_ms / 1000)
+        self._json(200, {"candidates": [{"finishReason": "SAFETY", "index": 0}],
+                         "usageMetadata": {"promptTokenCount": 8, "totalTokenCount": 8}})
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == "/$discovery/rest":
+            host = self.headers.get("Host")
+            return self._json(200, discovery_document(f"http://{host}/"))
+
+        if url.path == "/v1beta/files":
+            return self._json(200, {"files": list(self.server.files.values())})
+
+        if url.path.startswith("/v1beta/files/"):
+            file = self.server.files.get(url.path[len("/v1beta/"):])
+            if file is None:
+                return self._json(404, {"error": {
+                    "code": 404, "message": "File not found.", "status": "NOT_FOUND"}})
+            return self._json(200, file)
+
+        self._json(404, {"error": {"code": 404, "message": url.path, "status": "NOT_FOUND"}})
+
+    def do_DELETE(self):
+        self.server.files.pop(urlparse(self.path).path[len("/v1beta/"):], None)
+        self._json(200, {})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        config = self.server.config
+
+        if url.path.endswith(":generateContent"):
+            self._body()
+            if self._fail() or self._blocked(url.path):
+                return
+
+            time.sleep(config.latency_ms / 1000)
+            response = self._chunk(0, last=True)
+            response["candidates"][0]["content"]["parts"][0]["text"] = config.chunk_text * config.chunks
+            return self._json(200, response)
+
+        if url.path.endswith(":countTokens"):
+            return self._json(200, {"totalTokens": _count_words(json.loads(self._body() or b"{}"))})
+
+        if url.path.endswith(":batchEmbedContents"):
+            requests = json.loads(self._body() or b"{}").get("requests", [])
+            if self._fail():
+                return
+            return self._json(200, {"embeddings": [
+                {"values": _embedding(_text(request.get("content", {})))} for request in requests]})
+
+        if url.path.endswith(":streamGenerateContent"):
+            self._body()
+            if self._fail():
+                return
+            return self._stream()
+
+        if url.path in ("/upload/v1beta/files", "/resumable/upload/v1beta/files"):
+            query = parse_qs(url.query)
+
+            if "upload_id" in query:
+                return self._resume(query["upload_id"][0])
+
+            data = self._body()
+            if self._fail():
+                return
+
+            if query.get("uploadType") != ["resumable"]:
+                return self._json(200, {"file": self._store(data, self.headers.get("Content-Type", ""))})
+
+            upload_id = secrets.token_hex(8)
+            self.server.uploads[upload_id] = (json.loads(data or b"{}"), bytearray())
+            host = self.headers.get("Host")
+            return self._json(200, {}, {
+                "Location": f"http://{host}/upload/v1beta/files?upload_id={upload_id}"})
+
+        self._json(404, {"error": {"code": 404, "message": url.path, "status": "NOT_FOUND"}})
+
+    do_PUT = do_POST
+
+    def _stream(self) -> None:
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: str) -> None:
+            encoded = data.encode("utf-8")
+            self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+            self.wfile.flush()
+
+        time.sleep(config.latency_ms / 1000)
+        for index in range(config.chunks):
+            if index:
+                time.sleep(config.chunk_interval_ms / 1000)
+            last = index == config.chunks - 1
+            write(("[" if not index else ",") + json.dumps(self._chunk(index, last)) + ("]" if last else ""))
+
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _resume(self, upload_id: str) -> None:
+        metadata, data = self.server.uploads[upload_id]
+
+        # Content-Range: bytes <first>-<last>/<total>, or bytes */<total> for a status query
+        span, _, total = self.headers.get("Content-Range", "").rpartition("/")
+        first = span.removeprefix("bytes ").partition("-")[0]
+        if first.isdigit():
+            del data[int(first):]  # a chunk sent again after a lost response replaces the first copy
+        data += self._body()
+
+        if total == "*" or not total or len(data) < int(total):
+            headers = {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+            return self._json(308, {}, headers)
+
+        del self.server.uploads[upload_id]
+        self._json(200, {"file": self._store(bytes(data), "", metadata.get("file", {}))})
+
+    def _store(self, data: bytes, content_type: str, metadata: dict = None) -> dict:
+        if metadata is None and content_type.startswith("multipart/"):
+            # the first part is the JSON metadata, the second the media
+            message = BytesParser().parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode("ascii") + data)
+            metadata_part, media_part = message.get_payload()
+            metadata = json.loads(metadata_part.get_payload(decode=True)).get("file", {})
+            data = media_part.get_payload(decode=True)
+
+        metadata = metadata or {}
+        name = metadata.get("name") or f"files/{secrets.token_hex(6)}"
+        now = time.time()
+        timestamp = lambda seconds: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+        file = {
+            "name": name,
+            "displayName": metadata.get("displayName", ""),
+            "mimeType": "application/octet-stream",
+            "sizeBytes": str(len(data)),
+            "createTime": timestamp(now),
+            "updateTime": timestamp(now),
+            "expirationTime": timestamp(now + 48 * 3600),
+            "sha256Hash": base64.b64encode(hashlib.sha256(data).digest()).decode("ascii"),
+            "uri": f"http://{self.headers.get('Host')}/v1beta/{name}",
+            "state": "ACTIVE",
+        }
+        self.server.files[name] = file
+        return file
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """The fake API server; call `serve_forever` (e.g. in a thread) to start answering."""
+    daemon_threads = True
+
+    def __init__(self, config: FakeGeminiConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeGeminiConfig()
+        self.files = {}
+        self.uploads = {}
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=FakeGeminiConfig.latency_ms)
+    parser.add_argument("--chunk-interval-ms", type=float, default=FakeGeminiConfig.chunk_interval_ms)
+    parser.add_argument("--chunks", type=int, default=FakeGeminiConfig.chunks)
+    parser.add_argument("--error-rate", type=float, default=FakeGeminiConfig.error_rate)
+    parser.add_argument("--exhausted-key", action="append", default=[])
+    parser.add_argument("--blocked-model", action="append", default=[])
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(FakeGeminiConfig(
+        args.latency_ms, args.chunk_interval_ms, max(args.chunks, 1), error_rate=args.error_rate,
+        exhausted_keys=tuple(args.exhausted_key), blocked_models=tuple(args.blocked_model)),
+        args.host, args.port)
+    print(server.url, flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
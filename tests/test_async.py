@@ -0,0 +1,210 @@
+import asyncio
+import threading
+
+from google.generativeai import protos
+
+from llm_cli.api import gemini as gemini_module
+from llm_cli.api.async_gemini import AsyncGemini
+from llm_cli.api.gemini import Gemini
+from llm_cli.utils.cache import ResponseCache
+from llm_cli.utils.resilience import ResiliencePolicy
+from llm_cli.utils.routing import RoutingLog
+
+import fake_gemini
+
+
+def answer(text: str) -> protos.GenerateContentResponse:
+    return protos.GenerateContentResponse(
+        candidates=[protos.Candidate(
+            content=protos.Content(role="model", parts=[protos.Part(text=text)]),
+            finish_reason=protos.Candidate.FinishReason.STOP)],
+        usage_metadata=protos.GenerateContentResponse.UsageMetadata(prompt_token_count=2, candidates_token_count=1))
+
+
+class GrpcAsyncClient:
+    """Answers like the SDK's gRPC async client, recording how its streams ended."""
+
+    def __init__(self):
+        self.streams = []
+
+    async def generate_content(self, request, **options):
+        return answer("whole")
+
+    async def stream_generate_content(self, request, **options):
+        async def chunks():
+            ended = "abandoned"
+            try:
+                for word in ("one ", "two ", "three"):
+                    yield answer(word)
+                ended = "finished"
+            finally:
+                self.streams.append(ended)
+
+        return chunks()
+
+
+def test_concurrent_requests_share_the_sync_pipeline(fake_server):
+    gemini = AsyncGemini(sync=Gemini(cache=ResponseCache()), max_concurrency=4)
+
+    async def main():
+        return await asyncio.gather(*(gemini.generate_content_from_text_prompt(f"prompt {index % 3}") for index in range(9)))
+
+    responses = asyncio.run(main())
+
+    assert all(response.text.startswith("lorem ipsum") for response in responses)
+    assert gemini.sync.usage.requests >= 3  # cache hits are not requests
+    assert gemini.sync.cache.stats()["entries"] == 3
+
+
+def test_cached_responses_are_served_without_the_api(fake_server):
+    gemini = AsyncGemini(sync=Gemini(cache=ResponseCache()))
+    first = asyncio.run(gemini.generate_content_from_text_prompt("hi"))
+    fake_server.config.error_rate = 1.0
+
+    second = asyncio.run(gemini.generate_content_from_text_prompt("hi"))
+
+    assert second.text == first.text
+    assert gemini.sync.cache.stats()["hits"] == 1
+
+
+def test_transient_failures_are_retried(fake_server, monkeypatch):
+    fail, failures = fake_gemini._Handler._fail, []
+
+    def fail_twice(handler):
+        if len(failures) < 2:
+            failures.append(handler.path)
+            handler._json(503, {"error": {"code": 503, "message": "busy", "status": "UNAVAILABLE"}})
+            return True
+        return fail(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "_fail", fail_twice)
+    gemini = AsyncGemini(sync=Gemini(resilience_policy=ResiliencePolicy(max_retries=3, initial_backoff=0.01)))
+
+    response = asyncio.run(gemini.generate_content_from_text_prompt("hi"))
+
+    assert response.text.startswith("lorem ipsum")
+    assert len(failures) == 2 and gemini.sync.usage.retries == 2
+
+
+def test_exhausted_keys_are_skipped(fake_server, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEYS", "second-key")
+    fake_server.config.exhausted_keys = ("test-key",)
+    gemini = AsyncGemini()
+
+    async def main():
+        return await asyncio.gather(*(gemini.generate_content_from_text_prompt(f"prompt {index}") for index in range(4)))
+
+    assert all(response.text for response in asyncio.run(main()))
+
+
+def test_blocked_answers_escalate_and_are_logged(fake_server):
+    fake_server.config.blocked_models = ("gemini-1.5-flash-8b",)
+    gemini = AsyncGemini(sync=Gemini(
+        model_name="gemini-1.5-flash-8b", escalation=("gemini-1.5-flash",), routing_log=RoutingLog()))
+
+    response = asyncio.run(gemini.generate_content_from_text_prompt("hi"))
+
+    assert response.text.startswith("lorem ipsum")
+    outcomes = {row["model"]: row["outcomes"] for row in RoutingLog().stats()}
+    assert outcomes == {"gemini-1.5-flash-8b": {"escalated": 1}, "gemini-1.5-flash": {"ok": 1}}
+
+
+def test_streams_and_chats_record_usage(fake_server):
+    gemini = AsyncGemini()
+
+    async def main():
+        streamed = [chunk async for chunk in gemini.stream_content_from_text_prompt("hi")]
+        first = await gemini.send_chat_message("hello")
+        replied = [chunk async for chunk in gemini.stream_chat_message("and again")]
+        return streamed, first, replied
+
+    streamed, first, replied = asyncio.run(main())
+
+    assert len(streamed) == fake_server.config.chunks
+    assert first.text.startswith("lorem ipsum") and "".join(replied).startswith("lorem ipsum")
+    assert len(gemini.sync.chat.history) == 4
+    assert gemini.sync.usage.requests == 3
+
+
+def test_requests_in_flight_are_bounded(fake_server, monkeypatch):
+    fake_server.config.latency_ms = 50
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    do_post = fake_gemini._Handler.do_POST
+
+    def counting(handler):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            do_post(handler)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", counting)
+    gemini = AsyncGemini(max_concurrency=3)
+
+    async def main():
+        await asyncio.gather(*(gemini.generate_content_from_text_prompt(f"prompt {index}") for index in range(9)))
+
+    asyncio.run(main())
+
+    assert peak[0] == 3
+
+
+def test_an_abandoned_stream_frees_its_slot(fake_server):
+    gemini = AsyncGemini(max_concurrency=1)
+
+    async def main():
+        stream = gemini.stream_content_from_text_prompt("hi")
+        async for _ in stream:
+            break
+        await stream.aclose()
+        return await asyncio.wait_for(gemini.generate_content_from_text_prompt("next"), 5)
+
+    assert asyncio.run(main()).text.startswith("lorem ipsum")
+
+
+def test_requests_await_the_sdk_async_client_without_threads(monkeypatch):
+    client = GrpcAsyncClient()
+    monkeypatch.setattr(gemini_module, "generative_async_client", lambda api_key: client)
+    gemini = AsyncGemini()
+
+    async def main():
+        whole = await gemini.generate_content_from_text_prompt("hi")
+        streamed = [chunk async for chunk in gemini.stream_content_from_text_prompt("hi")]
+        replied = await gemini.send_chat_message("hello")
+
+        stream = gemini.stream_content_from_text_prompt("hi")
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+        workers = [thread.name for thread in threading.enumerate() if thread.name.startswith(("lcli-async", "asyncio_"))]
+        return whole, streamed, replied, workers
+
+    whole, streamed, replied, workers = asyncio.run(main())
+
+    assert whole.text == replied.text == "whole"
+    assert streamed == ["one ", "two ", "three"]
+    assert client.streams == ["finished", "abandoned"]
+    assert workers == [] and gemini._executor is None
+    assert gemini.sync.usage.requests == 3  # the abandoned stream is not recorded
+    assert len(gemini.sync.chat.history) == 2
+
+
+def test_worker_threads_are_shut_down_on_close(fake_server, tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("notes")
+
+    async def main():
+        async with AsyncGemini() as gemini:
+            uploaded = await gemini.upload_file(str(path))
+            executor = gemini._executor
+        return gemini, uploaded, executor
+
+    gemini, uploaded, executor = asyncio.run(main())
+
+    assert uploaded.display_name == "notes.txt"
+    assert executor._shutdown and gemini._executor is None
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("lcli-async")]
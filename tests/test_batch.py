@@ -0,0 +1,77 @@
+import io
+import json
+import threading
+import time
+
+from click.testing import CliRunner
+
+from llm_cli.cli import cli
+from llm_cli.utils.batch import completed_ids, read_jsonl, run_batch
+
+
+def test_read_jsonl_numbers_records_and_reports_bad_lines():
+    stream = io.StringIO('{"id": "a", "text": "hi"}\n\n{"prompt": "yo"}\nnot json\n[1]\n{"text": " "}\n')
+
+    records = list(read_jsonl(stream))
+
+    assert records[0] == {"id": "a", "text": "hi"}
+    assert records[1]["id"] == 3 and records[1]["text"] == "yo"
+    assert records[2]["id"] == 4 and records[2]["error"].startswith("Invalid JSON")
+    assert records[3] == {"id": 5, "error": "Each line must be a JSON object."}
+    assert "error" in records[4]
+
+
+def test_completed_ids_skips_failures_and_truncated_lines(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text('{"id": 1, "text": "ok"}\n{"id": 2, "error": "boom"}\n{"id": 3, "te')
+
+    assert completed_ids(str(output)) == {"1"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_run_batch_keeps_input_order_and_isolates_failures():
+    def generate(text):
+        if text == "fail":
+            raise RuntimeError("boom")
+        time.sleep(0.02 if text == "slow" else 0)
+        return text.upper()
+
+    records = [{"id": 1, "text": "slow"}, {"id": 2, "text": "fail"}, {"id": 3, "text": "fast"}]
+
+    results = list(run_batch(generate, records, concurrency=3, ordered=True))
+
+    assert results == [{"id": 1, "text": "SLOW"}, {"id": 2, "error": "boom"}, {"id": 3, "text": "FAST"}]
+
+
+def test_run_batch_bounds_requests_in_flight():
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def generate(text):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return text
+
+    results = list(run_batch(generate, ({"id": i, "text": str(i)} for i in range(20)), concurrency=3, ordered=False))
+
+    assert sorted(result["id"] for result in results) == list(range(20))
+    assert peak <= 3
+
+
+def test_batch_command_resumes_from_its_output(fake_server, tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(json.dumps({"id": 1, "text": "done before"}) + "\n")
+    prompts = "".join(json.dumps({"id": i, "text": f"prompt {i}"}) + "\n" for i in (1, 2, 3))
+
+    result = CliRunner().invoke(cli, ["batch", "-o", str(output)], input=prompts)
+
+    assert result.exit_code == 0, result.output
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["id"] for line in lines] == [1, 2, 3]
+    assert all("text" in line for line in lines)
+    assert "2 succeeded, 0 failed, 1 skipped" in result.output
@@ -0,0 +1,220 @@
+"""
+Latency benchmarks for the client, run with pytest-benchmark through `lcli bench`
+or directly, as they are left out of a plain `pytest` run:
+
+    pytest -m bench tests/test_bench.py --benchmark-json bench.json
+
+Every scenario drives the real `Gemini` client against the fake server in
+`fake_gemini.py`, run in a child process so the time measured is the client's own. A
+round sends `concurrency` requests at once; time to first chunk, CPU time and
+allocations per request are recorded in each benchmark's extra info.
+"""
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Iterator, Optional
+
+import pytest
+from click.testing import CliRunner
+
+pytest.importorskip("pytest_benchmark")
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.cli import cli
+from llm_cli.utils.batch import run_batch
+from llm_cli.utils.constants import BENCH_CONCURRENCY, BENCH_SCENARIOS
+from llm_cli.utils.helpers import percentile
+
+from fake_gemini import FakeGeminiConfig
+
+BENCH_CONFIG = FakeGeminiConfig(latency_ms=10, chunk_interval_ms=2, chunks=8)
+ROUNDS = 10
+UPLOAD_BYTES = 256 * 1024
+
+# Sequential requests run under tracemalloc before the timed rounds; they also warm the connections.
+ALLOCATION_SAMPLES = 3
+
+pytestmark = pytest.mark.bench
+
+
+@dataclass
+class Sample:
+    """The timings of one request, in seconds."""
+    latency: float
+    first_chunk: Optional[float] = None
+    error: Optional[str] = None
+
+
+def distribution(values: list[float]) -> Optional[dict]:
+    """Summarize timings in seconds as milliseconds."""
+    if not values:
+        return None
+
+    return {
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "mean": sum(values) / len(values) * 1000,
+    }
+
+
+def measure(request: Callable[[], Iterable]) -> Sample:
+    """Time a request, iterating its response to the end."""
+    start = time.perf_counter()
+    first_chunk = None
+
+    try:
+        for _ in request():
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+    except Exception as e:
+        return Sample(time.perf_counter() - start, first_chunk, str(e) or e.__class__.__name__)
+
+    return Sample(time.perf_counter() - start, first_chunk)
+
+
+def scenario_requests(name: str, concurrency: int, upload_path: str) -> Callable[[int], Callable[[], Iterable]]:
+    """Build the request for the i-th call of a scenario."""
+    gemini = Gemini()
+
+    if name == "prompt":
+        return lambda i: lambda: gemini.generate_content_from_text_prompt(
+            f"Benchmark prompt {i}", stream_response=True)
+
+    if name == "batch":
+        return lambda i: lambda: [gemini.generate_content_from_text_prompt(f"Benchmark prompt {i}").text]
+
+    if name == "upload":
+        return lambda i: lambda: [gemini.upload_file(upload_path, dedupe=False)]
+
+    # one conversation per request in flight, each growing its history as the run goes
+    chats = queue.Queue()
+    chats.put(gemini)
+    for _ in range(concurrency - 1):
+        chats.put(Gemini())
+
+    def chat_message(i: int) -> Iterator:
+        client = chats.get()
+        try:
+            yield from client.send_chat_message(f"Benchmark message {i}", stream_response=True)
+        finally:
+            chats.put(client)
+
+    return lambda i: lambda: chat_message(i)
+
+
+def peak_allocation(request: Callable[[int], Callable[[], Iterable]]) -> int:
+    """The most memory allocated by one of a few sequential requests, in bytes."""
+    tracemalloc.start()
+    peak = 0
+    try:
+        for i in range(ALLOCATION_SAMPLES):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            measure(request(-i - 1))
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+@pytest.fixture(scope="module")
+def bench_server() -> Iterator[str]:
+    """The fake Gemini server in a child process, yielding its URL."""
+    config = BENCH_CONFIG
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_gemini.py"),
+            "--latency-ms", str(config.latency_ms),
+            "--chunk-interval-ms", str(config.chunk_interval_ms),
+            "--chunks", str(config.chunks),
+            "--error-rate", str(config.error_rate),
+        ],
+        stdout=subprocess.PIPE, text=True
+    )
+
+    try:
+        url = process.stdout.readline().strip()
+        assert url, "The benchmark server failed to start."
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+        process.stdout.close()
+
+
+@pytest.mark.parametrize("concurrency", BENCH_CONCURRENCY)
+@pytest.mark.parametrize("scenario", BENCH_SCENARIOS)
+def test_bench(benchmark, bench_server, monkeypatch, tmp_path, scenario, concurrency):
+    monkeypatch.setenv("LLM_CLI_API_ENDPOINT", bench_server)
+    upload_path = tmp_path / "upload.bin"
+    upload_path.write_bytes(os.urandom(UPLOAD_BYTES))
+
+    request = scenario_requests(scenario, concurrency, str(upload_path))
+    peak = peak_allocation(request)
+    samples, indexes = [], itertools.count()
+
+    def generate(text: str) -> str:
+        samples.append(measure(request(int(text))))
+        return ""
+
+    def run_round(executor: ThreadPoolExecutor) -> None:
+        batch = [next(indexes) for _ in range(concurrency)]
+        if scenario == "batch":
+            # fan out through the same windowed executor as `lcli batch`
+            records = ({"id": i, "text": str(i)} for i in batch)
+            for _ in run_batch(generate, records, concurrency=concurrency):
+                pass
+        else:
+            samples.extend(executor.map(lambda i: measure(request(i)), batch))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        cpu_start = time.process_time()
+        benchmark.pedantic(run_round, args=(executor,), rounds=ROUNDS, warmup_rounds=1)
+        cpu = time.process_time() - cpu_start
+
+    succeeded = [sample for sample in samples if sample.error is None]
+    errors = [sample.error for sample in samples if sample.error is not None]
+
+    benchmark.extra_info.update({
+        "server": asdict(BENCH_CONFIG),
+        "upload_bytes": UPLOAD_BYTES if scenario == "upload" else None,
+        "requests": len(samples),
+        "errors": len(errors),
+        "ttfc_ms": distribution(
+            [sample.first_chunk for sample in succeeded if sample.first_chunk is not None]) if scenario in ("prompt", "chat") else None,
+        "latency_ms": distribution([sample.latency for sample in succeeded]),
+        "cpu_ms_per_request": cpu * 1000 / len(samples),
+        "peak_alloc_kb_per_request": peak / 1024,
+    })
+
+    assert not errors, errors[0]
+
+
+def test_the_report_is_written_as_json(tmp_path):
+    report = tmp_path / "bench.json"
+
+    result = CliRunner().invoke(cli, ["bench", "-s", "prompt", "-c", "1", "-o", str(report)])
+    assert result.exit_code == 0, result.output
+
+    (result,) = json.loads(report.read_text())["benchmarks"]
+    assert result["name"] == "test_bench[prompt-1]"
+    assert result["extra_info"]["server"] == json.loads(json.dumps(asdict(BENCH_CONFIG)))
+    assert result["extra_info"]["requests"] == ROUNDS + 1  # the warmup round, too
+    assert result["extra_info"]["errors"] == 0
+    assert result["stats"]["rounds"] == ROUNDS
+
+
+def test_unknown_concurrency_levels_are_refused():
+    result = CliRunner().invoke(cli, ["bench", "-c", "1,8"])
+
+    assert result.exit_code == 2
+    assert "Expected levels out of 1,4,16" in result.output
@@ -0,0 +1,98 @@
+import time
+
+from llm_cli.utils.cache import ResponseCache, content_hash, make_cache_key
+
+
+def test_cache_key_covers_every_request_field():
+    base = make_cache_key("gemini-1.5-flash", "be brief", {"temperature": 0}, ["hello"])
+
+    assert make_cache_key("gemini-1.5-flash", "be brief", {"temperature": 0}, ["hello"]) == base
+    assert make_cache_key("gemini-1.5-pro", "be brief", {"temperature": 0}, ["hello"]) != base
+    assert make_cache_key("gemini-1.5-flash", "be verbose", {"temperature": 0}, ["hello"]) != base
+    assert make_cache_key("gemini-1.5-flash", "be brief", {"temperature": 0.5}, ["hello"]) != base
+    assert make_cache_key("gemini-1.5-flash", "be brief", {"temperature": 0}, ["hello!"]) != base
+    assert make_cache_key("gemini-1.5-flash", "be brief", {"temperature": 0}, ["hello", "again"]) != base
+
+
+def test_cache_key_ignores_dict_order_but_not_blob_bytes():
+    blob = {"mime_type": "image/png", "data": b"\x89PNG one"}
+    reordered = {"data": b"\x89PNG one", "mime_type": "image/png"}
+    other = {"mime_type": "image/png", "data": b"\x89PNG two"}
+
+    assert content_hash(blob) == content_hash(reordered)
+    assert content_hash(blob) != content_hash(other)
+    assert make_cache_key("m", "", {"temperature": 0, "top_k": 1}, [blob]) == \
+        make_cache_key("m", "", {"top_k": 1, "temperature": 0}, [reordered])
+
+
+def test_cache_key_of_uploaded_files_uses_name_and_hash():
+    class File:
+        def __init__(self, name, sha256_hash):
+            self.name, self.sha256_hash = name, sha256_hash
+
+    assert content_hash(File("files/a", b"\x01")) == content_hash(File("files/a", b"\x01"))
+    assert content_hash(File("files/a", b"\x01")) != content_hash(File("files/a", b"\x02"))
+    assert content_hash(File("files/a", b"\x01")) != content_hash(File("files/b", b"\x01"))
+
+
+def test_get_put_and_stats(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=10_000, ttl=60)
+
+    assert cache.get("k") is None
+    cache.put("k", {"text": "hi"})
+    assert cache.get("k") == {"text": "hi"}
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.get("k") is None
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=10_000, ttl=60)
+    cache.put("k", {"text": "hi"})
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    value = {"text": "x" * 100}
+    size = len(f'{{"text": "{"x" * 100}"}}')
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=3 * size, ttl=3600)
+
+    for key in ("a", "b", "c"):
+        cache.put(key, value)
+        clock[0] += 1
+    cache.get("a")  # "b" is now the least recently used
+    clock[0] += 1
+    cache.put("d", value)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) == value for key in ("a", "c", "d"))
+    assert cache.stats()["size_bytes"] <= 3 * size
+
+
+def test_entries_larger_than_the_cache_are_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=10, ttl=60)
+    cache.put("k", {"text": "far too long to fit"})
+    assert cache.get("k") is None
+
+
+def test_prompt_with_cache_answers_without_the_api(fake_server):
+    from click.testing import CliRunner
+    from llm_cli.cli import cli
+
+    first = CliRunner().invoke(cli, ["prompt", "--cache", "--model", "gemini-1.5-flash", "-t", "what is 2+2"])
+    assert first.exit_code == 0 and first.output.strip()
+
+    fake_server.config.error_rate = 1.0  # every request to the API now fails
+    second = CliRunner().invoke(cli, ["prompt", "--cache", "--model", "gemini-1.5-flash", "-t", "what is 2+2"])
+    assert second.output == first.output
+    assert ResponseCache().stats()["hits"] == 1
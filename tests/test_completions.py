@@ -0,0 +1,193 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+
+from llm_cli import cli as cli_module
+from llm_cli.cli import cli
+from llm_cli.utils import completions
+from llm_cli.utils.completions import RECENCY_HALF_LIFE, CompletionHistory
+
+import fake_gemini
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(completions, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Count the generateContent requests the fake server answers."""
+    calls = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def counting(handler):
+        if handler.path.split("?")[0].endswith(":generateContent"):
+            calls.append(handler.path)
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", counting)
+    return calls
+
+
+def test_completions_are_found_by_normalized_command_and_context():
+    history = CompletionHistory()
+    history.record("git  commit", "staged  files", "git commit -m 'message'")
+    history.record("git push", "", "   ")  # empty answers are not kept
+
+    entry = history.get(" git commit ", "staged files")
+    assert entry.text == "git commit -m 'message'"
+    assert entry.uses == 1
+    assert history.get("git commit", "other files") is None
+    assert history.get("git push", "") is None
+
+
+def test_suggestions_rank_by_uses_decayed_by_recency(clock):
+    history = CompletionHistory()
+    history.record("git status", "", "git status -sb")
+    for _ in range(3):
+        history.use(history.get("git status", ""))
+
+    clock.now += RECENCY_HALF_LIFE * 4  # four uses, worth a quarter use now
+    history.record("git stash", "", "git stash push")
+    history.record("docker ps", "", "docker ps -a")
+
+    assert [entry.text for entry in history.suggest("git st")] == ["git stash push", "git status -sb"]
+    assert [entry.text for entry in history.suggest("git", limit=1)] == ["git stash push"]
+    assert history.suggest("kubectl") == []
+
+
+def test_history_persists_through_the_journal_and_the_index():
+    history = CompletionHistory()
+    history.record("ls", "hidden files", "ls -a")
+
+    reopened = CompletionHistory()
+    assert reopened.get("ls", "hidden files").text == "ls -a"
+
+    reopened.compact()
+    assert not os.path.exists(reopened.journal_path)
+
+    compacted = CompletionHistory()
+    assert compacted.index.count == 1
+    assert compacted.get("ls", "hidden files").text == "ls -a"
+    compacted.use(compacted.get("ls", "hidden files"))
+    assert CompletionHistory().get("ls", "hidden files").uses == 2
+
+
+def test_the_index_is_searched_in_place(tmp_path):
+    history = CompletionHistory(str(tmp_path))
+    commands = [f"cmd{index:03} é" for index in range(300)]
+    for command in commands:
+        history.record(command, "", f"{command} --done", use=False)
+    history.compact()
+
+    history = CompletionHistory(str(tmp_path))
+    assert history.overlay == {}
+    assert all(history.get(command, "").text == f"{command} --done" for command in commands)
+    assert history.get("cmd", "") is None and history.get("cmd300 é", "") is None
+    assert sorted(entry.command for entry in history.suggest("cmd01", limit=20)) == commands[10:20]
+
+
+def test_the_journal_is_compacted_past_its_limit_keeping_the_best_entries(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(completions, "JOURNAL_MAX_ENTRIES", 8)
+    history = CompletionHistory(str(tmp_path), max_entries=2)
+
+    history.record("often", "", "often --yes")
+    history.use(history.get("often", ""))
+    history.record("recent", "", "recent --yes")
+    for index in range(6):
+        clock.now -= 1  # older each time
+        history.record(f"rare{index}", "", "rare --yes")
+
+    assert history.index.count == 2
+    assert not os.path.exists(history.journal_path)
+    assert {entry.command for entry in history.suggest("", limit=10)} == {"often", "recent"}
+
+
+def test_a_line_cut_short_by_a_crash_is_skipped():
+    history = CompletionHistory()
+    history.record("ls", "", "ls -l")
+    with open(history.journal_path, "a") as file:
+        file.write('{"key": "pw')
+
+    assert CompletionHistory().get("ls", "").text == "ls -l"
+
+
+def test_a_journal_being_compacted_is_still_read():
+    history = CompletionHistory()
+    history.record("ls", "", "ls -l")
+    os.replace(history.journal_path, f"{history.journal_path}.compacting")
+
+    assert CompletionHistory().get("ls", "").text == "ls -l"
+
+
+def test_a_lock_left_by_a_crashed_compaction_is_broken(clock):
+    history = CompletionHistory()
+    history.record("ls", "", "ls -l")
+    lock = os.path.join(history.path, "compact.lock")
+    open(lock, "w").close()
+
+    history.compact()
+    assert CompletionHistory().index.count == 0  # another process seems to be compacting
+
+    os.utime(lock, (0, 0))
+    history.compact()
+    assert CompletionHistory().index.count == 1
+    assert not os.path.exists(lock)
+
+
+def test_stale_entries_are_refreshed_once(clock):
+    history = CompletionHistory(ttl=60)
+    history.record("ls", "", "ls -l")
+    entry = history.get("ls", "")
+    assert not history.is_stale(entry)
+
+    clock.now += 61
+    assert history.is_stale(entry)
+    history.claim_refresh(entry)
+    assert not CompletionHistory(ttl=60).is_stale(entry)
+
+    clock.now += completions.REFRESH_CLAIM_SECONDS + 1  # the refresh died
+    assert history.is_stale(entry)
+
+
+def test_repeated_completions_skip_the_model(fake_server, generations):
+    runner = CliRunner()
+    first = runner.invoke(cli, ["completion", "-c", "git commit", "-ctx", "staged files"])
+    second = runner.invoke(cli, ["completion", "-c", "git   commit", "-ctx", "staged files"])
+
+    assert first.exit_code == second.exit_code == 0
+    assert first.output == second.output
+    assert "lorem ipsum" in first.output
+    assert len(generations) == 1
+
+    runner.invoke(cli, ["completion", "-c", "git commit", "-ctx", "staged files", "--no-history"])
+    assert len(generations) == 2
+
+    suggested = runner.invoke(cli, ["completion", "-c", "git", "--suggest"])
+    assert suggested.output.strip() == first.output.strip()
+    assert len(generations) == 2
+
+
+def test_stale_completions_are_answered_and_refreshed_in_the_background(fake_server, generations, monkeypatch, clock):
+    spawned = []
+    monkeypatch.setattr(cli_module, "spawn_background", spawned.append)
+    monkeypatch.setenv("LLM_CLI_COMPLETION_TTL", "1m")
+    CompletionHistory().record("ls", "hidden files", "ls -a")
+    clock.now += 61
+
+    result = CliRunner().invoke(cli, ["completion", "-c", "ls", "-ctx", "hidden files"])
+
+    assert "ls -a" in result.output
+    assert spawned == [["completion", "-c", "ls", "-ctx", "hidden files", "--refresh-history"]]
+    assert generations == []
+
+    # the background refresh stores a fresh completion without printing it
+    refreshed = CliRunner().invoke(cli, ["completion", "-c", "ls", "-ctx", "hidden files", "--refresh-history"])
+    assert refreshed.output == ""
+    assert CompletionHistory().get("ls", "hidden files").text.startswith("lorem ipsum")
+    assert len(generations) == 1
@@ -0,0 +1,147 @@
+import os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+from google.api_core import exceptions
+from google.generativeai import caching
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.cli import cli
+from llm_cli.utils import context_cache
+from llm_cli.utils.context_cache import ContextIndex, model_matches, prefix_hash
+from llm_cli.utils.helpers import get_cache_dir
+
+import fake_gemini
+
+CACHE_MODEL = "models/gemini-1.5-flash-002"
+
+
+def live_cache(name: str, display_name: str = "handbook") -> SimpleNamespace:
+    return SimpleNamespace(
+        name=name, display_name=display_name, model=CACHE_MODEL,
+        usage_metadata=SimpleNamespace(total_token_count=40000),
+        expire_time=datetime.now(timezone.utc) + timedelta(hours=1))
+
+
+@pytest.fixture
+def server_caches(monkeypatch):
+    """The caches the server knows, by name; looking one up is recorded."""
+    caches = SimpleNamespace(live={}, gets=[], created=[])
+
+    def get(name):
+        caches.gets.append(name)
+        if name not in caches.live:
+            raise exceptions.NotFound(name)
+        return caches.live[name]
+
+    monkeypatch.setattr(caching.CachedContent, "get", get)
+    monkeypatch.setattr(caching.CachedContent, "create", lambda **options: caches.created.append(options))
+    return caches
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Record the paths of the generateContent requests the fake server answers."""
+    paths = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def recording(handler):
+        if handler.path.split("?")[0].endswith(":generateContent"):
+            paths.append(handler.path.split("?")[0])
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", recording)
+    return paths
+
+
+def test_constructing_a_client_does_not_look_for_a_context_cache(fake_server, server_caches):
+    gemini = Gemini(system_instruction="be brief")
+
+    assert server_caches.gets == []
+    assert gemini.context_index is None
+    assert not os.path.exists(os.path.join(get_cache_dir(), "contexts.db"))
+
+
+def test_a_live_cache_of_the_instruction_is_used_from_the_first_request(fake_server, server_caches, generations):
+    server_caches.live["cachedContents/abc"] = live_cache("cachedContents/abc")
+    ContextIndex().record(server_caches.live["cachedContents/abc"], prefix_hash("be brief"))
+
+    gemini = Gemini(system_instruction="be brief", escalation=("gemini-1.5-pro",))
+    assert len(gemini.cascade) == 2
+
+    gemini.generate_content_from_text_prompt("first")
+    gemini.generate_content_from_text_prompt("second")
+
+    assert server_caches.gets == ["cachedContents/abc"]
+    assert gemini.cached_content.name == "cachedContents/abc"
+    assert gemini.cascade == [gemini.model]  # a cache belongs to one model
+    assert generations == [f"/v1beta/{CACHE_MODEL}:generateContent"] * 2
+
+
+def test_a_cache_the_server_dropped_is_forgotten(fake_server, server_caches, generations):
+    ContextIndex().record(live_cache("cachedContents/gone"), prefix_hash("be brief"))
+    gemini = Gemini(system_instruction="be brief")
+
+    gemini.generate_content_from_text_prompt("first")
+
+    assert gemini.cached_content is None
+    assert ContextIndex().find("cachedContents/gone") is None
+    assert generations == ["/v1beta/models/gemini-1.5-flash:generateContent"]
+
+
+def test_a_missing_named_cache_fails_the_first_request(fake_server, server_caches):
+    gemini = Gemini(context_cache="handbook")
+
+    with pytest.raises(ValueError, match="No live context cache named handbook"):
+        gemini.generate_content_from_text_prompt("What is the leave policy?")
+
+
+def test_chats_switch_to_the_cache_keeping_their_history(fake_server, server_caches, generations):
+    server_caches.live["cachedContents/abc"] = live_cache("cachedContents/abc")
+    ContextIndex().record(server_caches.live["cachedContents/abc"], prefix_hash("be brief"))
+    gemini = Gemini(system_instruction="be brief")
+    gemini.set_chat_history([{"role": "user", "parts": ["hi"]}, {"role": "model", "parts": ["hello"]}])
+
+    gemini.send_chat_message("how are you")
+
+    assert generations == [f"/v1beta/{CACHE_MODEL}:generateContent"]
+    assert len(gemini.chat.history) == 4
+
+
+def test_an_instruction_too_small_to_cache_is_refused_before_creating(fake_server, server_caches):
+    gemini = Gemini()
+
+    with pytest.raises(ValueError, match="needs at least 32768 tokens and the system instruction has 2"):
+        gemini.create_context_cache("brief", "be brief")
+    assert server_caches.created == []
+
+    result = CliRunner().invoke(cli, ["context", "create", "-n", "brief", "-s", "be brief"])
+    assert "needs at least 32768 tokens" in result.output
+    assert server_caches.created == []
+
+
+def test_caches_are_found_by_name_and_prefix_while_live(monkeypatch):
+    index = ContextIndex()
+    index.record(live_cache("cachedContents/abc"), prefix_hash("be brief", ["hash"]))
+
+    assert index.find("handbook").name == index.find("cachedContents/abc").name == "cachedContents/abc"
+    assert index.find_prefix(prefix_hash("be brief", ["hash"]), "gemini-1.5-flash").name == "cachedContents/abc"
+    assert index.find_prefix(prefix_hash("be brief", ["hash"]), "gemini-1.5-pro") is None
+    assert index.find_prefix(prefix_hash("be brief")) is None
+
+    # a cache about to expire is not handed out
+    later = datetime.now(timezone.utc).timestamp() + 3600
+    monkeypatch.setattr(context_cache, "time", SimpleNamespace(time=lambda: later))
+    assert index.find("handbook") is None
+
+
+@pytest.mark.parametrize("cache_model, model_name, matches", [
+    ("models/gemini-1.5-flash-002", "gemini-1.5-flash", True),
+    ("models/gemini-1.5-flash-002", "models/gemini-1.5-flash-002", True),
+    ("models/gemini-1.5-flash-8b-001", "gemini-1.5-flash", False),
+    ("models/gemini-1.5-pro-002", "gemini-1.5-flash", False),
+])
+def test_caches_serve_versions_of_a_model(cache_model, model_name, matches):
+    assert model_matches(cache_model, model_name) is matches
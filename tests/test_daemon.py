@@ -0,0 +1,106 @@
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from llm_cli.utils.daemon import DaemonServer, request_daemon
+from llm_cli.utils.routing import RoutingLog
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+
+
+class _Client:
+    def __init__(self, *key):
+        self.key = key
+
+    def generate_content_from_text_prompt(self, prompt, stream_response=False):
+        return [f"{self.key[3]}: ", prompt]
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_CLI_NO_DAEMON")
+    decisions = []
+    server = DaemonServer(str(tmp_path / "lcli.sock"), _Client, iter,
+                          lambda *decision: decisions.append(decision))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.decisions = decisions
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_daemon_streams_chunks_and_reuses_clients(daemon):
+    request = {"op": "generate", "prompt": "hi", "model": "m", "command": "prompt",
+               "reason": "short prompt", "input_tokens": 1, "attachments": 0}
+
+    assert request_daemon(request, daemon.socket_path).text == "m: hi"
+    assert list(request_daemon(request, daemon.socket_path)) == ["m: ", "hi"]
+    assert len(daemon.clients) == 1
+    assert daemon.decisions == [("prompt", "m", "short prompt", 1, 0)] * 2
+
+
+def test_daemon_errors_reach_the_client(daemon):
+    with pytest.raises(ValueError, match="Unsupported operation: upload"):
+        request_daemon({"op": "upload"}, daemon.socket_path).text
+
+
+def test_socket_is_created_private(tmp_path, monkeypatch):
+    # not chmod-ed after the fact: the socket never exists with looser permissions
+    monkeypatch.setattr(os, "chmod", lambda *args: pytest.fail("the socket was chmod-ed after bind"))
+    server = DaemonServer(str(tmp_path / "lcli.sock"), _Client, iter)
+    try:
+        assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+    finally:
+        server.server_close()
+
+    assert not os.path.exists(server.socket_path)
+
+
+def test_no_daemon_falls_back(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_CLI_NO_DAEMON")
+    assert request_daemon({"op": "generate"}, str(tmp_path / "missing.sock")) is None
+
+
+CLIENT = """
+import sys
+from llm_cli.cli import cli
+cli.main(sys.argv[1:], standalone_mode=False)
+print(sorted(name for name in ("sqlite3", "google.generativeai", "llm_cli.utils.cache") if name in sys.modules))
+"""
+
+
+def test_cli_client_path_opens_no_store_and_no_sdk(daemon, monkeypatch):
+    monkeypatch.setenv("LLM_CLI_SOCKET", daemon.socket_path)
+    monkeypatch.delenv("LLM_CLI_API_ENDPOINT", raising=False)
+
+    for args in (["prompt", "-t", "what is two plus two"],
+                 ["completion", "-c", "ls", "-ctx", "list files", "--no-history"]):
+        result = subprocess.run([sys.executable, "-c", CLIENT, *args], capture_output=True, text=True, check=True)
+
+        assert result.stdout.strip().endswith("[]"), result.stdout
+        assert not os.path.exists(os.path.join(os.environ["LLM_CLI_CACHE_DIR"], "routing.db"))
+
+    assert [decision[0] for decision in daemon.decisions] == ["prompt", "completion"]
+
+
+def test_serve_records_routing_decisions_of_clients(fake_server, tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from llm_cli.cli import cli
+
+    monkeypatch.delenv("LLM_CLI_NO_DAEMON")
+    serve = subprocess.Popen([sys.executable, "-m", "llm_cli", "serve"], stdout=subprocess.PIPE, text=True)
+    try:
+        assert "Serving on" in serve.stdout.readline()
+        result = CliRunner().invoke(cli, ["prompt", "-t", "hi"])
+    finally:
+        serve.terminate()
+        serve.wait(10)
+
+    assert "lorem ipsum" in result.output
+    assert ("prompt", "gemini-1.5-flash-8b", "short prompt", 1) in RoutingLog().decisions()
@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import google.generativeai as genai
+
+from llm_cli.api import gemini as gemini_module
+from llm_cli.api.gemini import Gemini
+from llm_cli.utils.file_index import FileIndex, UploadIndex
+
+import fake_gemini
+
+
+def _write(path, data: bytes) -> str:
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_uploads_reuse_the_remote_file(fake_server, tmp_path):
+    gemini = Gemini()
+    first = gemini.upload_file(_write(tmp_path / "notes.txt", b"same bytes"))
+    second = gemini.upload_file(_write(tmp_path / "notes.txt", b"same bytes"))
+
+    assert second.name == first.name
+    assert len(fake_server.files) == 1
+
+
+def test_uploads_under_another_display_name_or_type_are_sent_again(fake_server, tmp_path):
+    gemini = Gemini()
+    path = _write(tmp_path / "notes.txt", b"same bytes")
+
+    original = gemini.upload_file(path)
+    renamed = gemini.upload_file(path, display_name="renamed")
+    retyped = gemini.upload_file(path, mime_type="text/markdown")
+    copy = gemini.upload_file(_write(tmp_path / "copy.txt", b"same bytes"))
+
+    assert len({original.name, renamed.name, retyped.name, copy.name}) == 4
+    assert renamed.display_name == "renamed"
+    assert copy.display_name == "copy.txt"
+    # each is reused on its own afterwards
+    assert gemini.upload_file(path, display_name="renamed").name == renamed.name
+    assert len(fake_server.files) == 4
+
+
+def test_changed_content_is_uploaded_again(fake_server, tmp_path):
+    gemini = Gemini()
+    first = gemini.upload_file(_write(tmp_path / "notes.txt", b"version one"))
+    second = gemini.upload_file(_write(tmp_path / "notes.txt", b"version two"))
+
+    assert second.name != first.name
+
+
+def test_deleted_remote_files_are_uploaded_again(fake_server, tmp_path):
+    gemini = Gemini()
+    path = _write(tmp_path / "notes.txt", b"same bytes")
+    first = gemini.upload_file(path)
+    fake_server.files.clear()  # e.g. deleted with another client
+
+    second = gemini.upload_file(path)
+
+    assert second.name != first.name
+    assert list(fake_server.files) == [second.name]
+
+
+def test_upload_index_is_keyed_by_content_name_and_type(tmp_path):
+    remote = SimpleNamespace(name="files/abc", uri="uri", expiration_time=datetime.now(timezone.utc) + timedelta(days=1))
+    index = UploadIndex(str(tmp_path / "files.db"))
+    index.record("sha", 10, "notes.txt", None, remote)
+
+    assert index.lookup("sha", 10, "notes.txt", None)["name"] == "files/abc"
+    assert index.lookup("sha", 10, "other.txt", None) is None
+    assert index.lookup("sha", 10, "notes.txt", "text/plain") is None
+    assert index.lookup("sha", 11, "notes.txt", None) is None
+
+
+def _resumable(monkeypatch):
+    """Send every upload in resumable chunks of 256 KiB."""
+    monkeypatch.setattr(gemini_module, "RESUMABLE_UPLOAD_THRESHOLD", 0)
+    monkeypatch.setattr(gemini_module, "UPLOAD_CHUNK_SIZE", 256 * 1024)
+
+
+def _sha256(data: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+
+
+def test_large_files_are_uploaded_in_chunks(fake_server, tmp_path, monkeypatch):
+    _resumable(monkeypatch)
+    data = os.urandom(700 * 1024)
+
+    uploaded = Gemini().upload_file(_write(tmp_path / "big.bin", data), dedupe=False)
+
+    assert fake_server.files[uploaded.name]["sha256Hash"] == _sha256(data)
+    assert uploaded.display_name == "big.bin"
+
+
+def test_uploads_continue_after_a_failed_chunk(fake_server, tmp_path, monkeypatch):
+    _resumable(monkeypatch)
+    monkeypatch.setattr(gemini_module.random, "uniform", lambda low, high: 0)
+    resume, calls = fake_gemini._Handler._resume, []
+
+    def fail_after_second_chunk(handler, upload_id):
+        calls.append(handler.headers.get("Content-Range"))
+        if len(calls) != 2:
+            return resume(handler, upload_id)
+        # the chunk is stored, but the client is told it failed and sends it again
+        wfile, handler.wfile = handler.wfile, io.BytesIO()
+        try:
+            resume(handler, upload_id)
+        finally:
+            handler.wfile = wfile
+        handler._json(503, {"error": {"code": 503, "message": "unavailable", "status": "UNAVAILABLE"}})
+
+    monkeypatch.setattr(fake_gemini._Handler, "_resume", fail_after_second_chunk)
+    data = os.urandom(700 * 1024)
+
+    uploaded = Gemini().upload_file(_write(tmp_path / "big.bin", data), dedupe=False)
+
+    assert calls[1] == "bytes 262144-524287/716800"
+    assert calls.count("bytes 0-262143/716800") == 1  # earlier chunks are not sent again
+    assert fake_server.files[uploaded.name]["sha256Hash"] == _sha256(data)
+
+
+def test_upload_files_yields_in_input_order(fake_server, tmp_path):
+    paths = [_write(tmp_path / f"{index}.txt", f"file {index}".encode()) for index in range(6)]
+
+    uploaded = list(Gemini().upload_files(iter(paths), max_workers=3))
+
+    assert [file.display_name for file in uploaded] == [f"{index}.txt" for index in range(6)]
+
+
+def test_wait_for_active_polls_pending_files_once_per_round(fake_server, tmp_path, monkeypatch):
+    gemini = Gemini()
+    video, ready = gemini.upload_file(_write(tmp_path / "a.mp4", b"video")), gemini.upload_file(_write(tmp_path / "b.txt", b"text"))
+    fake_server.files[video.name]["state"] = "PROCESSING"
+    video = genai.get_file(video.name)
+    polled = []
+    get_file = genai.get_file
+    monkeypatch.setattr(genai, "get_file", lambda name: polled.append(name) or get_file(name))
+    threading.Timer(0.25, lambda: fake_server.files[video.name].update(state="ACTIVE")).start()
+
+    started = time.monotonic()
+    files = gemini.wait_for_active([video, ready], initial_delay=0.1, max_delay=0.1)
+
+    assert [file.state.name for file in files] == ["ACTIVE", "ACTIVE"]
+    assert set(polled) == {video.name}  # files that are already active are not polled
+    assert 2 <= len(polled) <= 4
+    assert time.monotonic() - started < 1
+
+
+def test_wait_for_active_fails_on_files_that_could_not_be_processed(fake_server, tmp_path):
+    import pytest
+
+    gemini = Gemini()
+    video = gemini.upload_file(_write(tmp_path / "a.mp4", b"video"))
+    fake_server.files[video.name].update(state="PROCESSING")
+    video = genai.get_file(video.name)
+    fake_server.files[video.name].update(state="FAILED", error={"code": 400, "message": "bad codec"})
+
+    with pytest.raises(ValueError, match="bad codec"):
+        gemini.wait_for_active([video], initial_delay=0.01)
+
+
+def _indexed(name, display_name="notes.txt", mime_type="text/plain", size_bytes=10, created=0.0, expires_in=3600.0):
+    now = time.time()
+    return SimpleNamespace(
+        name=name, display_name=display_name, mime_type=mime_type, size_bytes=size_bytes, uri=f"uri/{name}",
+        create_time=datetime.fromtimestamp(now + created, timezone.utc),
+        expiration_time=datetime.fromtimestamp(now + expires_in, timezone.utc))
+
+
+def test_file_index_filters_listings(tmp_path):
+    index = FileIndex(str(tmp_path / "files.db"))
+    index.sync([
+        _indexed("files/a", mime_type="video/mp4", size_bytes=5_000_000, expires_in=600),
+        _indexed("files/b", mime_type="video/webm", size_bytes=100),
+        _indexed("files/c", mime_type="image/png", size_bytes=5_000_000),
+        _indexed("files/d", mime_type="image/png", expires_in=-1),  # already expired
+    ])
+
+    names = lambda files: sorted(file.name for file in files)
+    assert names(index.list()) == ["files/a", "files/b", "files/c"]
+    assert names(index.list(mime_type="video")) == ["files/a", "files/b"]
+    assert names(index.list(mime_type="video/mp4")) == ["files/a"]
+    assert names(index.list(larger_than=1_000_000)) == ["files/a", "files/c"]
+    assert names(index.list(expiring_within=1800)) == ["files/a"]
+
+
+def test_file_index_finds_the_newest_live_file_by_display_name(tmp_path):
+    index = FileIndex(str(tmp_path / "files.db"))
+    index.upsert(_indexed("files/old", created=-60))
+    index.upsert(_indexed("files/new"))
+    index.upsert(_indexed("files/newest-but-expired", created=60, expires_in=-1))
+
+    assert index.find_by_display_name("notes.txt").name == "files/new"
+    index.remove("files/new")
+    assert index.find_by_display_name("notes.txt").name == "files/old"
+    assert index.find_by_display_name("other.txt") is None
+
+
+def test_file_index_sync_replaces_the_listing_and_claims_refreshes_once(tmp_path):
+    index = FileIndex(str(tmp_path / "files.db"))
+    assert index.last_sync == 0
+    index.upsert(_indexed("files/gone"))
+
+    assert index.sync([_indexed("files/a"), _indexed("files/b")]) == 2
+    assert sorted(file.name for file in index.list()) == ["files/a", "files/b"]
+    assert index.last_sync > 0
+
+    assert not index.claim_refresh(stale_after=60)
+    other_process = FileIndex(str(tmp_path / "files.db"))
+    assert other_process.claim_refresh(stale_after=0)
+    assert not index.claim_refresh(stale_after=60)
+
+
+def test_file_index_sync_does_not_lock_out_writers_while_listing(tmp_path):
+    index = FileIndex(str(tmp_path / "files.db"))
+    other_process = FileIndex(str(tmp_path / "files.db"))
+    other_process.db.execute("PRAGMA busy_timeout = 0")  # fail at once instead of waiting for the lock
+
+    def listing():
+        yield _indexed("files/a")
+        other_process.upsert(_indexed("files/uploaded-meanwhile"))  # while the next page loads
+        yield _indexed("files/b")
+
+    assert index.sync(listing()) == 2
+    assert sorted(file.name for file in index.list()) == ["files/a", "files/b"]
+
+
+def test_files_list_is_served_from_the_index(fake_server, tmp_path):
+    from click.testing import CliRunner
+    from llm_cli.cli import cli
+
+    first = CliRunner().invoke(cli, ["files", "--list"])  # the first listing syncs the index
+    assert "Synced 0 file(s)" in first.output and "No files found." in first.output
+
+    Gemini().upload_file(_write(tmp_path / "notes.txt", b"notes"))
+    fake_server.files.clear()  # deleted elsewhere; the index still has it until the next sync
+
+    listed = CliRunner().invoke(cli, ["files", "--list"])
+    assert "Synced" not in listed.output and "notes.txt" in listed.output
+
+    synced = CliRunner().invoke(cli, ["files", "--sync", "--list"])
+    assert "Synced 0 file(s)" in synced.output and "No files found." in synced.output
@@ -0,0 +1,130 @@
+import io
+import os
+import random
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image
+
+from llm_cli.utils import images
+from llm_cli.utils.images import ImageCache, ImageOptions, encode_image, prepare_images
+
+
+def noise(width: int, height: int) -> Image.Image:
+    rng = random.Random(width * height)
+    image = Image.new("RGB", (width, height))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(width * height)])
+    return image
+
+
+def save(image: Image.Image, path, **options) -> str:
+    image.save(path, **options)
+    return str(path)
+
+
+@pytest.fixture
+def photo(tmp_path) -> str:
+    """A large, lightly compressed JPEG with EXIF data, as cameras write them."""
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    image = noise(64, 48).resize((1600, 1200))
+    return save(image, tmp_path / "photo.jpg", quality=95, exif=exif)
+
+
+@pytest.fixture
+def compressed(tmp_path) -> str:
+    """A small JPEG compressed harder than the re-encoding would."""
+    return save(noise(200, 150), tmp_path / "compressed.jpg", quality=10)
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """Count the images actually processed."""
+    calls = []
+    encode = images.encode_image
+    monkeypatch.setattr(images, "encode_image", lambda path, options: calls.append(path) or encode(path, options))
+    return calls
+
+
+def test_photos_are_downscaled_and_stripped_of_metadata(photo):
+    (blob,) = prepare_images([photo], ImageOptions(max_dimension=800))
+
+    assert blob["mime_type"] == "image/webp"
+    assert len(blob["data"]) < os.path.getsize(photo)
+
+    with Image.open(io.BytesIO(blob["data"])) as image:
+        assert image.size == (800, 600)
+        assert not image.getexif()
+
+
+def test_an_image_that_would_grow_is_sent_as_it_is(compressed):
+    with open(compressed, "rb") as file:
+        original = file.read()
+
+    assert encode_image(compressed, ImageOptions()) is None
+    assert prepare_images([compressed]) == [{"mime_type": "image/jpeg", "data": original}]
+
+
+def test_processed_and_kept_images_are_cached(photo, compressed, encodes):
+    first = prepare_images([photo, compressed])
+    assert encodes == [photo, compressed]
+
+    # the original is remembered as the smaller one, too
+    assert prepare_images([photo, compressed]) == first
+    assert encodes == [photo, compressed]
+
+    # other options are processed anew
+    prepare_images([photo], ImageOptions(format="jpeg"))
+    assert encodes == [photo, compressed, photo]
+
+
+def test_undecodable_images_are_sent_as_they_are(tmp_path):
+    path = tmp_path / "broken.png"
+    path.write_bytes(b"not really a png")
+
+    assert prepare_images([str(path)]) == [{"mime_type": "image/png", "data": b"not really a png"}]
+
+
+def test_original_format_skips_processing(photo, encodes):
+    (blob,) = prepare_images([photo], ImageOptions(format="original"))
+
+    assert blob["mime_type"] == "image/jpeg"
+    assert len(blob["data"]) == os.path.getsize(photo)
+    assert encodes == []
+
+
+def test_transparency_is_flattened_for_jpeg(tmp_path):
+    image = noise(300, 300).convert("RGBA")
+    image.putalpha(128)
+    path = save(image, tmp_path / "overlay.png")
+
+    (blob,) = prepare_images([path], ImageOptions(format="jpeg"))
+
+    assert blob["mime_type"] == "image/jpeg"
+    with Image.open(io.BytesIO(blob["data"])) as decoded:
+        assert decoded.mode == "RGB"
+
+
+def test_unsupported_types_are_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("text")
+
+    with pytest.raises(ValueError, match="Unsupported image type"):
+        prepare_images([str(path)])
+
+
+def test_the_image_cache_evicts_least_recently_used_first(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=10)
+    cache.put("old", b"12345")
+    cache.put("new", b"12345")
+    os.utime(tmp_path / "old", (1, 1))
+    os.utime(tmp_path / "new", (2, 2))
+    assert cache.get("old") == b"12345"  # now the most recently used
+
+    cache.put("newest", b"12345")
+    cache.prune()
+
+    assert cache.get("new") is None
+    assert cache.get("old") == cache.get("newest") == b"12345"
@@ -0,0 +1,127 @@
+import itertools
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from llm_cli.cli import cli
+from llm_cli.utils.ingest import SNIFF_BATCH, discover_files, mime_type_from_header, sniff_mime_type, walk_files
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+PDF = b"%PDF-1.7\n"
+
+
+def write(path, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("header, mime_type", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+    (PNG, "image/png"),
+    (PDF, "application/pdf"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"RIFF\x00\x00\x00\x00WAVEfmt ", "audio/wav"),
+    (b"FORM\x00\x00\x00\x00AIFF", "audio/aiff"),
+    (b"\x00\x00\x00\x18ftypheic", "image/heic"),
+    (b"\x00\x00\x00\x18ftypmp42", "video/mp4"),
+    (b"\x00\x00\x00\x14ftypqt  ", "video/mov"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x82\x84webm", "video/webm"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x82\x88matroska", None),
+    (b"ID3\x04\x00", "audio/mp3"),
+    (b"\xff\xfb\x90\x00", "audio/mp3"),
+    (b"\xff\xf1\x50\x80", "audio/aac"),
+    (b"OggS\x00", "audio/ogg"),
+    (b"fLaC\x00", "audio/flac"),
+    (b"\x00\x00\x00\x18ftypzzzz", None),
+    (b"plain text", None),
+    (b"", None),
+])
+def test_types_are_detected_from_the_first_bytes(header, mime_type):
+    assert mime_type_from_header(header) == mime_type
+
+
+def test_sniffing_ignores_the_file_name(tmp_path):
+    assert sniff_mime_type(write(tmp_path / "scan", PNG)) == "image/png"
+    assert sniff_mime_type(write(tmp_path / "photo.jpg", b"not an image")) is None
+    assert sniff_mime_type(str(tmp_path / "missing.png")) is None
+
+
+def test_walks_skip_hidden_entries_and_symlinked_directories(tmp_path):
+    write(tmp_path / "a" / "one.txt", b"")
+    write(tmp_path / "a" / "b" / "two.txt", b"")
+    write(tmp_path / ".git" / "config", b"")
+    write(tmp_path / "a" / ".hidden", b"")
+    write(tmp_path / "three.txt", b"")
+    os.symlink(tmp_path / "a", tmp_path / "link")
+
+    found = sorted(os.path.relpath(path, tmp_path) for path in walk_files(str(tmp_path)))
+    assert found == [os.path.join("a", "b", "two.txt"), os.path.join("a", "one.txt"), "three.txt"]
+
+
+def test_directories_yield_only_supported_files_by_content(tmp_path):
+    scan = write(tmp_path / "docs" / "scan", PNG)
+    report = write(tmp_path / "docs" / "nested" / "report.bin", PDF)
+    write(tmp_path / "docs" / "fake.jpg", b"not an image")
+    write(tmp_path / "docs" / "notes.txt", b"text")
+
+    assert sorted(discover_files([str(tmp_path / "docs")])) == sorted([(scan, "image/png"), (report, "application/pdf")])
+
+
+def test_named_files_are_always_yielded(tmp_path):
+    notes = write(tmp_path / "notes.txt", b"text")
+    scan = write(tmp_path / "scan", PNG)
+
+    # the upload guesses the type of an unrecognized file from its name
+    assert list(discover_files([notes, scan])) == [(notes, None), (scan, "image/png")]
+
+
+def test_glob_patterns_match_files_and_directories(tmp_path):
+    first = write(tmp_path / "in" / "first.png", PNG)
+    second = write(tmp_path / "in" / "deeper" / "second.pdf", PDF)
+    write(tmp_path / "in" / "skipped.txt", b"text")
+
+    assert list(discover_files([str(tmp_path / "in" / "*.png")])) == [(first, "image/png")]
+    assert sorted(discover_files([str(tmp_path / "in" / "**" / "*.pdf")])) == [(second, "application/pdf")]
+    assert sorted(discover_files([str(tmp_path / "i?")])) == sorted([(first, "image/png"), (second, "application/pdf")])
+
+
+def test_missing_targets_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="File not found"):
+        list(discover_files([str(tmp_path / "missing.png")]))
+
+
+def test_many_files_are_yielded_in_discovery_order(tmp_path):
+    paths = [write(tmp_path / "many" / f"{index:04}.png", PNG) for index in range(SNIFF_BATCH * 5 + 3)]
+
+    assert [path for path, _ in discover_files(paths, max_workers=2)] == paths
+
+
+def test_files_are_yielded_before_the_scan_ends(tmp_path):
+    scan = write(tmp_path / "scan", PNG)
+
+    # endless targets: only a lazy scan yields anything at all
+    assert next(discover_files(itertools.repeat(scan))) == (scan, "image/png")
+
+
+def test_prompt_uploads_the_supported_files_of_a_directory(fake_server, tmp_path):
+    write(tmp_path / "docs" / "scan", PNG)
+    write(tmp_path / "docs" / "report.pdf", PDF)
+    write(tmp_path / "docs" / "notes.txt", b"text")
+
+    result = CliRunner().invoke(cli, ["prompt", "-f", str(tmp_path / "docs"), "-t", "describe these"])
+    assert result.exit_code == 0, result.output
+
+    uploads = sorted(file["displayName"] for file in fake_server.files.values())
+    assert uploads == ["report.pdf", "scan"]
+
+
+def test_prompt_reports_directories_without_supported_files(fake_server, tmp_path):
+    write(tmp_path / "docs" / "notes.txt", b"text")
+
+    result = CliRunner().invoke(cli, ["prompt", "-f", str(tmp_path / "docs"), "-t", "describe these"])
+
+    assert "No supported files found in" in result.output
+    assert not fake_server.files
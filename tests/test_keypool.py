@@ -0,0 +1,209 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import google.generativeai as genai
+import pytest
+from google.api_core import exceptions
+from google.generativeai import protos
+
+from llm_cli.api.gemini import Gemini, bind_client, build_model, client_options
+from llm_cli.utils import keypool
+from llm_cli.utils.keypool import EJECT_SECONDS, MAX_EJECT_SECONDS, KeyPool, resolve_api_keys
+
+import fake_gemini
+
+MODEL = "gemini-1.5-flash"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(keypool, "time", SimpleNamespace(time=lambda: clock.now, monotonic=time.monotonic))
+    return clock
+
+
+@pytest.fixture
+def request_keys(monkeypatch):
+    """Record the API keys of the requests the fake server answers."""
+    keys = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def recording(handler):
+        keys.append(handler.headers.get("x-goog-api-key"))
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", recording)
+    return keys
+
+
+def quota_error() -> exceptions.ResourceExhausted:
+    return exceptions.ResourceExhausted("Resource has been exhausted (e.g. check quota).")
+
+
+def test_keys_are_read_primary_first_without_duplicates(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "key-aaaa")
+    monkeypatch.setenv("GOOGLE_API_KEYS", " key-bbbb, key-aaaa,,key-cccc ")
+    assert resolve_api_keys() == ["key-aaaa", "key-bbbb", "key-cccc"]
+
+    monkeypatch.delenv("GOOGLE_API_KEY")
+    monkeypatch.delenv("GOOGLE_API_KEYS")
+    with pytest.raises(ValueError, match="API key not found"):
+        resolve_api_keys()
+
+
+def test_requests_spread_over_the_keys_by_requests_in_flight():
+    pool = KeyPool(["key-aaaa", "key-bbbb", "key-cccc"], MODEL)
+    first, second, third = pool.members
+
+    assert pool.choose() is first  # ties go to the earlier key
+    first.in_flight = 2
+    second.in_flight = 1
+    assert pool.choose() is third
+    assert pool.choose(exclude=(third,)) is second
+
+
+def test_the_key_with_rate_limit_headroom_is_chosen(monkeypatch):
+    monkeypatch.setenv("LLM_CLI_RATE_LIMITS", "aaaa@gemini-1.5-flash=6/, bbbb@gemini-1.5-flash=60/")
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    limited, roomy = pool.members
+
+    assert pool.choose() is limited  # both have a full bucket
+    limited.limiter.acquire()
+    assert pool.choose() is roomy  # the first would wait ten seconds
+
+
+def test_ejected_keys_are_skipped_until_they_come_back(clock):
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    first, second = pool.members
+
+    assert pool.eject(first) == EJECT_SECONDS
+    assert pool.choose() is second
+    # ejections are shared with every pool, in any process
+    assert KeyPool(["key-aaaa", "key-bbbb"], MODEL).choose().api_key == "key-bbbb"
+
+    clock.now += EJECT_SECONDS + 1
+    assert pool.choose() is first
+
+
+def test_ejections_double_while_a_key_keeps_failing(clock):
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    first, second = pool.members
+
+    assert [pool.eject(first) for _ in range(6)] == [60, 120, 240, 480, MAX_EJECT_SECONDS, MAX_EJECT_SECONDS]
+
+    # with every key out, the one that comes back first is tried
+    pool.eject(second)
+    assert pool.choose() is second
+
+
+def test_a_quota_error_moves_the_request_to_the_next_key(clock):
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    sent = []
+
+    def send(member):
+        sent.append(member.label)
+        if member.api_key == "key-aaaa":
+            raise quota_error()
+        return "answer"
+
+    assert pool.run(send) == "answer"
+    assert sent == ["...aaaa", "...bbbb"]
+    assert pool.summary() == {"...aaaa": 1, "...bbbb": 1}
+    assert all(member.in_flight == 0 for member in pool.members)
+
+    assert pool.run(send) == "answer"
+    assert sent[2:] == ["...bbbb"]  # the first key is still ejected
+
+
+def test_a_key_that_answers_again_loses_its_strikes(clock):
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    first, _ = pool.members
+    pool.eject(first)
+    clock.now += EJECT_SECONDS + 1
+
+    pool.run(lambda member: member.label)
+
+    assert pool.eject(first) == EJECT_SECONDS
+
+
+def test_other_errors_and_exhausted_pools_raise():
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+
+    with pytest.raises(exceptions.ServiceUnavailable):
+        pool.run(lambda member: (_ for _ in ()).throw(exceptions.ServiceUnavailable("busy")))
+    assert pool.choose() is pool.primary  # not ejected
+
+    sent = []
+
+    def exhausted(member):
+        sent.append(member)
+        raise quota_error()
+
+    with pytest.raises(exceptions.ResourceExhausted):
+        pool.run(exhausted)
+    assert sent == pool.members
+
+
+def test_pinned_requests_stay_on_the_primary_key():
+    pool = KeyPool(["key-aaaa", "key-bbbb"], MODEL)
+    pool.primary.in_flight = 5
+    sent = []
+
+    def exhausted(member):
+        sent.append(member)
+        raise quota_error()
+
+    with pytest.raises(exceptions.ResourceExhausted):
+        pool.run(exhausted, pinned=True)
+    assert sent == [pool.primary]
+
+
+def test_the_client_sends_with_keys_that_have_quota_left(fake_server, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "key-aaaa")
+    monkeypatch.setenv("GOOGLE_API_KEYS", "key-bbbb")
+    fake_server.config.exhausted_keys = ("key-aaaa",)
+    gemini = Gemini()
+
+    for index in range(3):
+        assert gemini.generate_content_from_text_prompt(f"prompt {index}").text.startswith("lorem ipsum")
+
+    assert gemini.key_pool.summary() == {"...aaaa": 1, "...bbbb": 3}  # ejected after its first quota error
+    assert gemini.usage.retries == 0
+
+
+def test_bound_models_send_through_their_own_clients():
+    sent = []
+    answer = protos.GenerateContentResponse(
+        candidates=[protos.Candidate(content=protos.Content(parts=[protos.Part(text="bound")]))])
+
+    class Client:
+        def generate_content(self, request, **options):
+            sent.append(request.model)
+            return answer
+
+    class AsyncClient:
+        async def generate_content(self, request, **options):
+            sent.append("async")
+            return answer
+
+    model = build_model("be brief", model_name=MODEL)
+    bound = bind_client(model, Client(), AsyncClient())
+
+    assert bound.generate_content("hi").text == "bound"
+    assert asyncio.run(bound.generate_content_async("hi")).text == "bound"
+    assert sent == [f"models/{MODEL}", "async"]
+    assert model._client is None and model._async_client is None  # the original model is left alone
+    assert bound._system_instruction == model._system_instruction
+
+
+def test_requests_keep_their_key_when_the_sdk_is_configured_again(fake_server, monkeypatch, request_keys):
+    monkeypatch.setenv("GOOGLE_API_KEY", "key-aaaa")
+    gemini = Gemini()
+
+    # as another client in the process would, with a key of its own
+    genai.configure(api_key="key-zzzz", **client_options())
+    gemini.generate_content_from_text_prompt("prompt")
+    gemini.count_tokens(["prompt"])
+
+    assert request_keys == ["key-aaaa", "key-aaaa"]
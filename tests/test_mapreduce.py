@@ -0,0 +1,182 @@
+import io
+
+import pytest
+from click.testing import CliRunner
+
+from llm_cli.cli import cli
+from llm_cli.utils.helpers import estimate_tokens
+from llm_cli.utils.mapreduce import (
+    NOTHING_RELEVANT, Checkpoint, group_partials, iter_chunks, map_prompt, plan_map_reduce, run_map_reduce)
+
+import fake_gemini
+
+
+def chunks(text: str, max_tokens: int = 10) -> list[str]:
+    return list(iter_chunks(io.StringIO(text), max_tokens))
+
+
+class EndlessLog:
+    """A stream that never ends, recording the sizes read from it."""
+
+    def __init__(self):
+        self.reads = []
+
+    def read(self, size: int) -> str:
+        self.reads.append(size)
+        return ("GET /index.html 200\n" * (size // 20 + 1))[:size]
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """Record the paths of the requests the fake server answers."""
+    paths = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def recording(handler):
+        paths.append(handler.path.split("?")[0].rsplit(":", 1)[-1])
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", recording)
+    return paths
+
+
+def test_chunks_end_at_a_late_paragraph_break():
+    text = "a" * 25 + "\n\n" + "b" * 25 + "\n\n"
+    assert chunks(text) == ["a" * 25 + "\n\n", "b" * 25 + "\n\n"]
+
+
+def test_chunks_end_at_a_line_break_when_the_paragraph_break_is_early():
+    text = "a" * 5 + "\n\n" + "b" * 20 + "\n" + "c" * 30
+    assert chunks(text) == ["a" * 5 + "\n\n" + "b" * 20 + "\n", "c" * 30]
+
+
+def test_lines_longer_than_a_chunk_are_cut_by_length():
+    assert chunks("x" * 100) == ["x" * 40, "x" * 40, "x" * 20]
+
+
+def test_blank_input_yields_no_chunks():
+    assert chunks("") == []
+    assert chunks("\n \n\n") == []
+
+
+def test_chunks_are_cut_while_the_input_is_read():
+    log = EndlessLog()
+
+    first = next(iter_chunks(log, max_tokens=10))
+
+    assert len(first) <= 40 and first.endswith("\n")
+    assert log.reads == [40, 40]
+
+
+def test_partials_are_grouped_to_fit_a_reduce_prompt():
+    partials = [f"{index}" * 36 for index in range(5)]  # 10 tokens each
+
+    # the lone last partial joins the group before it
+    assert group_partials(partials, max_tokens=25) == [partials[:2], partials[2:]]
+    assert group_partials(partials, max_tokens=1000) == [partials]
+
+
+def test_groups_hold_at_least_two_partials_however_large():
+    partials = ["x" * 400] * 4
+
+    assert group_partials(partials, max_tokens=10) == [partials[:2], partials[2:]]
+    assert group_partials(partials[:3], max_tokens=10) == [partials[:3]]
+
+
+def test_an_input_that_fits_one_chunk_is_sent_as_it_is():
+    prompts = []
+    result = run_map_reduce(lambda prompt: prompts.append(prompt) or "answer", io.StringIO("short log"), "count errors")
+
+    assert result == ("answer", 1, 0, 1)
+    assert prompts == ["count errors\n\nshort log"]
+
+
+def test_chunk_results_are_combined_in_input_order():
+    text = "".join(f"{word * 300}\n\n" for word in "abc")
+    reduced = []
+
+    def generate(prompt: str) -> str:
+        if "Partial result" in prompt:
+            reduced.append(prompt)
+            return "combined"
+        chunk = prompt.rsplit("\n", 3)[-3]
+        return NOTHING_RELEVANT if chunk.startswith("b") else chunk[0]
+
+    result = run_map_reduce(generate, io.StringIO(text), "find letters", max_tokens=100, concurrency=3)
+
+    assert result == ("combined", 3, 1, 4)
+    assert "Partial result 1 ---\na\n\n--- Partial result 2 ---\nc" in reduced[0]
+    assert NOTHING_RELEVANT not in reduced[0]
+
+
+def test_a_rerun_only_sends_what_failed():
+    text = "".join(f"{word * 300}\n\n" for word in "abc")
+    sent = []
+
+    def flaky(prompt: str) -> str:
+        sent.append(prompt)
+        if "b" * 300 in prompt:
+            raise RuntimeError("unavailable")
+        return "partial"
+
+    with pytest.raises(ValueError, match="1 of 3 map prompt"):
+        run_map_reduce(flaky, io.StringIO(text), "summarize", max_tokens=100)
+    assert len(sent) == 3
+
+    sent.clear()
+    result = run_map_reduce(lambda prompt: sent.append(prompt) or "partial", io.StringIO(text), "summarize", max_tokens=100)
+
+    assert result.requests == 2  # the failed chunk and the reduction
+    assert "b" * 300 in sent[0]
+
+    # other settings are checkpointed apart
+    assert run_map_reduce(lambda prompt: "other", io.StringIO(text), "summarize", max_tokens=100, scope="pro").requests == 4
+
+
+def test_expired_checkpoints_are_dropped():
+    Checkpoint().put(Checkpoint.key("", "prompt"), "text")
+
+    assert Checkpoint().get(Checkpoint.key("", "prompt")) == "text"
+    assert Checkpoint(ttl=-1).get(Checkpoint.key("", "prompt")) is None
+
+
+def test_plans_estimate_the_chunk_prompts_without_sending():
+    text = "".join(f"{word * 300}\n\n" for word in "abc")
+
+    plan = plan_map_reduce(io.StringIO(text), "summarize", max_tokens=100)
+
+    assert plan.chunks == 3
+    assert plan.tokens == sum(estimate_tokens(map_prompt("summarize", chunk)) for chunk in chunks(text, 100))
+    assert plan_map_reduce(io.StringIO("short log"), "summarize") == (1, estimate_tokens("summarize\n\nshort log"))
+
+    with pytest.raises(ValueError, match="The input is empty"):
+        plan_map_reduce(io.StringIO(""), "summarize")
+
+
+def test_a_map_reduce_dry_run_sends_nothing(fake_server, requests, tmp_path):
+    log = tmp_path / "server.log"
+    log.write_text("".join(f"{word * 300}\n\n" for word in "abc"))
+
+    result = CliRunner().invoke(
+        cli, ["prompt", "-t", "summarize", "--map-reduce", "--input", str(log), "--chunk-tokens", "100", "--dry-run"])
+
+    assert result.exit_code == 0, result.output
+    assert "Map-reduce: 3 chunk(s), about" in result.output
+    assert "Nothing was sent." in result.output
+    assert requests == []
+
+
+def test_the_cli_reports_chunks_levels_and_requests(fake_server, requests, tmp_path):
+    log = tmp_path / "server.log"
+    log.write_text("".join(f"{word * 300}\n\n" for word in "abc"))
+    args = ["prompt", "-t", "summarize", "--map-reduce", "--input", str(log), "--chunk-tokens", "100"]
+
+    result = CliRunner().invoke(cli, args)
+
+    assert "Map-reduce: 3 chunk(s), 1 reduce level(s), 4 request(s) sent." in result.stderr
+    assert "lorem ipsum" in result.output
+    assert requests.count("generateContent") == 4
+
+    # checkpointed: a rerun sends nothing
+    assert "0 request(s) sent." in CliRunner().invoke(cli, args).stderr
+    assert requests.count("generateContent") == 4
@@ -0,0 +1,108 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.utils import ratelimit
+from llm_cli.utils.ratelimit import NON_TEXT_PART_TOKENS, RateLimiter, RateLimits, estimate_input_tokens, limits_for
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the rate limiter; sleeping records the wait and moves the clock on."""
+    clock = SimpleNamespace(now=1_000_000.0, sleeps=[])
+
+    def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(time=lambda: clock.now, sleep=sleep))
+    return clock
+
+
+def test_limits_are_read_from_defaults_model_and_key_entries(monkeypatch):
+    assert limits_for("key-abcd", "gemini-1.5-flash") is None
+
+    monkeypatch.setenv("LLM_CLI_RPM", "15")
+    monkeypatch.setenv("LLM_CLI_TPM", "1000000")
+    monkeypatch.setenv("LLM_CLI_RATE_LIMITS", "gemini-1.5-pro=2/32000; abcd@gemini-1.5-pro=/64000, wxyz@gemini-1.5-flash=2000/")
+
+    assert limits_for("key-abcd", "models/gemini-1.5-flash") == RateLimits(15, 1000000)
+    assert limits_for("key-1234", "gemini-1.5-pro") == RateLimits(2, 32000)
+    # a key specific entry wins over the model entry, empty limits are unlimited
+    assert limits_for("key-abcd", "gemini-1.5-pro") == RateLimits(None, 64000)
+    assert limits_for("key-wxyz", "gemini-1.5-flash") == RateLimits(2000, None)
+
+
+def test_a_burst_goes_at_once_and_later_requests_are_paced_in_order(clock):
+    limiter = RateLimiter("key", "gemini-1.5-flash", RateLimits(rpm=60))
+
+    waits = [limiter.reserve() for _ in range(13)]
+    assert waits[:10] == [0] * 10  # ten seconds worth of quota
+    assert waits[10:] == pytest.approx([1, 2, 3])
+
+    clock.now += 60
+    assert limiter.reserve() == 0
+
+
+def test_processes_share_the_buckets_of_a_key_and_model(clock):
+    first = RateLimiter("key", "gemini-1.5-flash", RateLimits(rpm=6))
+    second = RateLimiter("key", "models/gemini-1.5-flash", RateLimits(rpm=6))
+    other_key = RateLimiter("other", "gemini-1.5-flash", RateLimits(rpm=6))
+
+    assert first.reserve() == 0
+    assert second.reserve() == pytest.approx(10)
+    assert other_key.reserve() == 0
+
+
+def test_a_wait_past_the_deadline_raises_without_reserving(clock):
+    limiter = RateLimiter("key", "gemini-1.5-flash", RateLimits(rpm=6))
+    limiter.reserve()
+
+    with pytest.raises(TimeoutError, match="would delay the request by 10.0s"):
+        limiter.reserve(max_wait=5)
+    assert limiter.reserve(max_wait=15) == pytest.approx(10)
+
+
+def test_tokens_are_limited_and_settled_with_the_real_count(clock):
+    limiter = RateLimiter("key", "gemini-1.5-flash", RateLimits(tpm=6000))  # a 1000 token burst
+
+    assert limiter.reserve(800) == 0
+    limiter.settle(800, 200)  # the request was smaller than estimated
+    assert limiter.reserve(800) == 0
+    assert limiter.reserve(800) == pytest.approx(8)  # the bucket is empty, refilling at 100 a second
+
+    # larger than a burst: sent once the bucket is full, its debt delays the next request
+    clock.now += 60
+    assert limiter.reserve(5000) == 0
+    assert limiter.reserve(100) == pytest.approx(41)
+
+
+def test_peek_reports_wait_and_headroom_without_reserving(clock):
+    limiter = RateLimiter("key", "gemini-1.5-flash", RateLimits(rpm=60))
+    assert limiter.peek() == (0, 1.0)
+
+    for _ in range(5):
+        limiter.reserve()
+    assert limiter.peek() == (0, pytest.approx(0.5))
+    assert limiter.peek() == (0, pytest.approx(0.5))
+
+
+def test_input_tokens_are_estimated_from_text_and_attachments():
+    assert estimate_input_tokens([]) == 0
+    assert estimate_input_tokens([object()]) == NON_TEXT_PART_TOKENS
+    assert estimate_input_tokens(["a" * 400, object()]) > NON_TEXT_PART_TOKENS
+
+
+def test_requests_wait_for_their_turn_under_the_configured_limit(fake_server, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(time=time.time, sleep=sleeps.append))
+    monkeypatch.setenv("LLM_CLI_RPM", "6")
+
+    gemini = Gemini()
+    gemini.generate_content_from_text_prompt("first")
+    assert sleeps == []
+
+    gemini.generate_content_from_text_prompt("second")
+    assert sleeps == [pytest.approx(10, abs=0.5)]
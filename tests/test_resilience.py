@@ -0,0 +1,175 @@
+import asyncio
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_cli.utils.resilience import Resilience, ResiliencePolicy, is_retryable, retry_after
+from llm_cli.utils.tokens import UsageTracker
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+
+def failing(times: int, error: Exception, result="answer"):
+    """A request that fails `times` times before answering, recording its calls."""
+    calls = []
+
+    def request(timeout):
+        calls.append(timeout)
+        if len(calls) <= times:
+            raise error
+        return result
+
+    request.calls = calls
+    return request
+
+
+def test_transient_failures_are_retried_and_counted(no_backoff):
+    stats = UsageTracker()
+    request = failing(2, Unavailable("unavailable"))
+
+    assert Resilience(ResiliencePolicy(max_retries=3), stats).call(request) == "answer"
+    assert len(request.calls) == 3
+    assert stats.retries == 2
+
+
+def test_permanent_failures_and_exhausted_retries_are_raised(no_backoff):
+    request = failing(1, BadRequest("bad request"))
+    with pytest.raises(BadRequest):
+        Resilience(ResiliencePolicy()).call(request)
+    assert len(request.calls) == 1
+
+    request = failing(5, Unavailable("unavailable"))
+    with pytest.raises(Unavailable):
+        Resilience(ResiliencePolicy(max_retries=2)).call(request)
+    assert len(request.calls) == 3
+
+
+def test_a_deadline_bounds_the_request_with_its_retries():
+    request = failing(10, Unavailable("unavailable"))
+
+    started = time.monotonic()
+    with pytest.raises((TimeoutError, Unavailable)):
+        Resilience(ResiliencePolicy(max_retries=10, initial_backoff=0.05, deadline=0.3)).call(request)
+
+    assert time.monotonic() - started < 1
+    assert all(timeout is not None and timeout <= 0.3 for timeout in request.calls)
+
+
+def test_backoff_waits_at_least_as_long_as_the_server_asks():
+    policy = ResiliencePolicy(initial_backoff=0.01, max_backoff=0.01)
+    assert 5 <= policy.backoff(1, hint=5) <= 5.5
+    assert policy.backoff(3) <= 0.01
+
+
+def test_retry_hints_and_retryable_errors_are_recognized():
+    assert retry_after(SimpleNamespace(response=SimpleNamespace(headers={"Retry-After": "7"}))) == 7
+    assert retry_after(SimpleNamespace(details=[{"retryDelay": "12.5s"}])) == 12.5
+    assert retry_after(Exception("Quota exceeded, please retry in 3.2s.")) == 3.2
+    assert retry_after(Exception("no hint")) is None
+
+    assert is_retryable(Unavailable()) and is_retryable(ConnectionResetError())
+    assert not is_retryable(BadRequest()) and not is_retryable(ValueError())
+
+
+def test_a_slow_request_is_hedged_and_the_losing_stream_cancelled():
+    stats, cancelled = UsageTracker(), []
+    release, calls = threading.Event(), []
+
+    def request(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            release.wait(5)
+            return "primary"
+        return "backup"
+
+    resilience = Resilience(ResiliencePolicy(hedge=True, hedge_after=0.05), stats)
+    assert resilience.call(request, cancel=cancelled.append) == "backup"
+
+    release.set()
+    for _ in range(100):
+        if cancelled:
+            break
+        time.sleep(0.01)
+
+    assert cancelled == ["primary"]
+    assert (stats.hedges, stats.hedge_wins) == (1, 1)
+
+
+def test_coroutines_are_retried_and_hedged_on_the_event_loop():
+    stats, calls, cancelled = UsageTracker(), [], []
+
+    async def request(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            raise Unavailable("unavailable")
+        if len(calls) == 2:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append("primary")
+                raise
+        return "backup"
+
+    policy = ResiliencePolicy(initial_backoff=0.01, hedge=True, hedge_after=0.05)
+    started = time.monotonic()
+
+    assert asyncio.run(Resilience(policy, stats).call_async(request)) == "backup"
+    assert time.monotonic() - started < 1
+    assert cancelled == ["primary"]  # stopped outright, not left to run
+    assert (stats.retries, stats.hedges, stats.hedge_wins) == (1, 1, 1)
+
+
+def test_a_fast_request_is_not_hedged():
+    stats = UsageTracker()
+    resilience = Resilience(ResiliencePolicy(hedge=True, hedge_after=1), stats)
+
+    assert resilience.call(lambda timeout: "answer") == "answer"
+    assert stats.hedges == 0
+
+
+def test_the_hedge_delay_adapts_to_recent_latencies():
+    resilience = Resilience(ResiliencePolicy(hedge_after=5, hedge_min_samples=4))
+    assert resilience.hedge_delay() == 5
+
+    resilience.latencies.extend([0.1, 0.2, 0.3, 0.4])
+    assert resilience.hedge_delay() == 0.4
+
+
+def test_a_losing_hedge_still_in_flight_does_not_delay_exit():
+    script = textwrap.dedent(
+        """
+        import itertools, time
+        from llm_cli.utils.resilience import Resilience, ResiliencePolicy
+
+        calls = itertools.count()
+
+        def request(timeout):
+            if next(calls) == 0:
+                time.sleep(30)  # the primary never answers in time
+            return "answer"
+
+        print(Resilience(ResiliencePolicy(hedge=True, hedge_after=0.1)).call(request), flush=True)
+        """
+    )
+
+    started = time.monotonic()
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=20)
+
+    assert result.stdout.strip() == "answer", result.stderr
+    assert time.monotonic() - started < 5
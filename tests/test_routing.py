@@ -0,0 +1,183 @@
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+
+from llm_cli.cli import cli
+from llm_cli.utils import routing
+from llm_cli.utils.routing import Route, RoutingLog, response_outcome, route
+
+import fake_gemini
+
+FAST, DEFAULT = "gemini-1.5-flash-8b", "gemini-1.5-flash"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(routing, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Record the models of the generateContent requests the fake server answers."""
+    models = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def recording(handler):
+        path = handler.path.split("?")[0]
+        if path.endswith(":generateContent"):
+            models.append(path.rsplit("/", 1)[-1].split(":")[0])
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", recording)
+    return models
+
+
+def response(text="answer", finish_reason="STOP", block_reason=0, candidates=True):
+    parts = [SimpleNamespace(text=text)]
+    return SimpleNamespace(
+        prompt_feedback=SimpleNamespace(block_reason=block_reason),
+        candidates=[SimpleNamespace(
+            finish_reason=SimpleNamespace(name=finish_reason), content=SimpleNamespace(parts=parts))] if candidates else [])
+
+
+@pytest.mark.parametrize("arguments, expected", [
+    (dict(command="prompt", requested="gemini-1.5-pro", input_tokens=10), Route("gemini-1.5-pro", "requested")),
+    (dict(command="prompt", requested="gemini-1.5-pro", cascade=True), Route("gemini-1.5-pro", "requested")),
+    (dict(command="prompt", requested=FAST, cascade=True), Route(FAST, "requested", (DEFAULT,))),
+    (dict(command="prompt", input_tokens=5000, cascade=True), Route(FAST, "cascade", (DEFAULT,))),
+    (dict(command="completion", input_tokens=5000), Route(FAST, "command")),
+    (dict(command="prompt", input_tokens=10, attachments=1), Route(DEFAULT, "attachments")),
+    (dict(command="prompt", input_tokens=200), Route(FAST, "short prompt")),
+    (dict(command="prompt", input_tokens=201), Route(DEFAULT, "long prompt")),
+    (dict(command="chat"), Route(DEFAULT, "unsized")),
+])
+def test_requests_are_routed_by_command_size_and_attachments(arguments, expected):
+    assert route(**arguments) == expected
+
+
+def test_models_and_thresholds_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("LLM_CLI_MODEL", "gemini-1.5-pro")
+    monkeypatch.setenv("LLM_CLI_FAST_MODEL", "gemini-1.5-flash")
+    monkeypatch.setenv("LLM_CLI_SHORT_PROMPT_TOKENS", "50")
+
+    assert route("prompt", input_tokens=50) == Route("gemini-1.5-flash", "short prompt")
+    assert route("prompt", input_tokens=51) == Route("gemini-1.5-pro", "long prompt")
+    assert route("prompt", cascade=True).escalation == ("gemini-1.5-pro",)
+
+    # a fast model that is the default model has nothing to escalate to
+    monkeypatch.setenv("LLM_CLI_FAST_MODEL", "gemini-1.5-pro")
+    assert route("prompt", cascade=True) == Route("gemini-1.5-pro", "cascade")
+
+
+@pytest.mark.parametrize("answer, streamed, outcome", [
+    (response(), False, "ok"),
+    (response(block_reason=1), False, "blocked"),
+    (response(block_reason=1), True, "blocked"),
+    (response(finish_reason="SAFETY"), False, "blocked"),
+    (response(finish_reason="SAFETY"), True, "ok"),  # only the first chunk has arrived
+    (response(text=""), False, "empty"),
+    (response(candidates=False), False, "empty"),
+])
+def test_responses_are_ok_empty_or_blocked(answer, streamed, outcome):
+    assert response_outcome(answer, streamed=streamed) == outcome
+
+
+def test_decisions_are_counted_per_command_model_and_reason():
+    log = RoutingLog()
+    for _ in range(2):
+        log.decision("prompt", Route(FAST, "short prompt"), input_tokens=10)
+    log.decision("prompt", Route(DEFAULT, "attachments"), input_tokens=10, attachments=1)
+    log.decision("chat", Route(DEFAULT, "unsized"))
+
+    assert log.decisions() == [
+        ("chat", DEFAULT, "unsized", 1),
+        ("prompt", FAST, "short prompt", 2),
+        ("prompt", DEFAULT, "attachments", 1),
+    ]
+
+
+def test_request_stats_group_latencies_and_outcomes(clock):
+    log = RoutingLog()
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        log.request("prompt", f"models/{FAST}", latency, "ok", prompt_tokens=10)
+    log.request("prompt", FAST, 1.0, "escalated", prompt_tokens=30)
+    log.request("prompt", FAST, 0.05, "ok", stream=True)
+
+    (streamed, unstreamed) = sorted(log.stats(), key=lambda row: row["stream"], reverse=True)
+
+    assert streamed == {
+        "command": "prompt", "model": FAST, "stream": True, "requests": 1, "p50": 0.05, "p95": 0.05,
+        "mean_prompt_tokens": 0, "outcomes": {"ok": 1}}
+    assert unstreamed["requests"] == 5
+    assert unstreamed["p50"] == pytest.approx(0.3) and unstreamed["p95"] == pytest.approx(1.0)
+    assert unstreamed["mean_prompt_tokens"] == 14
+    assert unstreamed["outcomes"] == {"ok": 4, "escalated": 1}
+
+
+def test_reports_cover_a_recent_period_and_old_entries_expire(clock):
+    RoutingLog().request("prompt", FAST, 0.1, "ok")
+    RoutingLog().decision("prompt", Route(FAST, "short prompt"))
+
+    clock.now += 3600
+    log = RoutingLog(ttl=7200)
+    log.request("prompt", DEFAULT, 0.2, "ok")
+
+    assert [row["model"] for row in log.stats(since=clock.now - 60)] == [DEFAULT]
+    assert len(log.stats()) == 2
+
+    clock.now += 3601
+    assert [row["model"] for row in RoutingLog(ttl=7200).stats()] == [DEFAULT]
+    assert RoutingLog(ttl=7200).decisions() == []
+
+    log.clear()
+    assert log.stats() == [] and log.decisions() == []
+
+
+def test_expired_entries_are_deleted_on_a_write_at_most_once_a_day(clock):
+    def stored(log):
+        return log.db.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+
+    RoutingLog().request("prompt", FAST, 0.1, "ok")
+    clock.now += 7201
+
+    log = RoutingLog(ttl=7200)
+    assert log.db.total_changes == 0  # opening the log writes nothing
+    assert stored(log) == 1 and log.stats() == []
+
+    log.request("prompt", FAST, 0.2, "ok")
+    assert stored(log) == 2 and len(log.stats()) == 1  # expired, not deleted yet
+
+    clock.now += routing.EXPIRY_INTERVAL_SECONDS
+    RoutingLog(ttl=7200).decision("prompt", Route(FAST, "short prompt"))
+    assert stored(log) == 0
+
+
+def test_prompts_go_to_the_routed_model_and_are_reported(fake_server, generations):
+    runner = CliRunner()
+    runner.invoke(cli, ["prompt", "-t", "hi"])
+    runner.invoke(cli, ["prompt", "-t", "word " * 1000])
+    runner.invoke(cli, ["prompt", "-t", "hi", "--model", "gemini-1.5-pro"])
+
+    assert generations == [FAST, DEFAULT, "gemini-1.5-pro"]
+
+    report = runner.invoke(cli, ["routing"])
+    assert "Default model: gemini-1.5-flash, fast model: gemini-1.5-flash-8b, short prompts: up to 200 tokens" in report.output
+    assert "prompt\tgemini-1.5-flash-8b\t1 request(s)" in report.output
+    assert "prompt\tgemini-1.5-pro\trequested\t1" in report.output
+
+    runner.invoke(cli, ["routing", "--clear"])
+    assert "No requests recorded yet." in runner.invoke(cli, ["routing"]).output
+
+
+def test_blocked_answers_of_the_fast_model_escalate_with_a_cascade(fake_server, generations):
+    fake_server.config.blocked_models = (FAST,)
+
+    result = CliRunner().invoke(cli, ["prompt", "-t", "word " * 1000, "--cascade"])
+
+    assert "lorem ipsum" in result.output
+    assert generations == [FAST, DEFAULT]
+    outcomes = {row["model"]: row["outcomes"] for row in RoutingLog().stats()}
+    assert outcomes == {FAST: {"escalated": 1}, DEFAULT: {"ok": 1}}
@@ -0,0 +1,133 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from click.testing import CliRunner
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.cli import cli
+from llm_cli.utils import semantic_cache
+from llm_cli.utils.semantic_cache import GeminiEmbedder, SemanticCache, cache_scope
+
+import fake_gemini
+
+
+class TableEmbedder:
+    """Fixed embeddings, to place prompts at known similarities."""
+    name = "table"
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed(self, texts):
+        return np.asarray([self.vectors[text] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """Record the paths of the model requests the fake server answers."""
+    paths = []
+    do_post = fake_gemini._Handler.do_POST
+
+    def recording(handler):
+        paths.append(handler.path.split("?")[0].rsplit(":", 1)[-1])
+        do_post(handler)
+
+    monkeypatch.setattr(fake_gemini._Handler, "do_POST", recording)
+    return paths
+
+
+def test_prompts_are_embedded_by_the_embedding_api(fake_server, requests):
+    cache = SemanticCache()
+    Gemini()  # configures the API endpoint
+
+    assert isinstance(cache.embedder, GeminiEmbedder)
+    assert cache.embed("Explain HTTP caching").shape == (256,)
+    assert requests == ["batchEmbedContents"]
+
+
+@pytest.mark.parametrize("answered, asked", [
+    ("Explain HTTP caching", "explain  http caching?"),
+    ("What is a monad", "WHAT IS A MONAD!"),
+])
+def test_variants_of_a_prompt_are_served_the_earlier_answer(fake_server, requests, answered, asked):
+    gemini = Gemini(semantic_cache=SemanticCache())
+
+    first = gemini.generate_content_from_text_prompt(answered)
+    second = gemini.generate_content_from_text_prompt(asked)
+
+    assert second.text == first.text
+    assert requests.count("generateContent") == 1
+
+
+@pytest.mark.parametrize("answered, asked", [
+    ("sort the numbers ascending", "sort the numbers descending"),
+    ("is rm -rf safe", "is rm -rf not safe"),
+    ("what happened on 2024-05-01", "what happened on 2024-05-02"),
+])
+def test_prompts_that_differ_in_one_word_are_sent(fake_server, requests, answered, asked):
+    gemini = Gemini(semantic_cache=SemanticCache())
+
+    gemini.generate_content_from_text_prompt(answered)
+    gemini.generate_content_from_text_prompt(asked)
+
+    assert requests.count("generateContent") == 2
+
+
+def test_only_matches_above_the_threshold_are_hits(tmp_path):
+    embedder = TableEmbedder({"stored": [1, 0], "close": [0.95, 0.31], "far": [0.8, 0.6]})
+    cache = SemanticCache(embedder, threshold=0.9, path=str(tmp_path))
+    cache.put(cache.embed("stored"), "scope", {"text": "answer"})
+
+    assert cache.get(cache.embed("close"), "scope") == {"text": "answer"}
+    assert cache.get(cache.embed("far"), "scope") is None
+    assert cache.get(cache.embed("stored"), "other scope") is None
+
+
+def test_answers_are_only_shared_under_the_same_model_and_settings():
+    scope = cache_scope("models/gemini-1.5-flash", "be brief", {"temperature": 0})
+
+    assert scope == cache_scope("models/gemini-1.5-flash", "be brief", {"temperature": 0})
+    assert scope != cache_scope("models/gemini-1.5-pro", "be brief", {"temperature": 0})
+    assert scope != cache_scope("models/gemini-1.5-flash", "be thorough", {"temperature": 0})
+    assert scope != cache_scope("models/gemini-1.5-flash", "be brief", {"temperature": 1})
+
+
+def test_entries_expire_and_the_least_recently_used_is_evicted(tmp_path, monkeypatch):
+    vectors = {name: np.eye(4)[index] for index, name in enumerate(["a", "b", "c", "d"])}
+    cache = SemanticCache(TableEmbedder(vectors), max_entries=2, ttl=60, path=str(tmp_path))
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+
+    cache.put(cache.embed("a"), "scope", {"text": "a"})
+    now[0] += 1
+    cache.put(cache.embed("b"), "scope", {"text": "b"})
+    now[0] += 1
+    assert cache.get(cache.embed("a"), "scope") == {"text": "a"}  # now the most recently used
+
+    now[0] += 1
+    cache.put(cache.embed("c"), "scope", {"text": "c"})
+    assert cache.get(cache.embed("b"), "scope") is None
+    assert cache.get(cache.embed("a"), "scope") == {"text": "a"}
+    assert cache.stats()["entries"] == 2
+
+    now[0] += 61
+    assert cache.get(cache.embed("c"), "scope") is None
+
+
+def test_a_slot_rewritten_by_another_process_is_not_served(tmp_path):
+    cache = SemanticCache(TableEmbedder({"a": [1, 0], "b": [0, 1]}), path=str(tmp_path))
+    cache.put(cache.embed("a"), "scope", {"text": "a"})
+
+    cache.vectors[0] = cache.embed("a") * 0.99  # a vector written, its row not yet committed
+    assert cache.get(cache.embed("a"), "scope") is None
+
+
+def test_the_cli_threshold_option_is_applied(fake_server, requests):
+    runner = CliRunner()
+    runner.invoke(cli, ["prompt", "-t", "sort the list ascending", "--semantic-cache"])
+    strict = runner.invoke(cli, ["prompt", "-t", "sort the list descending", "--semantic-cache"])
+    loose = runner.invoke(cli, ["prompt", "-t", "sort the list in ascending order", "--semantic-cache", "--similarity", "0.5"])
+
+    assert strict.exit_code == loose.exit_code == 0
+    assert requests.count("generateContent") == 2
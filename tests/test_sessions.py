@@ -0,0 +1,99 @@
+from google.generativeai import protos
+from google.generativeai.types import GenerateContentResponse
+
+from llm_cli.utils.helpers import estimate_tokens
+from llm_cli.utils.sessions import ChatSessionStore, HistoryPolicy
+
+
+def _session(tmp_path, turns: int):
+    store = ChatSessionStore(str(tmp_path))
+    session = store.create()
+    for index in range(turns):
+        session.add_turn(f"question {index}", f"answer {index}")
+    return store, session
+
+
+def _sent_turns(history: list[dict]) -> list[str]:
+    return [entry["parts"][0] for entry in history if entry["role"] == "user"]
+
+
+def test_history_keeps_the_most_recent_turns(tmp_path):
+    _, session = _session(tmp_path, 5)
+
+    assert _sent_turns(session.history(HistoryPolicy(max_turns=2))) == ["question 3", "question 4"]
+    # the latest turn is always sent, whatever its size
+    assert _sent_turns(session.history(HistoryPolicy(max_turns=None, max_tokens=1))) == ["question 4"]
+
+
+def test_summarized_history_stays_within_the_bound_on_every_turn(tmp_path):
+    store, session = _session(tmp_path, 0)
+    policy = HistoryPolicy(max_turns=3, summarize=True)
+    transcripts = []
+
+    for index in range(20):
+        history = session.history(policy, lambda transcript: transcripts.append(transcript) or f"summary {len(transcripts)}")
+        verbatim = _sent_turns(history)[1 if session.summary else 0:]
+        # the window always holds the latest turns as they are, and nothing else
+        assert verbatim == [f"question {turn}" for turn in range(max(index - 3, 0), index)]
+        assert session.summarized_turns == max(index - 3, 0)
+        session.add_turn(f"question {index}", f"answer {index}")
+
+    # each turn summarized once, as it leaves the window, building on the earlier summary
+    assert len(transcripts) == 16
+    summarized = [int(line.split()[-1]) for transcript in transcripts
+                  for line in transcript.splitlines() if line.startswith("User: question")]
+    assert summarized == list(range(session.summarized_turns)) == list(range(16))
+    assert "Earlier summary:\nsummary 1" in transcripts[1]
+
+    # a resumed session picks up the summary
+    resumed = store.load(session.id)
+    assert resumed.summary == session.summary and resumed.summarized_turns == session.summarized_turns
+    assert resumed.history(policy, lambda transcript: "next") == session.history(policy, lambda transcript: "next")
+
+
+def test_summarized_history_stays_within_the_token_bound(tmp_path):
+    _, session = _session(tmp_path, 0)
+    policy = HistoryPolicy(max_turns=None, max_tokens=60, summarize=True)
+
+    for index in range(15):
+        history = session.history(policy, lambda transcript: "short summary")
+        turns = [entry["parts"][0] for entry in history[2 if session.summary else 0:]]
+        assert len(turns) <= 2 or sum(estimate_tokens(text) for text in turns) <= policy.max_tokens
+        assert len(turns) // 2 == policy.window(session.turns)  # every turn of the window, as it is
+        session.add_turn(f"question {index} " + "word " * 10, f"answer {index} " + "word " * 10)
+
+
+def test_session_log_replay_ignores_a_torn_last_line(tmp_path):
+    store, session = _session(tmp_path, 2)
+    with open(session.path, "a", encoding="utf-8") as file:
+        file.write('{"role": "user", "text": "question 2", "ts": 1}\n{"role": "mod')
+
+    assert store.load(session.id).turns == [("question 0", "answer 0"), ("question 1", "answer 1")]
+    assert store.list()[0]["turns"] == 3
+
+
+def _reply(text: str) -> protos.GenerateContentResponse:
+    return protos.GenerateContentResponse(
+        candidates=[protos.Candidate(content=protos.Content(role="model", parts=[protos.Part(text=text)]))])
+
+
+def test_chat_drops_a_reply_interrupted_with_ctrl_c(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from llm_cli.api.gemini import Gemini
+    from llm_cli.cli import cli
+
+    def interrupted():
+        yield _reply("the start of a ")
+        raise KeyboardInterrupt
+
+    replies = iter([interrupted(), iter([_reply("a full reply")])])
+    monkeypatch.setattr(
+        Gemini, "_send_chat",
+        lambda self, model, message, **kwargs: GenerateContentResponse.from_iterator(next(replies)))
+
+    result = CliRunner().invoke(cli, ["chat", "--start"], input="first\nsecond\n")
+
+    assert "Reply interrupted, this turn was not saved." in result.output
+    assert "a full reply" in result.output
+    session_id = ChatSessionStore().list()[0]["id"]
+    assert ChatSessionStore().load(session_id).turns == [("second", "a full reply")]
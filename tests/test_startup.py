@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+from llm_cli.utils import startup
+
+# Modules `--help` and `--version` must not pay for.
+DEFERRED_MODULES = (
+    "sqlite3", "subprocess", "socket", "dotenv",
+    "llm_cli.utils.batch", "llm_cli.utils.cache", "llm_cli.utils.completions", "llm_cli.utils.daemon",
+    "llm_cli.utils.images", "llm_cli.utils.mapreduce", "llm_cli.utils.routing", "llm_cli.utils.sessions",
+)
+
+
+@pytest.mark.timing
+def test_cli_import_stays_within_budget():
+    measured = startup.measure_import_time("llm_cli.cli", runs=3)
+
+    assert startup.check_startup_budget("llm_cli.cli", startup.DEFAULT_BUDGET_MS, measured) == []
+
+
+def test_cli_import_defers_stores_and_the_sdk():
+    code = f"import sys, llm_cli.cli; print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ""
+    assert startup.check_startup_budget("llm_cli.cli", budget_ms=float("inf")) == []
+
+
+def test_the_printed_time_is_the_checked_time(monkeypatch, capsys):
+    runs = iter([(247.9, {}), (77.3, {}), (120.0, {}), (240.0, {}), (90.0, {})])
+    monkeypatch.setattr(startup, "_import_once", lambda module: next(runs))
+    monkeypatch.setattr(sys, "argv", ["startup", "--budget-ms", "100"])
+
+    assert startup.main() == 0
+    assert "77.3 ms" in capsys.readouterr().out
+
+
+def test_an_import_over_budget_fails(monkeypatch, capsys):
+    monkeypatch.setattr(startup, "_import_once", lambda module: (180.0, {"grpc": 5000}))
+    monkeypatch.setattr(sys, "argv", ["startup", "--runs", "2"])
+
+    assert startup.main() == 1
+    errors = capsys.readouterr().err
+    assert "180.0 ms, over the 150 ms budget" in errors
+    assert "eagerly loads grpc" in errors
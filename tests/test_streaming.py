@@ -0,0 +1,61 @@
+import time
+
+from google.generativeai import protos
+from google.generativeai.types import GenerateContentResponse
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.utils.processor import iter_gemini_response, process_gemini_response
+
+
+def _chunk(text: str) -> protos.GenerateContentResponse:
+    return protos.GenerateContentResponse(
+        candidates=[protos.Candidate(content=protos.Content(role="model", parts=[protos.Part(text=text)]))])
+
+
+def _delayed_stream(texts, delay):
+    for index, text in enumerate(texts):
+        if index:
+            time.sleep(delay)
+        yield _chunk(text)
+
+
+def _first_chunk_seconds(chunks) -> tuple[str, float]:
+    started = time.monotonic()
+    return next(chunks), time.monotonic() - started
+
+
+def test_chunks_are_yielded_without_waiting_for_the_next_one():
+    response = GenerateContentResponse.from_iterator(_delayed_stream(["one ", "two ", "three"], delay=0.3))
+    chunks = iter_gemini_response(response)
+
+    first, elapsed = _first_chunk_seconds(chunks)
+
+    assert first == "one "
+    assert elapsed < 0.2
+    assert list(chunks) == ["two ", "three"]
+    # the response is complete afterwards, as after the SDK's own iteration
+    assert response.text == "one two three"
+
+
+def test_streamed_prompt_reaches_the_terminal_at_the_first_chunk(fake_server, monkeypatch):
+    gemini = Gemini()
+    monkeypatch.setattr(
+        type(gemini.model), "generate_content",
+        lambda model, contents, stream=False, **kwargs: GenerateContentResponse.from_iterator(
+            _delayed_stream(["one ", "two"], delay=0.3)))
+
+    started = time.monotonic()
+    response = gemini.generate_content_from_text_prompt("hi", stream_response=True)
+    chunks = iter_gemini_response(response)
+    first = next(chunks)
+
+    assert first == "one "
+    assert time.monotonic() - started < 0.2
+    assert list(chunks) == ["two"]
+    assert response.text == "one two"
+
+
+def test_non_streamed_response_yields_its_text_once(fake_server):
+    response = Gemini().generate_content_from_text_prompt("hi")
+
+    assert list(iter_gemini_response(response)) == [process_gemini_response(response)]
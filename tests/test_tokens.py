@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import google.generativeai as genai
+import pytest
+from click.testing import CliRunner
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.cli import cli
+from llm_cli.utils.tokens import UsageTracker
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Record the contents of every countTokens request."""
+    calls = []
+    count_tokens = genai.GenerativeModel.count_tokens
+    monkeypatch.setattr(genai.GenerativeModel, "count_tokens",
+                        lambda model, contents, **kwargs: calls.append(contents) or count_tokens(model, contents, **kwargs))
+    return calls
+
+
+def test_token_counts_are_memoized_across_clients(fake_server, counted):
+    assert Gemini().count_tokens(["one two three", "four"]) == [3, 1]
+    assert Gemini().count_tokens(["four", "one two three"]) == [1, 3]
+    assert len(counted) == 2
+
+
+def test_prompts_over_the_input_budget_are_rejected_before_sending(fake_server, counted, monkeypatch):
+    gemini = Gemini(max_input_tokens=5)
+    monkeypatch.setattr(type(gemini.model), "generate_content",
+                        lambda *args, **kwargs: pytest.fail("an over-budget prompt was sent"))
+
+    with pytest.raises(ValueError, match="The prompt is 6 tokens, over the input budget of 5 tokens."):
+        gemini.generate_content_from_text_prompt("one two three four five six")
+
+
+def test_system_instruction_counts_towards_the_budget(fake_server, counted):
+    gemini = Gemini(system_instruction="answer in two words", max_input_tokens=6)
+
+    with pytest.raises(ValueError, match="The prompt is 7 tokens"):
+        gemini.generate_content_from_text_prompt("one two three")
+    assert Gemini(system_instruction="answer", max_input_tokens=6).generate_content_from_text_prompt("one two three").text
+
+
+def test_prompts_are_truncated_to_fit_the_budget(fake_server, counted, monkeypatch):
+    sent = []
+    gemini = Gemini(max_input_tokens=10, truncate_input=True)
+    generate_content = type(gemini.model).generate_content
+    monkeypatch.setattr(type(gemini.model), "generate_content",
+                        lambda model, contents, **kwargs: sent.append(contents) or generate_content(model, contents, **kwargs))
+
+    gemini.generate_content_from_text_prompt(" ".join(f"word{index}" for index in range(40)))
+
+    assert sent[0][0].startswith("word0 word1")
+    assert len(sent[0][0].split()) <= 10
+
+
+def test_dry_run_reports_tokens_without_generating(fake_server, counted, monkeypatch):
+    monkeypatch.setattr(genai.GenerativeModel, "generate_content",
+                        lambda *args, **kwargs: pytest.fail("a dry run sent the prompt"))
+
+    result = CliRunner().invoke(cli, ["prompt", "--dry-run", "--model", "gemini-1.5-flash", "-t", "one two three"])
+
+    assert "text\t - \t3" in result.output
+    assert "Total input tokens: 3" in result.output
+
+
+def test_usage_tracker_totals_and_cost():
+    usage = UsageTracker()
+    usage.start()
+    for prompt, output in ((1000, 200), (3000, 800)):
+        usage.record(SimpleNamespace(usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt, candidates_token_count=output, cached_content_token_count=0)))
+    usage.record(SimpleNamespace())  # a response without usage metadata is not counted
+    usage.add(retries=2)
+
+    summary = usage.summary("models/gemini-1.5-flash")
+
+    assert (summary["requests"], summary["prompt_tokens"], summary["output_tokens"]) == (2, 4000, 1000)
+    assert summary["total_tokens"] == 5000 and summary["retries"] == 2
+    assert summary["cost_usd"] == pytest.approx((4000 * 0.075 + 1000 * 0.30) / 1_000_000)
+    assert usage.summary("unknown-model")["cost_usd"] == 0
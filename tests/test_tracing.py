@@ -0,0 +1,123 @@
+import json
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from llm_cli.api.gemini import Gemini
+from llm_cli.cli import cli
+from llm_cli.utils import tracing
+
+
+@pytest.fixture(autouse=True)
+def tracing_off(monkeypatch):
+    """Every test starts with tracing off, as a fresh process does."""
+    monkeypatch.setattr(tracing, "_tracer", None)
+
+
+def test_spans_are_a_shared_no_op_while_tracing_is_off():
+    assert not tracing.enabled()
+    assert tracing.span("generate") is tracing.span("upload", file="a.txt")
+    assert tracing.request_id() is None
+
+    with tracing.span("generate") as span:
+        span.set(prompt_tokens=3)
+    tracing.record("startup", 0, 1)
+    tracing.finish("unused.json", metrics=True)
+    assert tracing._tracer is None
+
+
+def test_spans_record_their_arguments_errors_and_thread():
+    tracer = tracing.enable()
+
+    with tracing.span("generate", request_id="abc") as span:
+        span.set(prompt_tokens=8, output_tokens=12)
+    with pytest.raises(KeyError):
+        with tracing.span("cache_lookup"):
+            raise KeyError("missing")
+
+    worker = threading.Thread(target=lambda: tracing.span("upload").end())
+    worker.start()
+    worker.join()
+
+    (generate, lookup, upload) = tracer.events
+    assert generate[0] == "generate" and generate[4] == {"request_id": "abc", "prompt_tokens": 8, "output_tokens": 12}
+    assert lookup[0] == "cache_lookup" and lookup[4] == {"error": "KeyError"}
+    assert upload[3] == worker.ident != generate[3]
+    assert all(start <= end for _, start, end, _, _ in tracer.events)
+
+
+def test_streamed_tokens_are_attached_once_the_stream_ends(fake_server):
+    tracer = tracing.enable()
+    response = Gemini().generate_content_from_text_prompt("hello there", stream_response=True)
+    assert tracer.events[-1][0] == "generate"
+    assert "stream" not in [event[0] for event in tracer.events]
+
+    list(response)
+    generate, stream = tracer.events[-2:]
+    assert stream[0] == "stream"
+    assert stream[4]["request_id"] == generate[4]["request_id"]
+    assert stream[4]["output_tokens"] == fake_server.config.chunks * 4
+
+
+def test_a_span_ended_twice_is_recorded_once():
+    tracer = tracing.enable()
+    span = tracing.span("stream")
+    span.end()
+    span.end()
+
+    assert len(tracer.events) == 1
+
+
+def test_chrome_trace_events_are_in_microseconds_from_the_origin():
+    tracer = tracing.Tracer(origin_ns=1_000_000)
+    tracer.record("startup", 1_000_000, 3_500_000, thread=7, args={"model": "m"})
+
+    (event,) = tracer.chrome_trace()["traceEvents"]
+    assert event["name"] == "startup" and event["ph"] == "X" and event["tid"] == 7
+    assert event["ts"] == 0 and event["dur"] == 2500
+    assert event["args"] == {"model": "m"}
+
+
+def test_the_summary_totals_phases_and_tokens():
+    tracer = tracing.Tracer(origin_ns=0)
+    tracer.record("generate", 0, 2_000_000, args={"prompt_tokens": 8, "output_tokens": 4})
+    tracer.record("generate", 0, 1_000_000, args={"prompt_tokens": 2, "output_tokens": 6})
+    tracer.record("load_env", 0, 500_000)
+
+    summary = tracer.summary()
+    assert summary.startswith("lcli ")
+    assert "generate 2x 3.0 ms" in summary
+    assert "load_env 0.5 ms" in summary
+    assert summary.endswith("tokens 10 in / 10 out")
+
+
+def test_prompt_writes_a_chrome_trace_with_request_ids_and_tokens(fake_server, tmp_path):
+    trace_path = tmp_path / "trace.json"
+    result = CliRunner().invoke(cli, ["--trace", str(trace_path), "prompt", "-t", "hello there"])
+    assert result.exit_code == 0, result.output
+
+    events = {event["name"]: event for event in json.loads(trace_path.read_text())["traceEvents"]}
+    assert {"startup", "load_env", "import_sdk", "configure", "preprocess_input", "generate", "process_response"} <= set(events)
+
+    generate = events["generate"]
+    assert len(generate["args"]["request_id"]) == 16
+    assert generate["args"]["model"].startswith("models/gemini-")
+    assert generate["args"]["prompt_tokens"] == 8
+    assert generate["args"]["output_tokens"] == fake_server.config.chunks * 4
+
+
+def test_metrics_print_a_one_line_summary_to_stderr(fake_server, monkeypatch):
+    monkeypatch.setenv("LLM_CLI_METRICS", "1")
+    result = CliRunner().invoke(cli, ["prompt", "-t", "hello there"])
+    assert result.exit_code == 0, result.output
+
+    (summary,) = [line for line in result.stderr.splitlines() if line.startswith("lcli ")]
+    assert "generate" in summary
+    assert f"tokens 8 in / {fake_server.config.chunks * 4} out" in summary
+
+
+def test_commands_without_a_trace_flag_or_metrics_leave_tracing_off(fake_server):
+    result = CliRunner().invoke(cli, ["prompt", "-t", "hello there"])
+    assert result.exit_code == 0, result.output
+    assert not tracing.enabled()